@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
 from app.models.user import User as DBUser, UserCreate, UserResponse, Token
@@ -13,22 +15,25 @@ router = APIRouter()
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(DBUser).filter(DBUser.username == user.username).first()
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(DBUser).where(DBUser.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_password = get_password_hash(user.password)
+    # Hashing is deliberately slow; it runs off the event loop
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
     db_user = DBUser(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(DBUser).filter(DBUser.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(DBUser).where(DBUser.username == form_data.username))
+    if not user or not await run_in_threadpool(
+        verify_password, form_data.password, user.hashed_password
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.change_log import ChangeFeedResponse
+from app.models.organization import Organization as DBOrganization
+from app.models.project import Project as DBProject
+from app.models.user import Principal
+from app.core.db import get_db
+from app.core.security import get_current_user
+from app.core.permissions import is_org_member
+from app.services.revisions import (
+    changes_since,
+    get_organization_revision,
+    get_project_revision,
+)
+
+router = APIRouter()
+
+
+@router.get("/projects/{project_id}/changes", response_model=ChangeFeedResponse)
+async def get_project_changes(
+    project_id: str,
+    since: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    project = await db.get(DBProject, project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if not await db.run_sync(is_org_member, current_user.id, project.organization_id):
+        raise HTTPException(
+            status_code=403, detail="Not authorized to view this project's changes"
+        )
+
+    # Read before the changes, so a change made meanwhile is not skipped by
+    # a client that continues from this revision
+    revision = await db.run_sync(get_project_revision, project_id)
+    changes, has_more = await db.run_sync(
+        changes_since, since, limit, project_id=project_id
+    )
+    return ChangeFeedResponse(revision=revision, changes=changes, has_more=has_more)
+
+
+@router.get("/organizations/{org_id}/changes", response_model=ChangeFeedResponse)
+async def get_organization_changes(
+    org_id: str,
+    since: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    organization = await db.get(DBOrganization, org_id)
+    if organization is None:
+        raise HTTPException(status_code=404, detail="Organization not found")
+
+    if not await db.run_sync(is_org_member, current_user.id, org_id):
+        raise HTTPException(
+            status_code=403, detail="Not authorized to view this organization's changes"
+        )
+
+    revision = await db.run_sync(get_organization_revision, org_id)
+    changes, has_more = await db.run_sync(
+        changes_since, since, limit, organization_id=org_id
+    )
+    return ChangeFeedResponse(revision=revision, changes=changes, has_more=has_more)
@@ -0,0 +1,121 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.chat import ChatMessageResponse, ChatSessionResponse
+from app.models.project import Project as DBProject
+from app.models.user import Principal
+from app.models.requests.question import AskQuestionRequest
+from app.core.db import get_db
+from app.core.security import get_current_user
+from app.core.permissions import is_org_member
+from app.services.chat import ChatSession, chat_sessions, next_turn, reply, stream_reply
+from app.services.llm_service import AiService, LlmException, get_llm_service, use_project
+from app.services.streaming import stream_tokens
+
+router = APIRouter()
+
+
+async def get_visible_project(
+    db: AsyncSession, project_id: str, user_id: str
+) -> DBProject:
+    project = await db.get(DBProject, project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if not await db.run_sync(is_org_member, user_id, project.organization_id):
+        raise HTTPException(
+            status_code=403, detail="Not authorized to ask questions about this project"
+        )
+    return project
+
+
+def get_own_session(session_id: str, user_id: str) -> ChatSession:
+    # Sessions are private to the user who started them
+    session = chat_sessions.get(session_id)
+    if session is None or session.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return session
+
+
+def session_response(session: ChatSession) -> ChatSessionResponse:
+    return ChatSessionResponse(
+        id=session.id,
+        project_id=session.project_id,
+        created_at=session.created_at,
+        context_tokens=session.context_tokens,
+        history_tokens=session.history_tokens,
+        summary=session.summary,
+        turns=session.turns,
+    )
+
+
+@router.post(
+    "/projects/{project_id}/chat",
+    response_model=ChatSessionResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def start_chat(
+    project_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    llm_service: AiService = Depends(get_llm_service),
+):
+    project = await get_visible_project(db, project_id, current_user.id)
+    session = await db.run_sync(
+        chat_sessions.start, project, current_user.id, llm_service.model_id
+    )
+    return session_response(session)
+
+
+@router.get("/chat/{session_id}", response_model=ChatSessionResponse)
+def get_chat(
+    session_id: str,
+    current_user: Principal = Depends(get_current_user),
+):
+    return session_response(get_own_session(session_id, current_user.id))
+
+
+@router.delete("/chat/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+def end_chat(
+    session_id: str,
+    current_user: Principal = Depends(get_current_user),
+):
+    chat_sessions.end(get_own_session(session_id, current_user.id).id)
+
+
+@router.post("/chat/{session_id}/messages", response_model=ChatMessageResponse)
+async def send_chat_message(
+    session_id: str,
+    request: AskQuestionRequest,
+    response: Response,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    llm_service: AiService = Depends(get_llm_service),
+):
+    session = get_own_session(session_id, current_user.id)
+    # Membership is checked again: it may have ended since the session began
+    project = await get_visible_project(db, session.project_id, current_user.id)
+    await use_project(llm_service, db, project.id)
+    if not session.claim():
+        raise HTTPException(
+            status_code=409, detail="The chat session is still answering a message"
+        )
+
+    try:
+        turn = await next_turn(session, db, project, llm_service, request.question)
+    except LlmException as e:
+        raise HTTPException(status_code=500, detail=e.message)
+
+    if stream:
+        return stream_tokens(
+            stream_reply(session, turn, llm_service),
+            {"X-Context-Tokens": str(session.context_tokens)},
+        )
+
+    response.headers["X-Context-Tokens"] = str(session.context_tokens)
+    try:
+        answer = await reply(session, turn, llm_service)
+    except LlmException as e:
+        raise HTTPException(status_code=500, detail=e.message)
+    return ChatMessageResponse(answer=answer, history_tokens=session.history_tokens)
@@ -1,54 +1,64 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from app.models.comment import Comment as DBComment, CommentCreate, CommentResponse
 from app.models.task import Task as DBTask
-from app.models.user import User as DBUser
+from app.models.user import Principal
+from app.models.loading import COMMENT_LIST
 from app.core.db import get_db
 from app.core.security import get_current_user
+from app.core.permissions import is_project_member
 
 router = APIRouter()
 
 
 @router.post("/projects/{project_id}/tasks/{task_id}/comments", response_model=CommentResponse)
-def create_comment(
+async def create_comment(
     project_id: str,
     task_id: str,
     comment: CommentCreate,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    task = db.query(DBTask).filter(DBTask.id == task_id, DBTask.project_id == project_id).first()
+    task = await db.scalar(select(DBTask).where(DBTask.id == task_id, DBTask.project_id == project_id))
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    if current_user not in task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, task.project_id):
         raise HTTPException(status_code=403, detail="Not authorized to comment on this task")
 
     db_comment = DBComment(**comment.model_dump(), task_id=task_id, user_id=current_user.id)
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    await db.commit()
+    await db.refresh(db_comment)
     db_comment.username = current_user.username
     return CommentResponse.model_validate(db_comment)
 
 
 @router.get("/projects/{project_id}/tasks/{task_id}/comments", response_model=List[CommentResponse])
-def get_comments(
+async def get_comments(
     project_id: str,
     task_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    task = db.query(DBTask).filter(DBTask.id == task_id, DBTask.project_id == project_id).first()
+    task = await db.scalar(select(DBTask).where(DBTask.id == task_id, DBTask.project_id == project_id))
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    if current_user not in task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, task.project_id):
         raise HTTPException(status_code=403, detail="Not authorized to view comments for this task")
 
-    comments = db.query(DBComment).filter(DBComment.task_id == task_id).order_by(DBComment.created_at).all()
+    comments = (
+        await db.scalars(
+            select(DBComment)
+            .options(*COMMENT_LIST)
+            .where(DBComment.task_id == task_id)
+            .order_by(DBComment.created_at)
+        )
+    ).all()
     for comment in comments:
         if comment.user:
             comment.username = comment.user.username
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.job import Job as DBJob, JobResponse
+from app.models.user import Principal
+from app.core.db import get_db
+from app.core.security import get_current_user
+from app.core.permissions import is_project_member
+from app.services.jobs import job_events_stream
+from app.services.streaming import sse_response
+
+router = APIRouter()
+
+
+async def get_visible_job(db: AsyncSession, job_id: str, user_id: str) -> DBJob:
+    job = await db.get(DBJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.user_id != user_id and not await db.run_sync(
+        is_project_member, user_id, job.project_id
+    ):
+        raise HTTPException(status_code=403, detail="Not authorized to view this job")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    return JobResponse.model_validate(await get_visible_job(db, job_id, current_user.id))
+
+
+@router.get("/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await get_visible_job(db, job_id, current_user.id)
+    return sse_response(job_events_stream(job_id))
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import Principal
+from app.core.db import get_db
+from app.core.security import get_current_user, principal_cache
+from app.core.permissions import membership_cache
+from app.services.llm_cache import llm_response_cache
+from app.services.retrieval import vector_indexes
+from app.services.context_builder import context_stats
+from app.services.jobs import job_workers
+from app.services.llm_resilience import backend_health
+from app.services.llm_scheduler import llm_schedulers
+from app.services.single_flight import llm_single_flight
+from app.services.chat import chat_sessions
+from app.services.summaries import summary_refresher
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics(
+    db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)
+):
+    return {
+        "principal_cache": principal_cache.stats(),
+        "membership_cache": membership_cache.stats(),
+        "llm_cache": llm_response_cache.stats(),
+        "vector_indexes": vector_indexes.stats(),
+        "context_builder": context_stats.stats(),
+        "jobs": await db.run_sync(job_workers.stats),
+        "chat_sessions": chat_sessions.stats(),
+        "summaries": summary_refresher.stats(),
+        "llm_single_flight": llm_single_flight.stats(),
+        "llm_backends": {
+            backend: health.stats() for backend, health in backend_health.items()
+        },
+        "llm_schedulers": {
+            backend: scheduler.stats() for backend, scheduler in llm_schedulers.items()
+        },
+    }
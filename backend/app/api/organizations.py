@@ -1,119 +1,131 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from app.models.organization import Organization as DBOrganization, OrganizationCreate, OrganizationResponse
-from app.models.user import User as DBUser
+from app.models.user import Principal, User as DBUser, user_organization_association
+from app.models.loading import ORGANIZATION_LIST
 from app.core.db import get_db
 from app.core.security import get_current_user
+from app.core.permissions import is_org_member, invalidate_membership
+from app.services import deletion
 
 router = APIRouter()
 
 @router.post("/organizations", response_model=OrganizationResponse, status_code=status.HTTP_201_CREATED)
-def create_organization(
+async def create_organization(
     organization: OrganizationCreate,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    db_organization = DBOrganization(**organization.model_dump())
+    # The creating user is the organization's first member
+    creator = await db.get(DBUser, current_user.id)
+    db_organization = DBOrganization(**organization.model_dump(), members=[creator])
     db.add(db_organization)
-    db.commit()
-    db.refresh(db_organization)
-    
-    # Add the creating user as a member of the organization
-    db_organization.members.append(current_user)
-    db.add(db_organization)
-    db.commit()
-    db.refresh(db_organization)
+    await db.commit()
 
     return db_organization
 
 @router.get("/organizations", response_model=List[OrganizationResponse])
-def get_all_organizations(
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+async def get_all_organizations(
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     # Only return organizations the current user is a member of
-    return current_user.organizations
+    return (
+        await db.scalars(
+            select(DBOrganization)
+            .options(*ORGANIZATION_LIST)
+            .join(
+                user_organization_association,
+                user_organization_association.c.organization_id == DBOrganization.id,
+            )
+            .where(user_organization_association.c.user_id == current_user.id)
+        )
+    ).all()
+
+async def get_member_organization(db: AsyncSession, org_id: str, user_id: str) -> DBOrganization:
+    organization = await db.scalar(
+        select(DBOrganization).options(*ORGANIZATION_LIST).where(DBOrganization.id == org_id)
+    )
+    if not organization or not await db.run_sync(is_org_member, user_id, organization.id):
+        raise HTTPException(status_code=404, detail="Organization not found or user not a member")
+    return organization
 
 @router.get("/organizations/{org_id}", response_model=OrganizationResponse)
-def get_organization(
+async def get_organization(
     org_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    organization = db.query(DBOrganization).filter(DBOrganization.id == org_id).first()
-    if not organization or current_user not in organization.members:
-        raise HTTPException(status_code=404, detail="Organization not found or user not a member")
-    return organization
+    return await get_member_organization(db, org_id, current_user.id)
 
 @router.post("/organizations/{org_id}/add_user/{user_id}", response_model=OrganizationResponse)
-def add_user_to_organization(
+async def add_user_to_organization(
     org_id: str,
     user_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    organization = db.query(DBOrganization).filter(DBOrganization.id == org_id).first()
-    if not organization or current_user not in organization.members:
-        raise HTTPException(status_code=404, detail="Organization not found or user not a member")
+    organization = await get_member_organization(db, org_id, current_user.id)
     
-    user_to_add = db.query(DBUser).filter(DBUser.id == user_id).first()
+    user_to_add = await db.get(DBUser, user_id)
     if not user_to_add:
         raise HTTPException(status_code=404, detail="User to add not found")
     
-    if user_to_add in organization.members:
+    if await db.run_sync(is_org_member, user_to_add.id, organization.id):
         raise HTTPException(status_code=400, detail="User is already a member of this organization")
     
     organization.members.append(user_to_add)
     db.add(organization)
-    db.commit()
-    db.refresh(organization)
+    await db.commit()
+    invalidate_membership(user_to_add.id, organization.id)
+    await db.refresh(organization, ["members"])
     return organization
 
 @router.delete("/organizations/{org_id}/remove_user/{user_id}", response_model=OrganizationResponse)
-def remove_user_from_organization(
+async def remove_user_from_organization(
     org_id: str,
     user_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    organization = db.query(DBOrganization).filter(DBOrganization.id == org_id).first()
-    if not organization or current_user not in organization.members:
-        raise HTTPException(status_code=404, detail="Organization not found or user not a member")
+    organization = await get_member_organization(db, org_id, current_user.id)
     
     # Only the creator can remove users for now
     if organization.members[0].id != current_user.id:
         raise HTTPException(status_code=403, detail="Only the creator can remove users from this organization")
 
-    user_to_remove = db.query(DBUser).filter(DBUser.id == user_id).first()
+    user_to_remove = await db.get(DBUser, user_id)
     if not user_to_remove:
         raise HTTPException(status_code=404, detail="User to remove not found")
     
-    if user_to_remove not in organization.members:
+    if not await db.run_sync(is_org_member, user_to_remove.id, organization.id):
         raise HTTPException(status_code=400, detail="User is not a member of this organization")
     
     organization.members.remove(user_to_remove)
     db.add(organization)
-    db.commit()
-    db.refresh(organization)
+    await db.commit()
+    invalidate_membership(user_to_remove.id, organization.id)
+    await db.refresh(organization, ["members"])
     return organization
 
 @router.delete("/organizations/{org_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_organization(
+async def delete_organization(
     org_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    background: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    organization = db.query(DBOrganization).filter(DBOrganization.id == org_id).first()
-    if not organization or current_user not in organization.members:
-        raise HTTPException(status_code=404, detail="Organization not found or user not a member")
+    organization = await get_member_organization(db, org_id, current_user.id)
     
     # For simplicity, only the creator/first member can delete for now.
     # More robust permission system would be needed for production.
     if organization.members[0].id != current_user.id:
          raise HTTPException(status_code=403, detail="Only the creator can delete this organization")
 
-    db.delete(organization)
-    db.commit()
-    return
\ No newline at end of file
+    # Like a project's: its projects go with it, purged here or by a job
+    return await db.run_sync(
+        deletion.delete_organization, org_id, current_user.id, background
+    )
\ No newline at end of file
@@ -1,14 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from app.models.project import Project as DBProject, ProjectCreate, ProjectResponse
-from app.models.user import User as DBUser
+from app.models.user import Principal
 from app.models.organization import Organization as DBOrganization
-from app.models.task import Task as DBTask
-from app.core.db import get_db
+from app.core.db import get_db, release_connection
 from app.core.security import get_current_user
-from app.services.llm_service import AiService, get_llm_service, LlmException
+from app.core.permissions import is_org_member
+from app.services import deletion
+from app.services.llm_service import (
+    AiService,
+    get_llm_service,
+    use_project,
+    LlmException,
+)
+from app.services.task_counters import get_status_counts
+from app.services.streaming import stream_tokens
+from app.services.retrieval import arelevant_task_ids
+from app.services.context_builder import build_context, context_budget
+from app.services.jobs import submit_job
+from app.services.revisions import get_project_revision
+from app.services.summaries import (
+    get_stored_summary,
+    refresh_summary,
+    summary_headers,
+    summary_refresher,
+    summary_stats,
+)
 from pydantic import BaseModel
 
 from app.models.requests.question import AskQuestionRequest
@@ -20,17 +40,15 @@ router = APIRouter()
 @router.post(
     "/projects", response_model=ProjectResponse, status_code=status.HTTP_201_CREATED
 )
-def create_project(
+async def create_project(
     project: ProjectCreate,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    organization = (
-        db.query(DBOrganization)
-        .filter(DBOrganization.id == project.organization_id)
-        .first()
-    )
-    if not organization or current_user not in organization.members:
+    organization = await db.get(DBOrganization, project.organization_id)
+    if not organization or not await db.run_sync(
+        is_org_member, current_user.id, organization.id
+    ):
         raise HTTPException(
             status_code=403,
             detail="Not authorized to create projects in this organization",
@@ -38,40 +56,46 @@ def create_project(
 
     db_project = DBProject(**project.model_dump())
     db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
+    await db.commit()
+    await db.refresh(db_project)
     return db_project
 
 
 @router.get("/organizations/{org_id}/projects", response_model=List[ProjectResponse])
-def get_all_projects(
+async def get_all_projects(
     org_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    organization = db.query(DBOrganization).filter(DBOrganization.id == org_id).first()
-    if not organization or current_user not in organization.members:
+    organization = await db.get(DBOrganization, org_id)
+    if not organization or not await db.run_sync(
+        is_org_member, current_user.id, organization.id
+    ):
         raise HTTPException(
             status_code=403,
             detail="Not authorized to view projects in this organization",
         )
 
-    projects = db.query(DBProject).filter(DBProject.organization_id == org_id).all()
-    return projects
+    projects = await db.scalars(
+        select(DBProject).where(DBProject.organization_id == org_id)
+    )
+    return projects.all()
 
 
 @router.get("/projects/{project_id}", response_model=ProjectResponse)
-def get_project(
+async def get_project(
     project_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
 
     # Check if the current user is a member of the project's organization
-    if current_user not in project.organization.members:
+    if not await db.run_sync(
+        is_org_member, current_user.id, project.organization_id
+    ):
         raise HTTPException(
             status_code=403, detail="Not authorized to view this project"
         )
@@ -87,144 +111,156 @@ class ProjectSummaryResponse(BaseModel):
 
 
 @router.get("/projects/{project_id}/summary", response_model=ProjectSummaryResponse)
-def get_project_summary(
+async def get_project_summary(
     project_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if current_user not in project.organization.members:
+    if not await db.run_sync(
+        is_org_member, current_user.id, project.organization_id
+    ):
         raise HTTPException(
             status_code=403, detail="Not authorized to view this project summary"
         )
 
-    total_tasks = db.query(DBTask).filter(DBTask.project_id == project_id).count()
-    todo_tasks = (
-        db.query(DBTask)
-        .filter(DBTask.project_id == project_id, DBTask.status == "todo")
-        .count()
-    )
-    in_progress_tasks = (
-        db.query(DBTask)
-        .filter(DBTask.project_id == project_id, DBTask.status == "in_progress")
-        .count()
-    )
-    done_tasks = (
-        db.query(DBTask)
-        .filter(DBTask.project_id == project_id, DBTask.status == "done")
-        .count()
-    )
+    counts = await db.run_sync(get_status_counts, project_id)
 
     return ProjectSummaryResponse(
-        total_tasks=total_tasks,
-        todo_tasks=todo_tasks,
-        in_progress_tasks=in_progress_tasks,
-        done_tasks=done_tasks,
+        total_tasks=sum(counts.values()),
+        todo_tasks=counts.get("todo", 0),
+        in_progress_tasks=counts.get("in_progress", 0),
+        done_tasks=counts.get("done", 0),
     )
 
 
 @router.delete("/projects/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_project(
+async def delete_project(
     project_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    background: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    db_project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    db_project = await db.get(DBProject, project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
 
     # Check if the current user is a member of the project's organization
-    if current_user not in db_project.organization.members:
+    if not await db.run_sync(is_org_member, current_user.id, db_project.organization_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to delete this project"
         )
 
-    db.delete(db_project)
-    db.commit()
-    return
+    # The project is gone at once; its tasks are deleted in chunks, by a job
+    # (202 with the job) if it is large or `background` is set
+    return await db.run_sync(
+        deletion.delete_project, db_project, current_user.id, background
+    )
 
 
 @router.get("/projects/{project_id}/ai_summary", response_model=str)
-def get_project_ai_summary(
+async def get_project_ai_summary(
     project_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    response: Response,
+    stream: bool = False,
+    background: bool = False,
+    refresh: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
     llm_service: AiService = Depends(get_llm_service),
 ):
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if current_user not in project.organization.members:
+    if not await db.run_sync(
+        is_org_member, current_user.id, project.organization_id
+    ):
         raise HTTPException(
             status_code=403, detail="Not authorized to view this project summary"
         )
 
-    tasks = db.query(DBTask).filter(DBTask.project_id == project_id).all()
-
-    project_data = {
-        "project": {
-            "name": project.name,
-            "description": project.description,
-        },
-        "tasks": [
-            {
-                "title": task.title,
-                "description": task.description,
-                "status": task.status,
-                "comments": [comment.content for comment in task.comments],
-            }
-            for task in tasks
-        ],
-    }
+    if background:
+        return await db.run_sync(
+            submit_job, "summary", project, current_user.id, {"full": refresh}
+        )
 
-    try:
-        summary = llm_service.get_summary(project_data)
-        return summary
-    except LlmException as e:
-        raise HTTPException(status_code=500, detail=e.message)
+    # The stored summary is served as is, however stale; refresh=true
+    # writes it anew from the whole project first
+    summary = None
+    if not (refresh or stream):
+        summary = await db.run_sync(get_stored_summary, project_id)
+    if summary is None:
+        await use_project(llm_service, db, project_id)
+        if stream:
+            context, report = await db.run_sync(
+                build_context, project, context_budget(llm_service.model_id)
+            )
+            await release_connection(db)
+            return stream_tokens(llm_service.stream_summary(context), report.headers())
+        try:
+            summary = await refresh_summary(db, project, llm_service, full=refresh)
+        except LlmException as e:
+            raise HTTPException(status_code=500, detail=e.message)
+
+    revision = await db.run_sync(get_project_revision, project_id)
+    summary_stats.served += 1
+    if summary.revision < revision:
+        # In case the refresh was lost, e.g. to a restart
+        summary_stats.served_stale += 1
+        summary_refresher.mark([project_id])
+    response.headers.update(summary_headers(summary, revision))
+    return summary.summary
 
 
 @router.post("/projects/{project_id}/ask", response_model=str)
-def ask_project_question(
+async def ask_project_question(
     project_id: str,
     request: AskQuestionRequest,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    response: Response,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
     llm_service: AiService = Depends(get_llm_service),
 ):
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if current_user not in project.organization.members:
+    if not await db.run_sync(
+        is_org_member, current_user.id, project.organization_id
+    ):
         raise HTTPException(
             status_code=403, detail="Not authorized to ask questions about this project"
         )
+    await use_project(llm_service, db, project_id)
 
-    tasks = db.query(DBTask).filter(DBTask.project_id == project_id).all()
-
-    project_data = {
-        "project": {
-            "name": project.name,
-            "description": project.description,
-        },
-        "tasks": [
-            {
-                "title": task.title,
-                "description": task.description,
-                "status": task.status,
-                "comments": [comment.content for comment in task.comments],
-            }
-            for task in tasks
-        ],
-    }
+    # Open tasks most relevant to the question come first in the context
+    try:
+        relevant = await arelevant_task_ids(db, project_id, request.question)
+    except LlmException as e:
+        raise HTTPException(status_code=500, detail=e.message)
+    context, report = await db.run_sync(
+        build_context,
+        project,
+        context_budget(llm_service.model_id),
+        relevant_task_ids=relevant,
+        for_question=True,
+    )
+    # The model may take a while; the connection is not held meanwhile
+    await release_connection(db)
+
+    if stream:
+        return stream_tokens(
+            llm_service.stream_answer(context, request.question), report.headers()
+        )
 
+    response.headers.update(report.headers())
     try:
-        answer = llm_service.ask_question(project_data, request.question)
+        answer = await llm_service.aask_question(context, request.question)
         return answer
     except LlmException as e:
         raise HTTPException(status_code=500, detail=e.message)
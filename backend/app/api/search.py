@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from app.models.project import Project as DBProject
+from app.models.search_document import SearchResult
+from app.models.user import Principal
+from app.core.db import get_db
+from app.core.security import get_current_user
+from app.core.permissions import is_org_member
+from app.services.search import search_project
+
+router = APIRouter()
+
+
+@router.get("/projects/{project_id}/search", response_model=List[SearchResult])
+async def search(
+    project_id: str,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    project = await db.scalar(select(DBProject).where(DBProject.id == project_id))
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if not await db.run_sync(is_org_member, current_user.id, project.organization_id):
+        raise HTTPException(
+            status_code=403, detail="Not authorized to search this project"
+        )
+
+    return await db.run_sync(search_project, project_id, q, limit)
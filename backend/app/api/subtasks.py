@@ -1,17 +1,39 @@
-import uuid
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from typing import List
 import json
 
-from app.models.subtask import Subtask as DBSubtask, SubtaskCreate, SubtaskResponse
+from app.models.bulk import BulkDelete, BulkDeleteResponse
+from app.models.subtask import (
+    Subtask as DBSubtask,
+    SubtaskBulkCreate,
+    SubtaskBulkResponse,
+    SubtaskBulkUpdate,
+    SubtaskCreate,
+    SubtaskResponse,
+)
 from app.models.task import Task as DBTask
-from app.models.user import User as DBUser
+from app.models.user import Principal
 from app.models.project import Project as DBProject
-from app.core.db import get_db
+from app.core.db import get_db, release_connection
 from app.core.security import get_current_user
-from app.services.llm_service import LlmException, AiService, get_llm_service
+from app.core.permissions import is_org_member, is_project_member
+from app.services.llm_service import LlmException, AiService, get_llm_service, use_project
+from app.services.llm_scheduler import LlmOverloaded
 from app.models.requests.question import AskQuestionRequest
+from app.services.streaming import sse_response, stream_tokens
+from app.services.retrieval import arelevant_task_ids
+from app.services.context_builder import build_context, context_budget
+from app.services.generation import (
+    InvalidGeneratedItem,
+    new_subtask,
+    stream_created_rows,
+    subtask_prompt,
+)
+from app.services.jobs import submit_job
+from app.services import bulk
 
 router = APIRouter()
 
@@ -24,46 +46,73 @@ async def generate_subtasks(
     project_id: str,
     task_id: str,
     objective: str,
+    stream: bool = False,
+    background: bool = False,
     llm_service: AiService = Depends(get_llm_service),
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    task = (
-        db.query(DBTask)
-        .filter(DBTask.id == task_id, DBTask.project_id == project_id)
-        .first()
+    task = await db.scalar(
+        select(DBTask)
+        .options(joinedload(DBTask.project))
+        .where(DBTask.id == task_id, DBTask.project_id == project_id)
     )
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    if current_user not in task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, task.project_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to generate subtasks for this task"
         )
 
+    if background:
+        return await db.run_sync(
+            submit_job,
+            "generate_subtasks",
+            task.project,
+            current_user.id,
+            {"task_id": task_id, "objective": objective},
+        )
+
+    await use_project(llm_service, db, project_id)
+
     # Construct a prompt for subtask generation
-    prompt = f"""
-    Given the following main task: "{task.title} - {task.description}"
-    And the objective: "{objective}"
+    prompt = subtask_prompt(task, objective)
+    # The model may take a while; the connection is not held meanwhile
+    await release_connection(db)
 
-    Break down the objective into a list of smaller, actionable subtasks.
-    Return the subtasks as a JSON array of objects with the following keys: title, description.
-    """
+    if stream:
+        return sse_response(
+            stream_created_rows(
+                "subtask",
+                llm_service.stream_tasks(prompt),
+                lambda subtask_data: new_subtask(subtask_data, task_id),
+                SubtaskResponse.model_validate,
+            )
+        )
 
     try:
-        subtask_data_list = llm_service.get_tasks(
+        subtask_data_list = await llm_service.aget_tasks(
             prompt
         )  # Re-using get_tasks from LLM service
 
         created_subtasks = []
         for subtask_data in subtask_data_list:
-            db_subtask = DBSubtask(**subtask_data, task_id=task_id)
-            db_subtask.id = str(uuid.uuid4())
+            try:
+                db_subtask = new_subtask(subtask_data, task_id)
+            except InvalidGeneratedItem:
+                # Items the model wrote without a title are left out
+                continue
             db.add(db_subtask)
             created_subtasks.append(db_subtask)
-        db.commit()
-        for subtask in created_subtasks:
-            db.refresh(subtask)
+        await db.commit()
+        created_subtasks = (
+            await db.scalars(
+                select(DBSubtask).where(
+                    DBSubtask.id.in_([subtask.id for subtask in created_subtasks])
+                )
+            )
+        ).all()
 
         return [SubtaskResponse.model_validate(subtask) for subtask in created_subtasks]
 
@@ -73,6 +122,8 @@ async def generate_subtasks(
         raise HTTPException(
             status_code=500, detail="Failed to parse LLM response as JSON."
         )
+    except LlmOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"An unexpected error occurred: {str(e)}"
@@ -83,26 +134,26 @@ async def generate_subtasks(
     "/projects/{project_id}/tasks/{task_id}/subtasks",
     response_model=List[SubtaskResponse],
 )
-def get_subtasks(
+async def get_subtasks(
     project_id: str,
     task_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    task = (
-        db.query(DBTask)
-        .filter(DBTask.id == task_id, DBTask.project_id == project_id)
-        .first()
+    task = await db.scalar(
+        select(DBTask).where(DBTask.id == task_id, DBTask.project_id == project_id)
     )
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    if current_user not in task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, task.project_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to view subtasks for this task"
         )
 
-    subtasks = db.query(DBSubtask).filter(DBSubtask.task_id == task_id).all()
+    subtasks = (
+        await db.scalars(select(DBSubtask).where(DBSubtask.task_id == task_id))
+    ).all()
     return [SubtaskResponse.model_validate(subtask) for subtask in subtasks]
 
 
@@ -110,23 +161,23 @@ def get_subtasks(
     "/projects/{project_id}/tasks/{task_id}/subtasks/{subtask_id}",
     response_model=SubtaskResponse,
 )
-def update_subtask(
+async def update_subtask(
     project_id: str,
     task_id: str,
     subtask_id: str,
     subtask_update: SubtaskCreate,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    subtask = (
-        db.query(DBSubtask)
-        .filter(DBSubtask.id == subtask_id, DBSubtask.task_id == task_id)
-        .first()
+    subtask = await db.scalar(
+        select(DBSubtask)
+        .options(joinedload(DBSubtask.task))
+        .where(DBSubtask.id == subtask_id, DBSubtask.task_id == task_id)
     )
     if subtask is None:
         raise HTTPException(status_code=404, detail="Subtask not found")
 
-    if current_user not in subtask.task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, subtask.task.project_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to update this subtask"
         )
@@ -135,78 +186,123 @@ def update_subtask(
         setattr(subtask, key, value)
 
     db.add(subtask)
-    db.commit()
-    db.refresh(subtask)
+    await db.commit()
+    await db.refresh(subtask)
     return SubtaskResponse.model_validate(subtask)
 
 
 @router.post("/projects/{project_id}/tasks/{task_id}/subtasks/{subtask_id}/ask")
-def ask_project_question(
+async def ask_project_question(
     project_id: str,
     task_id: str,
     subtask_id: str,
     request: AskQuestionRequest,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    response: Response,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
     llm_service: AiService = Depends(get_llm_service),
 ):
-    db_subtask = (
-        db.query(DBSubtask)
-        .filter(DBSubtask.id == subtask_id, DBSubtask.task_id == task_id)
-        .first()
+    db_subtask = await db.scalar(
+        select(DBSubtask)
+        .options(joinedload(DBSubtask.task))
+        .where(DBSubtask.id == subtask_id, DBSubtask.task_id == task_id)
     )
     if db_subtask is None:
         raise HTTPException(status_code=404, detail="Subtask not found")
 
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if current_user not in project.organization.members:
+    if not await db.run_sync(is_org_member, current_user.id, project.organization_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to access this project"
         )
+    await use_project(llm_service, db, project_id)
 
-    project_data = {
-        "id": project.id,
-        "name": project.name,
-        "description": project.description,
-        "tasks": [
-            {
-                "id": task.id,
-                "title": task.title,
-                "description": task.description,
-                "status": task.status,
-                "due_date": task.due_date.isoformat() if task.due_date else None,
-                "assigned_to": task.assigned_to.username if task.assigned_to else None,
-                "subtasks": [
-                    {
-                        "id": subtask.id,
-                        "title": subtask.title,
-                        "description": subtask.description,
-                        "status": subtask.status,
-                    }
-                    for subtask in task.subtasks
-                ],
-            }
-            for task in project.tasks
-        ],
-    }
-
-    question = f"""Giving the following subtask:
-    Title: {db_subtask.title}
-    Description: {db_subtask.description}
-    
-    which belongs to the task:
-    Title: {db_subtask.task.title}
-    Description: {db_subtask.task.description}
-
-    And the following comments under this task:
-    {"\n".join([comment.content for comment in db_subtask.task.comments]) if db_subtask.task.comments else "None"}
-    
-    The user is asking the following question:
-    {request.question}
-    """
-
-    answer = llm_service.ask_question(project_data, question)
+    # The subtask's task leads the context, followed by the rest of the
+    # project in order of relevance, within the model's token budget
+    try:
+        relevant = await arelevant_task_ids(
+            db, project_id, f"{db_subtask.title} {request.question}"
+        )
+    except LlmException as e:
+        raise HTTPException(status_code=500, detail=f"LLM API error: {e.message}")
+    context, report = await db.run_sync(
+        build_context,
+        project,
+        context_budget(llm_service.model_id),
+        focus_task_id=task_id,
+        focus_subtask_id=subtask_id,
+        relevant_task_ids=relevant,
+        for_question=True,
+    )
+    question = (
+        f'About the subtask "{db_subtask.title}" of the task '
+        f'"{db_subtask.task.title}": {request.question}'
+    )
+    await release_connection(db)
+
+    if stream:
+        return stream_tokens(
+            llm_service.stream_answer(context, question), report.headers()
+        )
+
+    response.headers.update(report.headers())
+    answer = await llm_service.aask_question(context, question)
     return {"answer": answer}
+
+
+@router.post(
+    "/projects/{project_id}/subtasks/bulk", response_model=SubtaskBulkResponse
+)
+async def create_subtasks(
+    project_id: str,
+    batch: SubtaskBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await bulk.authorize_batch(db, project_id, current_user.id)
+    subtasks, errors = await db.run_sync(
+        bulk.create_subtasks, project_id, batch.subtasks, batch.atomic
+    )
+    return SubtaskBulkResponse(
+        subtasks=[SubtaskResponse.model_validate(subtask) for subtask in subtasks],
+        errors=errors,
+    )
+
+
+@router.patch(
+    "/projects/{project_id}/subtasks/bulk", response_model=SubtaskBulkResponse
+)
+async def update_subtasks(
+    project_id: str,
+    batch: SubtaskBulkUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await bulk.authorize_batch(db, project_id, current_user.id)
+    subtasks, errors = await db.run_sync(
+        bulk.update_subtasks, project_id, batch.subtasks, batch.atomic
+    )
+    return SubtaskBulkResponse(
+        subtasks=[SubtaskResponse.model_validate(subtask) for subtask in subtasks],
+        errors=errors,
+    )
+
+
+@router.post(
+    "/projects/{project_id}/subtasks/bulk/delete", response_model=BulkDeleteResponse
+)
+async def delete_subtasks(
+    project_id: str,
+    batch: BulkDelete,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await bulk.authorize_batch(db, project_id, current_user.id)
+    deleted, errors = await db.run_sync(
+        bulk.delete_subtasks, project_id, batch.ids, batch.atomic
+    )
+    return BulkDeleteResponse(deleted=deleted, errors=errors)
@@ -1,74 +1,145 @@
 from datetime import datetime
-import uuid
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal
 import json
+import uuid
 
-from app.models.task import Task as DBTask, TaskCreate, TaskResponse
+from app.models.bulk import BulkDelete, BulkDeleteResponse
+from app.models.task import (
+    Task as DBTask,
+    TaskBulkCreate,
+    TaskBulkResponse,
+    TaskBulkUpdate,
+    TaskCreate,
+    TaskResponse,
+)
 from app.models.project import Project as DBProject
-from app.core.db import get_db
+from app.core.db import get_db, release_connection
 from app.core.security import get_current_user
+from app.core.permissions import is_org_member, is_project_member
 from app.models.user import (
+    Principal,
     User as DBUser,
 )
-from app.services.llm_service import LlmException, AiService, get_llm_service
+from app.services.llm_service import LlmException, AiService, get_llm_service, use_project
+from app.services.llm_scheduler import LlmOverloaded
+from app.services.pagination import InvalidCursor, keyset_page
+from app.services.search import matching_task_ids
+from app.models.loading import TASK_LIST
 from app.models.requests.question import AskQuestionRequest
+from app.services.streaming import sse_response, stream_tokens
+from app.services.retrieval import arelevant_task_ids
+from app.services.context_builder import build_context, context_budget
+from app.services.generation import (
+    InvalidGeneratedItem,
+    new_task,
+    objective_context,
+    stream_created_rows,
+    task_prompt,
+)
+from app.services.jobs import submit_job
+from app.services import bulk
 
 router = APIRouter()
 
 
+async def get_project_task(
+    db: AsyncSession, project_id: str, task_id: str
+) -> DBTask | None:
+    return await db.scalar(
+        select(DBTask)
+        .options(*TASK_LIST)
+        .where(DBTask.project_id == project_id, DBTask.id == task_id)
+    )
+
+
 @router.post("/projects/{project_id}/tasks/generate", response_model=List[TaskResponse])
 async def generate_tasks(
     project_id: str,
     objective: str,
     due_date: datetime | None = None,
+    stream: bool = False,
+    background: bool = False,
     llm_service: AiService = Depends(get_llm_service),
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if current_user not in project.organization.members:
+    if not await db.run_sync(is_org_member, current_user.id, project.organization_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to generate tasks for this project"
         )
 
-    # 1. Query the RAG service to get relevant context (TODO)
-    context = ""
+    if background:
+        # Runs on a job worker; the response is the queued job
+        return await db.run_sync(
+            submit_job,
+            "generate_tasks",
+            project,
+            current_user.id,
+            {
+                "objective": objective,
+                "due_date": due_date.isoformat() if due_date else None,
+            },
+        )
 
-    # 2. Construct a prompt with the context and objective
-    prompt = f"""
-    Objective: {objective}
+    await use_project(llm_service, db, project_id)
 
-    Context:
-    {context}
+    # 1. Retrieve the existing work most related to the objective
+    try:
+        context = await objective_context(db, project_id, objective)
+    except LlmException as e:
+        raise HTTPException(status_code=500, detail=f"LLM API error: {e.message}")
 
-    Based on the objective and context, generate a list of tasks to complete the objective.
-    Return the tasks as a JSON array of objects with the following keys: id, title, description.
-    """
+    # 2. Construct a prompt with the context and objective
+    prompt = task_prompt(objective, context)
+    user_id, username = current_user.id, current_user.username
+    # The model may take a while; the connection is not held meanwhile
+    await release_connection(db)
+
+    def build_task(task_data: dict) -> DBTask:
+        return new_task(task_data, project_id, user_id, due_date)
+
+    if stream:
+        # Each task is stored and sent as soon as the model has written it
+        def task_response(task: DBTask) -> TaskResponse:
+            task.assigned_username = username
+            return TaskResponse.model_validate(task)
+
+        return sse_response(
+            stream_created_rows(
+                "task", llm_service.stream_tasks(prompt), build_task, task_response
+            )
+        )
 
     # 3. Send the prompt to the LLM and get the tasks
     try:
-        task_data = llm_service.get_tasks(prompt)
-        tasks_data = task_data
+        tasks_data = await llm_service.aget_tasks(prompt)
 
         created_tasks = []
         for task_data in tasks_data:
-            db_task = DBTask(
-                **task_data,
-                project_id=project_id,
-                assigned_user_id=current_user.id,
-                due_date=due_date,
-            )
-            db_task.id = str(uuid.uuid4())
+            try:
+                db_task = build_task(task_data)
+            except InvalidGeneratedItem:
+                # Items the model wrote without a title are left out
+                continue
             db.add(db_task)
             created_tasks.append(db_task)
-        db.commit()
-        for task in created_tasks:  # Refresh each task to get its ID
-            db.refresh(task)
+        await db.commit()
+        # Reload the new rows with one query instead of refreshing each task
+        created_tasks = (
+            await db.scalars(
+                select(DBTask)
+                .options(*TASK_LIST)
+                .where(DBTask.id.in_([task.id for task in created_tasks]))
+            )
+        ).all()
+        for task in created_tasks:
             if task.assigned_to:
                 task.assigned_username = task.assigned_to.username
 
@@ -80,37 +151,75 @@ async def generate_tasks(
         raise HTTPException(
             status_code=500, detail="Failed to parse LLM response as JSON."
         )
+    except LlmOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"An unexpected error occurred: {str(e)}"
         )
 
 
+TASK_SORT_COLUMNS = {"status": DBTask.status, "due_date": DBTask.due_date}
+
+
 @router.get("/projects/{project_id}/tasks", response_model=List[TaskResponse])
-def get_all_tasks(
+async def get_all_tasks(
     project_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
     search_query: str | None = None,
+    status_filter: str | None = Query(None, alias="status"),
+    assigned_user_id: str | None = None,
+    due_after: datetime | None = None,
+    due_before: datetime | None = None,
+    order_by: Literal["status", "due_date"] = "status",
+    limit: int | None = Query(None, ge=1, le=500),
+    cursor: str | None = None,
 ):
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if current_user not in project.organization.members:
+    if not await db.run_sync(is_org_member, current_user.id, project.organization_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to view tasks for this project"
         )
 
-    query = db.query(DBTask).filter(DBTask.project_id == project_id)
+    query = (
+        select(DBTask).options(*TASK_LIST).where(DBTask.project_id == project_id)
+    )
 
     if search_query:
-        query = query.filter(
-            (DBTask.title.ilike(f"%{search_query}%"))
-            | (DBTask.description.ilike(f"%{search_query}%"))
+        query = query.where(
+            DBTask.id.in_(
+                await db.run_sync(matching_task_ids, project_id, search_query)
+            )
         )
+    if status_filter:
+        query = query.where(DBTask.status == status_filter)
+    if assigned_user_id:
+        query = query.where(DBTask.assigned_user_id == assigned_user_id)
+    if due_after:
+        query = query.where(DBTask.due_date >= due_after)
+    if due_before:
+        query = query.where(DBTask.due_date < due_before)
+
+    sort_column = TASK_SORT_COLUMNS[order_by]
+    if limit is None:
+        tasks = (await db.scalars(query.order_by(sort_column, DBTask.id))).all()
+    else:
+        # Keyset pagination: the opaque cursor for the next page is returned in
+        # the X-Next-Cursor header and is absent on the last page.
+        try:
+            tasks, next_cursor = await db.run_sync(
+                keyset_page, query, sort_column, DBTask.id, limit, cursor
+            )
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
 
-    tasks = query.all()
     for task in tasks:
         if task.assigned_to:
             task.assigned_username = task.assigned_to.username
@@ -121,14 +230,14 @@ def get_all_tasks(
 async def create_task(
     project_id: str,
     task_create: TaskCreate,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if current_user not in project.organization.members:
+    if not await db.run_sync(is_org_member, current_user.id, project.organization_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to create tasks for this project"
         )
@@ -142,27 +251,72 @@ async def create_task(
         status="todo",  # Default status for manually created tasks
     )
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    await db.commit()
+    await db.refresh(db_task)
     return TaskResponse.model_validate(db_task)
 
 
+@router.post("/projects/{project_id}/tasks/bulk", response_model=TaskBulkResponse)
+async def create_tasks(
+    project_id: str,
+    batch: TaskBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await bulk.authorize_batch(db, project_id, current_user.id)
+    tasks, errors = await db.run_sync(
+        bulk.create_tasks, project_id, batch.tasks, batch.atomic
+    )
+    return TaskBulkResponse(
+        tasks=[TaskResponse.model_validate(task) for task in tasks], errors=errors
+    )
+
+
+@router.patch("/projects/{project_id}/tasks/bulk", response_model=TaskBulkResponse)
+async def update_tasks(
+    project_id: str,
+    batch: TaskBulkUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await bulk.authorize_batch(db, project_id, current_user.id)
+    tasks, errors = await db.run_sync(
+        bulk.update_tasks, project_id, batch.tasks, batch.atomic
+    )
+    return TaskBulkResponse(
+        tasks=[TaskResponse.model_validate(task) for task in tasks], errors=errors
+    )
+
+
+@router.post(
+    "/projects/{project_id}/tasks/bulk/delete", response_model=BulkDeleteResponse
+)
+async def delete_tasks(
+    project_id: str,
+    batch: BulkDelete,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    # Subtasks and comments of the deleted tasks are deleted with them
+    await bulk.authorize_batch(db, project_id, current_user.id)
+    deleted, errors = await db.run_sync(
+        bulk.delete_tasks, project_id, batch.ids, batch.atomic
+    )
+    return BulkDeleteResponse(deleted=deleted, errors=errors)
+
+
 @router.get("/projects/{project_id}/tasks/{task_id}", response_model=TaskResponse)
-def get_task(
+async def get_task(
     project_id: str,
     task_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    task = (
-        db.query(DBTask)
-        .filter(DBTask.project_id == project_id, DBTask.id == task_id)
-        .first()
-    )
+    task = await get_project_task(db, project_id, task_id)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found in this project")
 
-    if current_user not in task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, task.project_id):
         raise HTTPException(status_code=403, detail="Not authorized to view this task")
 
     if task.assigned_to:
@@ -173,21 +327,17 @@ def get_task(
 @router.post(
     "/projects/{project_id}/tasks/{task_id}/assign", response_model=TaskResponse
 )
-def assign_task(
+async def assign_task(
     project_id: str,
     task_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    db_task = (
-        db.query(DBTask)
-        .filter(DBTask.project_id == project_id, DBTask.id == task_id)
-        .first()
-    )
+    db_task = await get_project_task(db, project_id, task_id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found in this project")
 
-    if current_user not in db_task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, db_task.project_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to assign tasks in this project"
         )
@@ -195,30 +345,26 @@ def assign_task(
     # Assign task to the current user
     db_task.assigned_user_id = current_user.id
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    await db.commit()
+    await db.refresh(db_task, ["assigned_to"])
     if db_task.assigned_to:
         db_task.assigned_username = db_task.assigned_to.username
     return TaskResponse.model_validate(db_task)
 
 
 @router.put("/projects/{project_id}/tasks/{task_id}", response_model=TaskResponse)
-def update_task(
+async def update_task(
     project_id: str,
     task_id: str,
     task_update: TaskCreate,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    db_task = (
-        db.query(DBTask)
-        .filter(DBTask.project_id == project_id, DBTask.id == task_id)
-        .first()
-    )
+    db_task = await get_project_task(db, project_id, task_id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found in this project")
 
-    if current_user not in db_task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, db_task.project_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to update this task"
         )
@@ -229,7 +375,7 @@ def update_task(
         and db_task.assigned_user_id != current_user.id
     ):
         # Ensure the current user is part of the organization
-        if current_user not in db_task.project.organization.members:
+        if not await db.run_sync(is_project_member, current_user.id, db_task.project_id):
             raise HTTPException(
                 status_code=403,
                 detail="Cannot assign task: User is not a member of this organization.",
@@ -242,18 +388,15 @@ def update_task(
         # Allow unassigning or assigning to another user if current user has broader permissions (e.g., admin)
         # For now, only allow assigning to self or unassigning by anyone in the org
         # A more robust permission system would be needed here.
-        if current_user not in db_task.project.organization.members:  # Basic check
+        if not await db.run_sync(is_project_member, current_user.id, db_task.project_id):  # Basic check
             raise HTTPException(
                 status_code=403, detail="Not authorized to assign task to other users."
             )
 
         # Verify the assigned user is also in the same organization
-        assigned_user = (
-            db.query(DBUser).filter(DBUser.id == task_update.assigned_user_id).first()
-        )
-        if (
-            not assigned_user
-            or assigned_user not in db_task.project.organization.members
+        assigned_user = await db.get(DBUser, task_update.assigned_user_id)
+        if not assigned_user or not await db.run_sync(
+            is_project_member, assigned_user.id, db_task.project_id
         ):
             raise HTTPException(
                 status_code=400,
@@ -274,8 +417,8 @@ def update_task(
         db_task.due_date = task_update.due_date
 
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    await db.commit()
+    await db.refresh(db_task, ["assigned_to"])
     if db_task.assigned_to:
         db_task.assigned_username = db_task.assigned_to.username
     return TaskResponse.model_validate(db_task)
@@ -284,92 +427,75 @@ def update_task(
 @router.delete(
     "/projects/{project_id}/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT
 )
-def delete_task(
+async def delete_task(
     project_id: str,
     task_id: str,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    db_task = (
-        db.query(DBTask)
-        .filter(DBTask.project_id == project_id, DBTask.id == task_id)
-        .first()
-    )
+    db_task = await get_project_task(db, project_id, task_id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found in this project")
 
-    if current_user not in db_task.project.organization.members:
+    if not await db.run_sync(is_project_member, current_user.id, db_task.project_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to delete this task"
         )
 
-    db.delete(db_task)
-    db.commit()
+    await db.delete(db_task)
+    await db.commit()
     return
 
 
 @router.post("/projects/{project_id}/tasks/{task_id}/ask")
-def ask_project_question(
+async def ask_project_question(
     project_id: str,
     task_id: str,
     request: AskQuestionRequest,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
+    response: Response,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
     llm_service: AiService = Depends(get_llm_service),
 ):
-    db_task = (
-        db.query(DBTask)
-        .filter(DBTask.project_id == project_id, DBTask.id == task_id)
-        .first()
-    )
+    db_task = await get_project_task(db, project_id, task_id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found in this project")
 
-    project = db.query(DBProject).filter(DBProject.id == project_id).first()
+    project = await db.get(DBProject, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if current_user not in project.organization.members:
+    if not await db.run_sync(is_org_member, current_user.id, project.organization_id):
         raise HTTPException(
             status_code=403, detail="Not authorized to access this project"
         )
+    await use_project(llm_service, db, project_id)
 
-    project_data = {
-        "id": project.id,
-        "name": project.name,
-        "description": project.description,
-        "tasks": [
-            {
-                "id": task.id,
-                "title": task.title,
-                "description": task.description,
-                "status": task.status,
-                "due_date": task.due_date.isoformat() if task.due_date else None,
-                "assigned_to": task.assigned_to.username if task.assigned_to else None,
-                "subtasks": [
-                    {
-                        "id": subtask.id,
-                        "title": subtask.title,
-                        "description": subtask.description,
-                        "status": subtask.status,
-                    }
-                    for subtask in task.subtasks
-                ],
-            }
-            for task in project.tasks
-        ],
-    }
-
-    question = f"""Giving the following task:
-    Title: {db_task.title}
-    Description: {db_task.description}
-
-    And the following comments under this task:
-    {"\n".join([comment.content for comment in db_task.comments]) if db_task.comments else "None"}
-    
-    The user is asking the following question:
-    {request.question}
-    """
-
-    answer = llm_service.ask_question(project_data, question)
+    # The task leads the context, followed by the rest of the project in order
+    # of relevance to the question, within the model's token budget
+    try:
+        relevant = await arelevant_task_ids(
+            db, project_id, f"{db_task.title} {request.question}"
+        )
+    except LlmException as e:
+        raise HTTPException(status_code=500, detail=f"LLM API error: {e.message}")
+    context, report = await db.run_sync(
+        build_context,
+        project,
+        context_budget(llm_service.model_id),
+        focus_task_id=task_id,
+        relevant_task_ids=relevant,
+        for_question=True,
+    )
+    question = f'About the task "{db_task.title}": {request.question}'
+    await release_connection(db)
+
+    if stream:
+        return stream_tokens(
+            llm_service.stream_answer(context, question), report.headers()
+        )
+
+    response.headers.update(report.headers())
+    answer = await llm_service.aask_question(context, question)
     return {"answer": answer}
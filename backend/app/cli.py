@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import sys
+
+from app.core.config import settings
+from app.core.db import SessionLocal, engine
+# Every model a relationship names has to be imported before the first query
+from app.models import comment, organization, project, subtask, task, user  # noqa: F401
+from app.services import (
+    db_benchmark,
+    deletion,
+    llm_benchmark,
+    migrations,
+    retrieval,
+    search,
+    task_counters,
+)
+
+
+def migrate_schema(args) -> int:
+    current = migrations.current_revision(engine)
+    head = migrations.migrate(engine)
+    print(f"Schema at revision {head} (was {current or 'unversioned'})")
+    return 0
+
+
+def rebuild_task_counters(args) -> int:
+    migrations.migrate(engine)
+    with SessionLocal() as db:
+        mismatches = task_counters.find_count_mismatches(db)
+        for project_id, status, stored, actual in mismatches:
+            print(f"{project_id} {status}: stored={stored} actual={actual}")
+        if args.check:
+            print(f"{len(mismatches)} mismatched counter(s)")
+            return 1 if mismatches else 0
+        task_counters.rebuild_status_counts(db)
+        print(f"Rebuilt task status counters ({len(mismatches)} corrected)")
+    return 0
+
+
+def rebuild_search_index(args) -> int:
+    migrations.migrate(engine)
+    with SessionLocal() as db:
+        count = search.rebuild_search_index(db)
+    print(f"Indexed {count} search document(s)")
+    return 0
+
+
+def rebuild_vector_indexes(args) -> int:
+    migrations.migrate(engine)
+    with SessionLocal() as db:
+        count = retrieval.rebuild_vector_indexes(db)
+    print(f"Embedded {count} document(s)")
+    return 0
+
+
+def purge_deleted(args) -> int:
+    migrations.migrate(engine)
+    with SessionLocal() as db:
+        organizations, projects, tasks = deletion.purge_deleted(db)
+    print(
+        f"Purged {organizations} organization(s), {projects} project(s) "
+        f"and {tasks} task(s)"
+    )
+    return 0
+
+
+def benchmark_sessions(args) -> int:
+    with SessionLocal() as db:
+        project_id = args.project_id or db_benchmark.busiest_project_id(db)
+    if project_id is None:
+        print("No tasks to read; create some first or pass --project-id")
+        return 1
+    results = asyncio.run(
+        db_benchmark.compare_session_throughput(
+            project_id, args.requests, args.concurrency
+        )
+    )
+    for pipeline, rate in results.items():
+        print(f"{pipeline}: {rate:.0f} requests/s")
+    return 0
+
+
+def benchmark_question_context(args) -> int:
+    results = llm_benchmark.compare_question_context(args.tasks, args.budget)
+    for tasks, result in results.items():
+        print(
+            f"{tasks} tasks: index built in {result['index_build_ms']:.0f} ms; "
+            f"retrieval {result['retrieval_tokens']:.0f} tokens in "
+            f"{result['retrieval_ms']:.1f} ms; all tasks "
+            f"{result['all_tasks_tokens']:.0f} tokens in {result['all_tasks_ms']:.1f} ms"
+        )
+    return 0
+
+
+def benchmark_prompt_prefill(args) -> int:
+    result = llm_benchmark.compare_prompt_prefill(
+        args.tasks, args.projects, args.questions, args.budget
+    )
+    print(
+        f"prompt {result['prompt_tokens']:.0f} tokens; prefilled per question: "
+        f"no cache {result['prompt_tokens']:.0f}, cache_prompt "
+        f"{result['cached_prefill_tokens']:.0f}, cache_prompt with pinned slots "
+        f"{result['pinned_prefill_tokens']:.0f}"
+    )
+    return 0
+
+
+def benchmark_first_task(args) -> int:
+    results = asyncio.run(llm_benchmark.compare_first_task_latency(args.tasks, args.rate))
+    for name, result in results.items():
+        print(f"{name}: first task {result['first_s']:.2f} s, last {result['last_s']:.2f} s")
+    return 0
+
+
+def benchmark_generation_reads(args) -> int:
+    with SessionLocal() as db:
+        project_id = args.project_id or db_benchmark.busiest_project_id(db)
+    if project_id is None:
+        print("No tasks to read; create some first or pass --project-id")
+        return 1
+    results = asyncio.run(
+        llm_benchmark.compare_read_latency_during_generation(
+            project_id, args.generations, args.delay
+        )
+    )
+    for name, result in results.items():
+        print(
+            f"{name}: {result['reads']} reads, median {result['median_ms']:.1f} ms, "
+            f"max {result['max_ms']:.1f} ms"
+        )
+    return 0
+
+
+def benchmark_membership(args) -> int:
+    results = db_benchmark.compare_membership_checks(args.members, args.checks)
+    for members, result in results.items():
+        print(
+            f"{members} members: "
+            + ", ".join(f"{check} {ms:.3f} ms" for check, ms in result.items())
+        )
+    return 0
+
+
+def benchmark_sqlite_writes(args) -> int:
+    results = db_benchmark.compare_sqlite_write_throughput(
+        args.writers, args.readers, args.writes
+    )
+    for profile, result in results.items():
+        print(
+            f"{profile}: {result['writes_per_second']:.0f} writes/s, "
+            f"{result['failed_writes']} failed"
+        )
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser(
+        "migrate", help="Upgrade the database schema to the latest revision"
+    )
+    migrate.set_defaults(handler=migrate_schema)
+
+    counters = commands.add_parser(
+        "rebuild-counters", help="Recompute the per-project task status counters"
+    )
+    counters.add_argument(
+        "--check", action="store_true", help="Only report mismatches, exit 1 if any"
+    )
+    counters.set_defaults(handler=rebuild_task_counters)
+
+    search_index = commands.add_parser(
+        "rebuild-search",
+        help="Reindex every task, subtask and comment for full-text search",
+    )
+    search_index.set_defaults(handler=rebuild_search_index)
+
+    vector_index = commands.add_parser(
+        "rebuild-vectors",
+        help="Re-embed every project's documents for retrieval-augmented prompts",
+    )
+    vector_index.set_defaults(handler=rebuild_vector_indexes)
+
+    purge = commands.add_parser(
+        "purge-deleted",
+        help="Delete the rows of deleted projects and organizations still pending",
+    )
+    purge.set_defaults(handler=purge_deleted)
+
+    bench = commands.add_parser(
+        "bench-db",
+        help="Compare request throughput of the async and the threaded sessions",
+    )
+    bench.add_argument("--project-id", help="Project to read (default: the largest)")
+    bench.add_argument("--requests", type=int, default=2000)
+    bench.add_argument("--concurrency", type=int, default=100)
+    bench.set_defaults(handler=benchmark_sessions)
+
+    bench_context = commands.add_parser(
+        "bench-question-context",
+        help="Compare question prompts built with retrieval and with every task",
+    )
+    bench_context.add_argument("--tasks", type=int, nargs="+", default=[50, 300, 1000])
+    bench_context.add_argument("--budget", type=int, default=settings.CONTEXT_TOKEN_BUDGET)
+    bench_context.set_defaults(handler=benchmark_question_context)
+
+    bench_prefill = commands.add_parser(
+        "bench-prompt-prefill",
+        help="Compare the prompt tokens prefilled per question with and without the prompt cache",
+    )
+    bench_prefill.add_argument("--tasks", type=int, default=300)
+    bench_prefill.add_argument("--projects", type=int, default=2)
+    bench_prefill.add_argument("--questions", type=int, default=24)
+    bench_prefill.add_argument("--budget", type=int, default=settings.CONTEXT_TOKEN_BUDGET)
+    bench_prefill.set_defaults(handler=benchmark_prompt_prefill)
+
+    bench_first_task = commands.add_parser(
+        "bench-first-task",
+        help="Time the first generated task, buffered and streamed",
+    )
+    bench_first_task.add_argument("--tasks", type=int, default=8)
+    bench_first_task.add_argument("--rate", type=float, default=200.0, help="Tokens per second")
+    bench_first_task.set_defaults(handler=benchmark_first_task)
+
+    bench_generation = commands.add_parser(
+        "bench-generation-reads",
+        help="Time task listings while slow model calls are in flight",
+    )
+    bench_generation.add_argument("--project-id", help="Project to read (default: the largest)")
+    bench_generation.add_argument("--generations", type=int, default=3)
+    bench_generation.add_argument("--delay", type=float, default=1.0, help="Seconds per model call")
+    bench_generation.set_defaults(handler=benchmark_generation_reads)
+
+    bench_membership = commands.add_parser(
+        "bench-membership",
+        help="Time project membership checks as organizations grow",
+    )
+    bench_membership.add_argument(
+        "--members", type=int, nargs="+", default=[10, 1000, 10000]
+    )
+    bench_membership.add_argument("--checks", type=int, default=200)
+    bench_membership.set_defaults(handler=benchmark_membership)
+
+    bench_writes = commands.add_parser(
+        "bench-sqlite-writes",
+        help="Compare concurrent write throughput of SQLite with and without the pragmas",
+    )
+    bench_writes.add_argument("--writers", type=int, default=8)
+    bench_writes.add_argument("--readers", type=int, default=4)
+    bench_writes.add_argument("--writes", type=int, default=200, help="Per writer")
+    bench_writes.set_defaults(handler=benchmark_sqlite_writes)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
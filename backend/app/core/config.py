@@ -8,10 +8,99 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = "llama"
     OPENAI_API_URL: str = "http://localhost:8012/v1/"
     OPENAI_MODEL: str = "gemma-3-1b-it-Q2_K.gguf"
+    # Prompt caching on local servers; LLAMACPP_SLOTS is the server's
+    # --parallel count, 0 leaves slot choice to the server
+    LLAMACPP_CACHE_PROMPT: bool = True
+    LLAMACPP_SLOTS: int = 0
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    # Per project id: "cache_prompt", "pin_slot" and "keep_alive" in place of
+    # the settings above, e.g. to keep a rarely asked project from taking a
+    # slot, or a confidential one's prompt from staying on the server
+    PROMPT_CACHE_PROJECTS: dict[str, dict[str, bool | str]] = {}
     LLM_SERVICE: str = "gemini"
+    LLM_FALLBACK_SERVICES: list[str] = []
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_RETRIES: int = 2
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    LLM_HEDGE_PERCENTILE: float = 0.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_THREAD_POOL_SIZE: int = 4
+    # Concurrent calls per backend; match the server's parallel slots
+    # (llama.cpp --parallel, OLLAMA_NUM_PARALLEL). Unlisted backends are unlimited.
+    LLM_MAX_IN_FLIGHT: dict[str, int] = {"ollama": 2, "openai": 2}
+    LLM_MAX_QUEUE_WAIT_SECONDS: float = 20.0
+    LLM_MAX_QUEUED: int = 100
+    LLM_COALESCE_REQUESTS: bool = True
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_SIZE: int = 1000
+    LLM_CACHE_TTL_SECONDS: int = 3600
+    LLM_CACHE_DB_PATH: str = ""
+    LLM_CACHE_DB_SIZE: int = 10000
+    EMBEDDER: str = "hashing"
+    EMBEDDING_MODEL: str = ""
+    HASHING_EMBEDDING_DIM: int = 512
+    VECTOR_INDEX_DIR: str = "./vector_index"
+    VECTOR_INDEX_CACHE_SIZE: int = 100
+    RAG_TOP_K: int = 8
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_TOKEN_BUDGETS: dict[str, int] = {}
+    CONTEXT_QUESTION_SHARE: float = 0.25
+    # Chat sessions are kept in process memory: run one server process, or
+    # route each session's requests to the process that started it
+    CHAT_SESSION_CACHE_SIZE: int = 1000
+    CHAT_SESSION_TTL_SECONDS: int = 1800
+    CHAT_HISTORY_TOKEN_BUDGET: int = 1500
+    CHAT_RECENT_EXCHANGES: int = 2
+    CHAT_MAX_DELTA_TOKENS: int = 500
+    SUMMARY_REFRESH_ENABLED: bool = True
+    SUMMARY_REFRESH_DEBOUNCE_SECONDS: float = 30.0
+    SUMMARY_REFRESH_MAX_DELAY_SECONDS: float = 300.0
+    SUMMARY_REFRESH_MIN_INTERVAL_SECONDS: float = 120.0
+    SUMMARY_MAX_INCREMENTAL_UPDATES: int = 10
+    SUMMARY_MAX_DELTA_TOKENS: int = 1000
+    JOB_WORKERS: int = 2
+    JOB_QUEUE_MAX_DEPTH: int = 100
+    JOB_TIMEOUT_SECONDS: int = 300
+    JOB_TIMEOUTS: dict[str, int] = {}
+    JOB_DEFAULT_PRIORITY: int = 0
+    JOB_ORG_PRIORITIES: dict[str, int] = {}
+    JOB_LEASE_SECONDS: int = 60
+    JOB_POLL_SECONDS: float = 2.0
+    JOB_MAX_ATTEMPTS: int = 3
     DATABASE_URL: str = "sqlite:///./sql_app.db"
+    DATABASE_ASYNC: bool = True
+    # Upgrade the schema when the app starts, or only check that it is up to
+    # date; with several server processes, run `python -m app.cli migrate`
+    DATABASE_MIGRATE_ON_STARTUP: bool = True
+    # Connection pool of server databases (Postgres); SQLite keeps its defaults
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 20
+    DATABASE_POOL_TIMEOUT_SECONDS: float = 30.0
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800
+    # Pragmas set on every SQLite connection; an empty string leaves one unset
+    SQLITE_JOURNAL_MODE: str = "wal"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_SYNCHRONOUS: str = "normal"
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_CACHE_SIZE_KIB: int = 65536
+    SQLITE_FOREIGN_KEYS: str = "on"
     SECRET_KEY: str = "a_very_secret_key_that_should_be_changed_in_production"
     ALGORITHM: str = "HS256"
+    MEMBERSHIP_CACHE_SIZE: int = 10000
+    MEMBERSHIP_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 300
+    TASK_STATUS_COUNTERS: bool = False
+    BULK_MAX_ITEMS: int = 500
+    # A deleted project or organization is hidden at once, then its rows are
+    # deleted this many tasks per transaction; by a background job from this
+    # many tasks on, or when the request asks for it
+    DELETE_CHUNK_SIZE: int = 1000
+    DELETE_BACKGROUND_MIN_TASKS: int = 5000
 
     class Config:
         env_file = ".env"
@@ -1,21 +1,166 @@
-from sqlalchemy import create_engine
+import asyncio
+import weakref
+from typing import AsyncIterator, Callable
+
+from sqlalchemy import QueuePool, create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 
 from app.core.config import settings
+from app.core.db_profile import apply_profile, engine_options
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+engine = apply_profile(
+    create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_url(url: str) -> URL:
+    # The same database, through its asyncio driver
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        return url
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def create_async_database_engine():
+    database_engine = create_async_engine(
+        async_database_url(SQLALCHEMY_DATABASE_URL),
+        **engine_options(SQLALCHEMY_DATABASE_URL),
+    )
+    apply_profile(database_engine.sync_engine)
+    return database_engine
+
+
+# Request handlers await their queries. With DATABASE_ASYNC they run on the
+# asyncio engine; without it every call goes to the blocking engine through
+# the thread pool. Job workers, the CLI and the change tracking hooks work
+# with the blocking Session either way.
+async_engine = create_async_database_engine() if settings.DATABASE_ASYNC else None
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+def _in_threadpool(name: str):
+    async def call(self, *args, **kwargs):
+        await self._take_slot()
+        return await run_in_threadpool(getattr(self.sync_session, name), *args, **kwargs)
+
+    call.__name__ = name
+    return call
+
+
+class ThreadedSession:
+    # The part of the AsyncSession interface the handlers use, over a
+    # blocking Session. Each call runs in the thread pool, one at a time.
+    # The first call waits for `slot`, which is held until the session is
+    # closed or release_connection gives it back.
+    def __init__(self, session: Session, slot: asyncio.Semaphore | None = None):
+        self.sync_session = session
+        self._slot = slot
+        self._holding_slot = False
+
+    async def _take_slot(self) -> None:
+        if self._slot is not None and not self._holding_slot:
+            await self._slot.acquire()
+            self._holding_slot = True
+
+    def release_slot(self) -> None:
+        if self._holding_slot:
+            self._holding_slot = False
+            self._slot.release()
+
+    @property
+    def info(self) -> dict:
+        return self.sync_session.info
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, *args, **kwargs):
+        # Fetched in the thread too, like the buffered results of AsyncSession
+        def execute():
+            result = self.sync_session.execute(statement, *args, **kwargs)
+            if getattr(result, "returns_rows", True):
+                result = result.freeze()()
+            return result
+
+        await self._take_slot()
+        return await run_in_threadpool(execute)
+
+    async def scalars(self, statement, *args, **kwargs):
+        return (await self.execute(statement, *args, **kwargs)).scalars()
+
+    async def run_sync(self, fn: Callable, *args, **kwargs):
+        await self._take_slot()
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    scalar = _in_threadpool("scalar")
+    get = _in_threadpool("get")
+    merge = _in_threadpool("merge")
+    refresh = _in_threadpool("refresh")
+    delete = _in_threadpool("delete")
+    flush = _in_threadpool("flush")
+    commit = _in_threadpool("commit")
+    rollback = _in_threadpool("rollback")
+    close = _in_threadpool("close")
+
+    async def __aenter__(self) -> "ThreadedSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        try:
+            await run_in_threadpool(self.sync_session.close)
+        finally:
+            self.release_slot()
+
+
+_session_slots: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _session_slot() -> asyncio.Semaphore | None:
+    # As many sessions as the blocking pool has connections. A session waits
+    # for its slot on the event loop: were it to wait for a connection in a
+    # thread instead, enough of them could take up every thread of the pool
+    # while the sessions holding the connections wait for a thread to finish.
+    pool = engine.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    loop = asyncio.get_running_loop()
+    if loop not in _session_slots:
+        _session_slots[loop] = asyncio.Semaphore(pool.size() + pool._max_overflow)
+    return _session_slots[loop]
+
+
+def threaded_session() -> ThreadedSession:
+    return ThreadedSession(SessionLocal(expire_on_commit=False), _session_slot())
+
+
+async def release_connection(db: AsyncSession | ThreadedSession) -> None:
+    # Before a long wait that needs no database, such as a model call: ends
+    # the transaction, which hands the connection back to the pool, and
+    # frees a threaded session's slot. Nothing is expired on commit, so what
+    # was loaded stays usable; the next query takes a connection again.
+    await db.commit()
+    if isinstance(db, ThreadedSession):
+        db.release_slot()
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    session_factory = AsyncSessionLocal if async_engine is not None else threaded_session
+    async with session_factory() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,61 @@
+from sqlalchemy import Table, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, Connection, Engine, make_url
+
+from app.core.config import settings
+
+
+def engine_options(url: str | URL) -> dict:
+    # create_engine arguments for the kind of database behind `url`
+    if make_url(url).get_backend_name() == "sqlite":
+        # A connection is used by whichever thread of the pool runs the request
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT_SECONDS,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE_SECONDS,
+    }
+
+
+def sqlite_pragmas() -> dict[str, str | int]:
+    # WAL lets readers carry on while a transaction writes, and a busy
+    # timeout makes a writer wait for the lock instead of failing at once.
+    # With WAL, synchronous=NORMAL only syncs at checkpoints: a power cut can
+    # lose the last commits but never corrupts the database.
+    pragmas = {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        # Negative: in KiB rather than in pages
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KIB,
+        # SQLite checks the schema's foreign keys only when asked to
+        "foreign_keys": settings.SQLITE_FOREIGN_KEYS,
+    }
+    return {name: value for name, value in pragmas.items() if value != ""}
+
+
+def apply_profile(engine: Engine) -> Engine:
+    # Sets the SQLite pragmas on every new connection of `engine`; for an
+    # asyncio engine, pass its sync_engine
+    if engine.dialect.name != "sqlite":
+        return engine
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+def upsert(connection: Connection, table: Table):
+    # INSERT with ON CONFLICT for the connection's database, SQLite or Postgres
+    return {"sqlite": sqlite.insert, "postgresql": postgresql.insert}[
+        connection.dialect.name
+    ](table)
@@ -0,0 +1,67 @@
+from sqlalchemy import exists
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.project import Project as DBProject
+from app.models.user import user_organization_association
+
+# Membership answers are cached per process. The TTL bounds how long another
+# worker's add/remove can go unnoticed; local changes invalidate immediately.
+membership_cache = TTLCache(
+    maxsize=settings.MEMBERSHIP_CACHE_SIZE, ttl=settings.MEMBERSHIP_CACHE_TTL_SECONDS
+)
+# Projects never move between organizations, so this mapping only needs evicting
+# when a project is deleted.
+project_organization_cache = TTLCache(maxsize=settings.MEMBERSHIP_CACHE_SIZE)
+
+
+def is_org_member(db: Session, user_id: str, org_id: str | None) -> bool:
+    if org_id is None:
+        return False
+
+    key = (user_id, org_id)
+    cached = membership_cache.get(key)
+    if cached is not None:
+        return cached
+
+    is_member = db.query(
+        exists().where(
+            user_organization_association.c.user_id == user_id,
+            user_organization_association.c.organization_id == org_id,
+        )
+    ).scalar()
+    membership_cache.set(key, is_member)
+    return is_member
+
+
+def get_project_organization_id(db: Session, project_id: str) -> str | None:
+    org_id = project_organization_cache.get(project_id)
+    if org_id is None:
+        org_id = (
+            db.query(DBProject.organization_id)
+            .filter(DBProject.id == project_id)
+            .scalar()
+        )
+        if org_id is not None:
+            project_organization_cache.set(project_id, org_id)
+    return org_id
+
+
+def is_project_member(db: Session, user_id: str, project_id: str | None) -> bool:
+    if project_id is None:
+        return False
+    return is_org_member(db, user_id, get_project_organization_id(db, project_id))
+
+
+def invalidate_membership(user_id: str, org_id: str) -> None:
+    membership_cache.pop((user_id, org_id))
+
+
+def forget_organization(org_id: str) -> None:
+    membership_cache.discard_where(lambda key, _: key[1] == org_id)
+    project_organization_cache.discard_where(lambda _, value: value == org_id)
+
+
+def forget_project(project_id: str) -> None:
+    project_organization_cache.pop(project_id)
@@ -1,13 +1,16 @@
+import time
 from datetime import datetime, timedelta
 from typing import Union, Any
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.models.user import User as DBUser, TokenData
+from app.models.user import Principal, User as DBUser, TokenData
 from app.core.db import get_db
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -17,6 +20,13 @@ SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Maps a verified token to the principal it authenticates, so repeat requests
+# skip both the signature check and the users lookup. Entries never outlive
+# the token's own expiry.
+principal_cache = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+
 def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -40,7 +50,19 @@ def decode_access_token(token: str) -> dict[str, Any]:
     except JWTError:
         return {}
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def invalidate_user(user_id: str) -> None:
+    principal_cache.discard_where(lambda _, principal: principal.id == user_id)
+
+
+@event.listens_for(DBUser, "after_delete")
+def _forget_deleted_user(mapper, connection, target):
+    invalidate_user(target.id)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -54,7 +76,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.query(DBUser).filter(DBUser.username == token_data.username).first()
+    user = await db.scalar(select(DBUser).where(DBUser.username == token_data.username))
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+
+    principal = Principal.model_validate(user)
+    ttl = settings.PRINCIPAL_CACHE_TTL_SECONDS
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        principal_cache.set(token, principal, ttl=ttl)
+    return principal
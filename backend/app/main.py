@@ -1,10 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.api import tasks, projects, comments, subtasks
-from app.core.db import Base, engine
+from app.core.config import settings
+from app.core.db import async_engine, engine
 from app.api import auth
 from app.api import organizations
 from app.api import users
+from app.api import metrics
+from app.api import search
+from app.api import jobs
+from app.api import chat
+from app.api import changes
+from app.services.jobs import job_workers
+from app.services.summaries import summary_refresher
+from app.services.llm_scheduler import LlmOverloaded
+from app.services.bulk import BulkRejected
+from app.services.migrations import check_schema, migrate
 
 app = FastAPI(
     title="Adept AI Project Manager",
@@ -19,12 +31,59 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=[
+        "X-Next-Cursor",
+        "X-Context-Tokens",
+        "X-Context-Budget",
+        "X-Context-Truncated",
+        "Retry-After",
+        "X-Summary-Revision",
+        "X-Project-Revision",
+        "X-Summary-Stale",
+        "X-Summary-Generated-At",
+    ],
 )
 
 
+@app.exception_handler(LlmOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LlmOverloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(BulkRejected)
+async def bulk_rejected_handler(request: Request, exc: BulkRejected):
+    # An atomic batch with invalid items: nothing was written
+    return JSONResponse(
+        status_code=400,
+        content={"detail": [error.model_dump() for error in exc.errors]},
+    )
+
+
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(engine)
+    if settings.DATABASE_MIGRATE_ON_STARTUP:
+        migrate(engine)
+    else:
+        check_schema(engine)
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_workers.start()
+    summary_refresher.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await summary_refresher.stop()
+    # Jobs still running are handed back to the queue
+    await job_workers.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
 app.include_router(tasks.router, prefix="/api", tags=["Tasks"])
@@ -34,6 +93,11 @@ app.include_router(organizations.router, prefix="/api", tags=["Organizations"])
 app.include_router(users.router, prefix="/api", tags=["Users"])
 app.include_router(comments.router, prefix="/api", tags=["Comments"])
 app.include_router(subtasks.router, prefix="/api", tags=["Subtasks"])
+app.include_router(search.router, prefix="/api", tags=["Search"])
+app.include_router(jobs.router, prefix="/api", tags=["Jobs"])
+app.include_router(chat.router, prefix="/api", tags=["Chat"])
+app.include_router(changes.router, prefix="/api", tags=["Changes"])
+app.include_router(metrics.router, prefix="/api", tags=["Metrics"])
 
 
 @app.get("/", tags=["Root"])
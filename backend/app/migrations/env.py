@@ -0,0 +1,45 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.core.db import Base, engine
+# Registers every table with the metadata
+from app.services.migrations import migration_connection
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Leaves alone the tables the models do not describe, such as the
+    # full-text search index
+    return not (type_ == "table" and reflected and compare_to is None)
+
+
+def run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=Base.metadata,
+        include_object=include_object,
+        # SQLite can only alter most of a table by copying it
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    context.configure(
+        url=engine.url,
+        target_metadata=Base.metadata,
+        literal_binds=True,
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+elif config.attributes.get("connection") is not None:
+    run_migrations(config.attributes["connection"])
+else:
+    with migration_connection(engine) as connection:
+        run_migrations(connection)
@@ -0,0 +1,21 @@
+"""Baseline: the schema create_all built before the database was versioned
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # New databases are created from the models and stamped with the latest
+    # revision; older ones are stamped with this one, after create_all
+    pass
+
+
+def downgrade() -> None:
+    pass
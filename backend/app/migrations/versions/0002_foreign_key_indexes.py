@@ -0,0 +1,41 @@
+"""Index the foreign keys and orderings of the per-project and per-task listings
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Tables created by create_all after these were added to the models have
+# some of them already
+INDEXES = [
+    ("ix_tasks_project_status_id", "tasks", ["project_id", "status", "id"]),
+    ("ix_tasks_project_due_date_id", "tasks", ["project_id", "due_date", "id"]),
+    ("ix_tasks_project_assignee_id", "tasks", ["project_id", "assigned_user_id", "id"]),
+    ("ix_tasks_assigned_user_id", "tasks", ["assigned_user_id"]),
+    ("ix_tasks_due_date", "tasks", ["due_date"]),
+    ("ix_comments_task_created_at", "comments", ["task_id", "created_at"]),
+    ("ix_subtasks_task_id", "subtasks", ["task_id"]),
+    ("ix_projects_organization_id", "projects", ["organization_id"]),
+    (
+        "ix_user_organization_association_organization_id",
+        "user_organization_association",
+        ["organization_id"],
+    ),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    # The first three were in the models before the schema had versions
+    for name, table, _ in INDEXES[3:]:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,25 @@
+"""Mark deleted projects and organizations until their rows are purged
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("projects", sa.Column("deleted_at", sa.DateTime(), nullable=True))
+    op.add_column("organizations", sa.Column("deleted_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("organizations") as batch_op:
+        batch_op.drop_column("deleted_at")
+    with op.batch_alter_table("projects") as batch_op:
+        batch_op.drop_column("deleted_at")
@@ -0,0 +1,20 @@
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+
+
+class BulkItemError(BaseModel):
+    index: int  # position of the item in the request
+    id: str | None = None
+    detail: str
+
+
+class BulkDelete(BaseModel):
+    ids: list[str] = Field(min_length=1, max_length=settings.BULK_MAX_ITEMS)
+    # All or nothing: any invalid item rejects the whole batch
+    atomic: bool = False
+
+
+class BulkDeleteResponse(BaseModel):
+    deleted: list[str]
+    errors: list[BulkItemError]
@@ -0,0 +1,58 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Index, Integer, JSON, String
+
+from app.core.db import Base
+
+
+class ChangeLogEntry(Base):
+    # Append-only. Rows outlive what they describe, so there are no foreign
+    # keys: a deleted project's deletion stays in its organization's feed.
+    __tablename__ = "change_log"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    organization_id = Column(String(36))
+    organization_revision = Column(Integer)
+    project_id = Column(String(36), nullable=False)
+    revision = Column(Integer, nullable=False)  # the project's
+    entity = Column(String, nullable=False)  # "project", "task", "subtask" or "comment"
+    action = Column(String, nullable=False)  # "insert", "update" or "delete"
+    entity_id = Column(String(36), nullable=False)
+    task_id = Column(String(36), nullable=True)
+    fields = Column(JSON, nullable=False, default=list)  # names of the changed columns
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+    # Both feeds read forward from a revision
+    __table_args__ = (
+        Index("ix_change_log_project_revision", "project_id", "revision"),
+        Index(
+            "ix_change_log_organization_revision",
+            "organization_id",
+            "organization_revision",
+        ),
+    )
+
+
+# Pydantic models for request/response validation
+from pydantic import BaseModel, ConfigDict
+
+
+class ChangeResponse(BaseModel):
+    revision: int
+    organization_revision: int | None = None
+    project_id: str
+    entity: str
+    action: str
+    entity_id: str
+    task_id: str | None = None
+    fields: list[str]
+    changed_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ChangeFeedResponse(BaseModel):
+    # The current revision, and the changes after the one asked for. With
+    # has_more, ask again from the last change's revision.
+    revision: int
+    changes: list[ChangeResponse]
+    has_more: bool
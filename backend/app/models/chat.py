@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class ChatTurn(BaseModel):
+    role: str
+    content: str
+
+
+class ChatSessionResponse(BaseModel):
+    id: str
+    project_id: str
+    created_at: datetime
+    context_tokens: int
+    history_tokens: int
+    summary: str
+    turns: list[ChatTurn]
+
+
+class ChatMessageResponse(BaseModel):
+    answer: str
+    history_tokens: int
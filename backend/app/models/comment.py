@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, String, ForeignKey, DateTime, Index, Text
 from sqlalchemy.orm import relationship
 from app.core.db import Base
 
@@ -19,6 +19,9 @@ class Comment(Base):
     task = relationship("Task", back_populates="comments")
     user = relationship("User", back_populates="comments")
 
+    # A task's comments are listed oldest first
+    __table_args__ = (Index("ix_comments_task_created_at", "task_id", "created_at"),)
+
 
 # Pydantic models for request/response validation
 from pydantic import BaseModel, ConfigDict
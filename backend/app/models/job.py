@@ -0,0 +1,59 @@
+import uuid
+from datetime import datetime
+from typing import Any
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, JSON, String, Text
+
+from app.core.db import Base
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(
+        String(36), primary_key=True, default=lambda: str(uuid.uuid4()), index=True
+    )
+    kind = Column(String, nullable=False)  # a registered job handler name
+    # "queued", "running", "succeeded" or "failed"
+    status = Column(String, nullable=False, default="queued")
+    priority = Column(Integer, nullable=False, default=0)  # higher runs first
+    organization_id = Column(String(36), ForeignKey("organizations.id"))
+    project_id = Column(String(36), ForeignKey("projects.id"), index=True)
+    user_id = Column(String(36), ForeignKey("users.id"))
+    params = Column(JSON, nullable=False, default=dict)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    progress = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    timeout_seconds = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # A running job whose lease has expired was abandoned by its worker
+    lease_expires_at = Column(DateTime, nullable=True)
+
+    # Workers claim the next job in (status, priority desc, created_at) order
+    __table_args__ = (
+        Index("ix_jobs_status_priority_created", "status", "priority", "created_at"),
+    )
+
+
+# Pydantic models for request/response validation
+from pydantic import BaseModel, ConfigDict
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    priority: int
+    project_id: str | None = None
+    params: dict[str, Any]
+    result: Any = None
+    error: str | None = None
+    progress: int
+    attempts: int
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,24 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models.comment import Comment
+from app.models.organization import Organization
+from app.models.task import Task
+
+# Named eager-loading profiles. Apply them with query.options(*PROFILE) so a
+# handler issues a fixed number of SELECTs however many rows it returns.
+
+# Task listings: TaskResponse.assigned_username
+TASK_LIST = (joinedload(Task.assigned_to),)
+
+# Comment listings: CommentResponse.username
+COMMENT_LIST = (joinedload(Comment.user),)
+
+# Organization listings: OrganizationResponse.members
+ORGANIZATION_LIST = (selectinload(Organization.members),)
+
+# Writing a task in full into an LLM prompt
+TASK_CONTEXT = (
+    joinedload(Task.assigned_to),
+    selectinload(Task.subtasks),
+    selectinload(Task.comments).joinedload(Comment.user),
+)
@@ -1,6 +1,6 @@
 from typing import List
 import uuid
-from sqlalchemy import Column, String
+from sqlalchemy import Column, DateTime, String
 from sqlalchemy.orm import relationship
 from app.core.db import Base
 from pydantic import BaseModel, ConfigDict
@@ -16,6 +16,8 @@ class Organization(Base):
     )
     name = Column(String, unique=True, index=True)
     description = Column(String, nullable=True)
+    # Set when the organization is deleted; its rows are then purged in chunks
+    deleted_at = Column(DateTime, nullable=True)
 
     projects = relationship("Project", back_populates="organization")
     members = relationship(
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, ForeignKey, Integer
+
+from app.core.db import Base
+
+
+class OrganizationRevision(Base):
+    __tablename__ = "organization_revisions"
+
+    organization_id = Column(
+        String(36), ForeignKey("organizations.id"), primary_key=True
+    )
+    # Bumped by every flush that writes one of the organization's projects
+    revision = Column(Integer, nullable=False, default=0)
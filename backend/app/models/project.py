@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, ForeignKey
+from sqlalchemy import Column, DateTime, String, ForeignKey
 from sqlalchemy.orm import relationship
 
 from app.core.db import Base
@@ -13,7 +13,9 @@ class Project(Base):
     )
     name = Column(String, index=True)
     description = Column(String)
-    organization_id = Column(String(36), ForeignKey("organizations.id"))
+    organization_id = Column(String(36), ForeignKey("organizations.id"), index=True)
+    # Set when the project is deleted; its rows are then purged in chunks
+    deleted_at = Column(DateTime, nullable=True)
 
     organization = relationship("Organization", back_populates="projects")
     tasks = relationship("Task", back_populates="project")
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, ForeignKey, Integer
+
+from app.core.db import Base
+
+
+class ProjectRevision(Base):
+    __tablename__ = "project_revisions"
+
+    project_id = Column(String(36), ForeignKey("projects.id"), primary_key=True)
+    # Bumped by every flush that writes the project or its tasks, subtasks
+    # or comments
+    revision = Column(Integer, nullable=False, default=0)
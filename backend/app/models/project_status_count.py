@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, ForeignKey, Integer
+
+from app.core.db import Base
+
+
+class ProjectStatusCount(Base):
+    __tablename__ = "project_status_counts"
+
+    project_id = Column(String(36), ForeignKey("projects.id"), primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, JSON, String, Text
+
+from app.core.db import Base
+
+
+class ProjectSummary(Base):
+    __tablename__ = "project_summaries"
+
+    project_id = Column(String(36), ForeignKey("projects.id"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    # The project revision the summary reflects
+    revision = Column(Integer, nullable=False)
+    model_id = Column(String, nullable=False)
+    # What the summary was written from, to find what changed since:
+    # task id -> [digest, title], and the newest comment's time
+    task_digests = Column(JSON, nullable=False, default=dict)
+    comments_seen_at = Column(DateTime, nullable=True)
+    # Incremental updates since the last summary written from the whole project
+    incremental_updates = Column(Integer, nullable=False, default=0)
+    context_tokens = Column(Integer, nullable=False, default=0)
+    generated_at = Column(DateTime, default=datetime.utcnow)
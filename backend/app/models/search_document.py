@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, Text, UniqueConstraint
+from pydantic import BaseModel
+
+from app.core.db import Base
+
+
+class SearchDocument(Base):
+    # One row per searchable task, subtask or comment. The dialect-specific
+    # full-text index (FTS5 table or tsvector column) is layered on top of this
+    # table by app.services.search.ensure_search_index.
+    __tablename__ = "search_documents"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entity_type = Column(String, nullable=False)
+    entity_id = Column(String(36), nullable=False)
+    project_id = Column(String(36), index=True)
+    task_id = Column(String(36), index=True)
+    title = Column(Text)
+    body = Column(Text)
+
+    __table_args__ = (UniqueConstraint("entity_type", "entity_id"),)
+
+
+class SearchResult(BaseModel):
+    entity_type: str
+    entity_id: str
+    task_id: str | None = None
+    title: str | None = None
+    snippet: str
+    score: float
@@ -13,13 +13,16 @@ class Subtask(Base):
     title = Column(String, index=True)
     description = Column(String, nullable=True)
     status = Column(String, default="todo") # e.g., "todo", "done"
-    task_id = Column(String(36), ForeignKey("tasks.id"))
+    task_id = Column(String(36), ForeignKey("tasks.id"), index=True)
 
     task = relationship("Task", back_populates="subtasks")
 
 
 # Pydantic models for request/response validation
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.core.config import settings
+from app.models.bulk import BulkItemError
 
 
 class SubtaskCreate(BaseModel):
@@ -35,4 +38,35 @@ class SubtaskResponse(BaseModel):
     status: str
     task_id: str
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SubtaskBulkCreateItem(SubtaskCreate):
+    task_id: str
+
+
+class SubtaskBulkCreate(BaseModel):
+    subtasks: list[SubtaskBulkCreateItem] = Field(
+        min_length=1, max_length=settings.BULK_MAX_ITEMS
+    )
+    atomic: bool = False
+
+
+class SubtaskBulkUpdateItem(BaseModel):
+    # Only the fields that are sent are changed
+    id: str
+    title: str | None = None
+    description: str | None = None
+    status: str | None = None
+
+
+class SubtaskBulkUpdate(BaseModel):
+    subtasks: list[SubtaskBulkUpdateItem] = Field(
+        min_length=1, max_length=settings.BULK_MAX_ITEMS
+    )
+    atomic: bool = False
+
+
+class SubtaskBulkResponse(BaseModel):
+    subtasks: list[SubtaskResponse]
+    errors: list[BulkItemError]
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, ForeignKey, DateTime
+from sqlalchemy import Column, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.core.db import Base
 
@@ -15,17 +15,29 @@ class Task(Base):
     description = Column(String)
     status = Column(String, default="todo")
     project_id = Column(String, ForeignKey("projects.id"))
-    assigned_user_id = Column(String(36), ForeignKey("users.id"), nullable=True)
-    due_date = Column(DateTime, nullable=True)
+    assigned_user_id = Column(
+        String(36), ForeignKey("users.id"), nullable=True, index=True
+    )
+    due_date = Column(DateTime, nullable=True, index=True)
 
     project = relationship("Project", back_populates="tasks")
     assigned_to = relationship("User", back_populates="assigned_tasks")
     comments = relationship("Comment", back_populates="task", cascade="all, delete-orphan")
     subtasks = relationship("Subtask", back_populates="task", cascade="all, delete-orphan")
 
+    # Match the orderings and filters of the paginated task listing
+    __table_args__ = (
+        Index("ix_tasks_project_status_id", "project_id", "status", "id"),
+        Index("ix_tasks_project_due_date_id", "project_id", "due_date", "id"),
+        Index("ix_tasks_project_assignee_id", "project_id", "assigned_user_id", "id"),
+    )
+
 
 # Pydantic model for request/response validation
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.core.config import settings
+from app.models.bulk import BulkItemError
 
 
 class TaskCreate(BaseModel):
@@ -46,4 +58,30 @@ class TaskResponse(BaseModel):
     assigned_username: str | None = None # For display purposes
     due_date: datetime | None = None
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TaskBulkCreate(BaseModel):
+    tasks: list[TaskCreate] = Field(min_length=1, max_length=settings.BULK_MAX_ITEMS)
+    atomic: bool = False
+
+
+class TaskBulkUpdateItem(BaseModel):
+    # Only the fields that are sent are changed; null clears the assignee or
+    # the due date
+    id: str
+    status: str | None = None
+    assigned_user_id: str | None = None
+    due_date: datetime | None = None
+
+
+class TaskBulkUpdate(BaseModel):
+    tasks: list[TaskBulkUpdateItem] = Field(
+        min_length=1, max_length=settings.BULK_MAX_ITEMS
+    )
+    atomic: bool = False
+
+
+class TaskBulkResponse(BaseModel):
+    tasks: list[TaskResponse]
+    errors: list[BulkItemError]
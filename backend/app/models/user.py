@@ -10,7 +10,11 @@ user_organization_association = Table(
     Base.metadata,
     Column("user_id", String(36), ForeignKey("users.id"), primary_key=True),
     Column(
-        "organization_id", String(36), ForeignKey("organizations.id"), primary_key=True
+        "organization_id",
+        String(36),
+        ForeignKey("organizations.id"),
+        primary_key=True,
+        index=True,
     ),
 )
 
@@ -53,3 +57,12 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: str | None = None
+
+
+class Principal(BaseModel):
+    # The authenticated user as the API handlers see it: plain columns only,
+    # so it can be cached across requests and never lazy loads
+    id: str
+    username: str
+
+    model_config = ConfigDict(frozen=True, from_attributes=True)
@@ -0,0 +1,329 @@
+import uuid
+from typing import Any, Iterable
+
+from fastapi import HTTPException
+from sqlalchemy import Table, delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.permissions import is_org_member
+from app.models.bulk import BulkItemError
+from app.models.comment import Comment as DBComment
+from app.models.project import Project as DBProject
+from app.models.subtask import (
+    Subtask as DBSubtask,
+    SubtaskBulkCreateItem,
+    SubtaskBulkUpdateItem,
+)
+from app.models.task import Task as DBTask, TaskBulkUpdateItem, TaskCreate
+from app.models.user import User as DBUser, user_organization_association
+from app.services.change_tracking import EntityChange, dispatch_changes
+
+tasks_table = DBTask.__table__
+subtasks_table = DBSubtask.__table__
+comments_table = DBComment.__table__
+
+# Sent as null, these are left as they are rather than cleared
+_REQUIRED_FIELDS = {"title", "status"}
+
+
+class BulkRejected(Exception):
+    # An atomic batch had invalid items, so nothing was written
+    def __init__(self, errors: list[BulkItemError]):
+        super().__init__(f"{len(errors)} invalid item(s)")
+        self.errors = errors
+
+
+async def authorize_batch(db: AsyncSession, project_id: str, user_id: str) -> None:
+    # The one authorization check of a batch; every item must then belong to
+    # this project
+    project = await db.get(DBProject, project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if not await db.run_sync(is_org_member, user_id, project.organization_id):
+        raise HTTPException(
+            status_code=403, detail="Not authorized to change this project"
+        )
+
+
+def _reject_if_atomic(errors: list[BulkItemError], atomic: bool) -> None:
+    if errors and atomic:
+        raise BulkRejected(errors)
+
+
+def _updates(item: Any) -> dict[str, Any]:
+    return {
+        key: value
+        for key, value in item.model_dump(exclude_unset=True, exclude={"id"}).items()
+        if value is not None or key not in _REQUIRED_FIELDS
+    }
+
+
+def _row_changes(
+    entity: str, action: str, rows: Iterable[dict], project_id: str
+) -> list[EntityChange]:
+    # What the change handlers would have seen had the unit of work written
+    # (inserted or deleted) these rows
+    changes = []
+    for row in rows:
+        fields = {
+            key: (None, value) if action == "insert" else (value, None)
+            for key, value in row.items()
+        }
+        task_id = row["id"] if entity == "task" else row.get("task_id")
+        changes.append(
+            EntityChange(entity, action, row["id"], project_id, fields, task_id=task_id)
+        )
+    return changes
+
+
+def _member_usernames(
+    db: Session, project_id: str, user_ids: Iterable[str | None]
+) -> dict[str, str]:
+    # User id -> username of those among `user_ids` who belong to the
+    # project's organization
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return {}
+    return dict(
+        db.execute(
+            select(DBUser.id, DBUser.username)
+            .join(
+                user_organization_association,
+                user_organization_association.c.user_id == DBUser.id,
+            )
+            .join(
+                DBProject,
+                DBProject.organization_id
+                == user_organization_association.c.organization_id,
+            )
+            .where(DBProject.id == project_id, DBUser.id.in_(user_ids))
+        ).all()
+    )
+
+
+def _usernames(db: Session, user_ids: Iterable[str | None]) -> dict[str, str]:
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return {}
+    return dict(
+        db.execute(select(DBUser.id, DBUser.username).where(DBUser.id.in_(user_ids))).all()
+    )
+
+
+def _insert_returning(db: Session, model: type, rows: list[dict]) -> list:
+    # One multi-row INSERT ... RETURNING for the whole batch, in item order
+    if not rows:
+        return []
+    return db.scalars(
+        insert(model).returning(model, sort_by_parameter_order=True), rows
+    ).all()
+
+
+def _delete_rows(db: Session, table: Table, rows: list[dict]) -> None:
+    if rows:
+        db.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+
+
+def create_tasks(
+    db: Session, project_id: str, items: list[TaskCreate], atomic: bool
+) -> tuple[list[DBTask], list[BulkItemError]]:
+    members = _member_usernames(db, project_id, (item.assigned_user_id for item in items))
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        if item.assigned_user_id and item.assigned_user_id not in members:
+            errors.append(
+                BulkItemError(
+                    index=index,
+                    detail="Assigned user is not a member of this organization.",
+                )
+            )
+            continue
+        rows.append({"id": str(uuid.uuid4()), "project_id": project_id, **item.model_dump()})
+    _reject_if_atomic(errors, atomic)
+
+    tasks = _insert_returning(db, DBTask, rows)
+    dispatch_changes(db, _row_changes("task", "insert", rows, project_id))
+    db.commit()
+    for task in tasks:
+        task.assigned_username = members.get(task.assigned_user_id)
+    return tasks, errors
+
+
+def update_tasks(
+    db: Session, project_id: str, items: list[TaskBulkUpdateItem], atomic: bool
+) -> tuple[list[DBTask], list[BulkItemError]]:
+    tasks = {
+        task.id: task
+        for task in db.scalars(
+            select(DBTask).where(
+                DBTask.project_id == project_id,
+                DBTask.id.in_([item.id for item in items]),
+            )
+        )
+    }
+    members = _member_usernames(db, project_id, (item.assigned_user_id for item in items))
+    updates, errors = [], []
+    for index, item in enumerate(items):
+        if item.id not in tasks:
+            errors.append(
+                BulkItemError(index=index, id=item.id, detail="Task not found in this project")
+            )
+        elif item.assigned_user_id and item.assigned_user_id not in members:
+            errors.append(
+                BulkItemError(
+                    index=index,
+                    id=item.id,
+                    detail="Assigned user is not a member of this organization.",
+                )
+            )
+        else:
+            updates.append((tasks[item.id], _updates(item)))
+    _reject_if_atomic(errors, atomic)
+
+    # Flushed together: tasks with the same changed columns are written by
+    # one executemany UPDATE, and the change handlers see every change
+    for task, values in updates:
+        for key, value in values.items():
+            setattr(task, key, value)
+    db.commit()
+    updated = list({task.id: task for task, _ in updates}.values())
+    usernames = _usernames(db, (task.assigned_user_id for task in updated))
+    for task in updated:
+        task.assigned_username = usernames.get(task.assigned_user_id)
+    return updated, errors
+
+
+def delete_tasks(
+    db: Session, project_id: str, ids: list[str], atomic: bool
+) -> tuple[list[str], list[BulkItemError]]:
+    rows = {
+        row["id"]: dict(row)
+        for row in db.execute(
+            select(tasks_table).where(
+                tasks_table.c.project_id == project_id, tasks_table.c.id.in_(ids)
+            )
+        ).mappings()
+    }
+    errors = [
+        BulkItemError(index=index, id=task_id, detail="Task not found in this project")
+        for index, task_id in enumerate(ids)
+        if task_id not in rows
+    ]
+    _reject_if_atomic(errors, atomic)
+
+    # Set-based, children first, instead of the unit of work loading every
+    # task's subtasks and comments to cascade the delete
+    subtasks, comments = [], []
+    if rows:
+        subtasks = [
+            dict(row)
+            for row in db.execute(
+                select(subtasks_table).where(subtasks_table.c.task_id.in_(rows))
+            ).mappings()
+        ]
+        comments = [
+            dict(row)
+            for row in db.execute(
+                select(comments_table).where(comments_table.c.task_id.in_(rows))
+            ).mappings()
+        ]
+    _delete_rows(db, comments_table, comments)
+    _delete_rows(db, subtasks_table, subtasks)
+    _delete_rows(db, tasks_table, list(rows.values()))
+    dispatch_changes(
+        db,
+        _row_changes("comment", "delete", comments, project_id)
+        + _row_changes("subtask", "delete", subtasks, project_id)
+        + _row_changes("task", "delete", rows.values(), project_id),
+    )
+    db.commit()
+    return list(rows), errors
+
+
+def _project_task_ids(db: Session, project_id: str, task_ids: Iterable[str]) -> set[str]:
+    return set(
+        db.scalars(
+            select(DBTask.id).where(
+                DBTask.project_id == project_id, DBTask.id.in_(set(task_ids))
+            )
+        )
+    )
+
+
+def create_subtasks(
+    db: Session, project_id: str, items: list[SubtaskBulkCreateItem], atomic: bool
+) -> tuple[list[DBSubtask], list[BulkItemError]]:
+    task_ids = _project_task_ids(db, project_id, (item.task_id for item in items))
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        if item.task_id not in task_ids:
+            errors.append(
+                BulkItemError(index=index, detail="Task not found in this project")
+            )
+            continue
+        rows.append({"id": str(uuid.uuid4()), **item.model_dump()})
+    _reject_if_atomic(errors, atomic)
+
+    subtasks = _insert_returning(db, DBSubtask, rows)
+    dispatch_changes(db, _row_changes("subtask", "insert", rows, project_id))
+    db.commit()
+    return subtasks, errors
+
+
+def update_subtasks(
+    db: Session, project_id: str, items: list[SubtaskBulkUpdateItem], atomic: bool
+) -> tuple[list[DBSubtask], list[BulkItemError]]:
+    subtasks = {
+        subtask.id: subtask
+        for subtask in db.scalars(
+            select(DBSubtask)
+            .join(DBSubtask.task)
+            .where(
+                DBTask.project_id == project_id,
+                DBSubtask.id.in_([item.id for item in items]),
+            )
+        )
+    }
+    updates, errors = [], []
+    for index, item in enumerate(items):
+        if item.id not in subtasks:
+            errors.append(
+                BulkItemError(
+                    index=index, id=item.id, detail="Subtask not found in this project"
+                )
+            )
+        else:
+            updates.append((subtasks[item.id], _updates(item)))
+    _reject_if_atomic(errors, atomic)
+
+    for subtask, values in updates:
+        for key, value in values.items():
+            setattr(subtask, key, value)
+    db.commit()
+    return list({subtask.id: subtask for subtask, _ in updates}.values()), errors
+
+
+def delete_subtasks(
+    db: Session, project_id: str, ids: list[str], atomic: bool
+) -> tuple[list[str], list[BulkItemError]]:
+    rows = {
+        row["id"]: dict(row)
+        for row in db.execute(
+            select(subtasks_table)
+            .join(tasks_table, tasks_table.c.id == subtasks_table.c.task_id)
+            .where(tasks_table.c.project_id == project_id, subtasks_table.c.id.in_(ids))
+        ).mappings()
+    }
+    errors = [
+        BulkItemError(index=index, id=subtask_id, detail="Subtask not found in this project")
+        for index, subtask_id in enumerate(ids)
+        if subtask_id not in rows
+    ]
+    _reject_if_atomic(errors, atomic)
+
+    _delete_rows(db, subtasks_table, list(rows.values()))
+    dispatch_changes(db, _row_changes("subtask", "delete", rows.values(), project_id))
+    db.commit()
+    return list(rows), errors
@@ -0,0 +1,131 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models.comment import Comment as DBComment
+from app.models.project import Project as DBProject
+from app.models.subtask import Subtask as DBSubtask
+from app.models.task import Task as DBTask
+
+
+@dataclass
+class EntityChange:
+    entity: str  # "project", "task", "subtask" or "comment"
+    action: str  # "insert", "update" or "delete"
+    entity_id: str
+    project_id: str | None
+    # Column name -> (old value, new value) for every column that changed.
+    # Inserts report None as the old value, deletes report None as the new one.
+    fields: dict[str, tuple[Any, Any]] = field(default_factory=dict)
+    task_id: str | None = None
+
+    def old(self, name: str) -> Any:
+        return self.fields[name][0] if name in self.fields else None
+
+    def new(self, name: str) -> Any:
+        return self.fields[name][1] if name in self.fields else None
+
+
+ChangeHandler = Callable[[Session, list[EntityChange]], None]
+
+_handlers: list[ChangeHandler] = []
+
+
+def on_changes(handler: ChangeHandler) -> ChangeHandler:
+    # Handlers run inside the flush that wrote the rows, so anything they
+    # write through the session's connection commits or rolls back with it.
+    _handlers.append(handler)
+    return handler
+
+
+def dispatch_changes(db: Session, changes: list[EntityChange]) -> None:
+    # Write paths that bypass the unit of work (bulk statements) call this
+    # directly with the changes they made.
+    if not changes:
+        return
+    for handler in _handlers:
+        handler(db, changes)
+
+
+_TRACKED = {
+    DBProject: "project",
+    DBTask: "task",
+    DBSubtask: "subtask",
+    DBComment: "comment",
+}
+
+
+def _describe(
+    db: Session, entity: str, obj: Any, task_projects: dict[str, str | None]
+) -> tuple[str | None, str | None]:
+    # Returns (project_id, task_id) for a tracked object. Subtasks and comments
+    # only know their task, so the owning project is looked up once per task.
+    loaded = inspect(obj).dict
+    if entity == "project":
+        return loaded.get("id"), None
+    if entity == "task":
+        return loaded.get("project_id"), loaded.get("id")
+    task_id = loaded.get("task_id")
+    if task_id is None:
+        return None, None
+    if task_id not in task_projects:
+        task_projects[task_id] = db.connection().execute(
+            select(DBTask.project_id).where(DBTask.id == task_id)
+        ).scalar()
+    return task_projects[task_id], task_id
+
+
+def _column_changes(obj: Any, action: str) -> dict[str, tuple[Any, Any]]:
+    state = inspect(obj)
+    fields = {}
+    for attr in state.mapper.column_attrs:
+        # Only read what is already loaded: a deleted row can no longer be
+        # refreshed from the database at this point.
+        current = state.dict.get(attr.key)
+        history = state.attrs[attr.key].history
+        if action == "insert":
+            fields[attr.key] = (None, current)
+        elif action == "delete":
+            old = history.deleted[0] if history.deleted else current
+            fields[attr.key] = (old, None)
+        elif history.has_changes():
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            fields[attr.key] = (old, new)
+    return fields
+
+
+def collect_changes(db: Session) -> list[EntityChange]:
+    changes = []
+    task_projects = {}
+    for action, objects in (
+        ("insert", db.new),
+        ("update", db.dirty),
+        ("delete", db.deleted),
+    ):
+        for obj in objects:
+            entity = _TRACKED.get(type(obj))
+            if entity is None:
+                continue
+            fields = _column_changes(obj, action)
+            if action == "update" and not fields:
+                continue
+            project_id, task_id = _describe(db, entity, obj, task_projects)
+            changes.append(
+                EntityChange(
+                    entity,
+                    action,
+                    inspect(obj).dict.get("id"),
+                    project_id,
+                    fields,
+                    task_id=task_id,
+                )
+            )
+    return changes
+
+
+@event.listens_for(Session, "after_flush")
+def _dispatch_flushed_changes(session, flush_context):
+    dispatch_changes(session, collect_changes(session))
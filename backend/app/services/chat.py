@@ -0,0 +1,276 @@
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, Collection
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.db import release_connection
+from app.models.project import Project as DBProject
+from app.services.change_tracking import EntityChange, on_changes
+from app.services.context_builder import (
+    ContextBuilder,
+    ProjectDelta,
+    context_budget,
+    latest_comment_at,
+    project_delta,
+    task_digests,
+    tasks_text,
+)
+from app.services.llm_service import AiService
+from app.services.retrieval import arelevant_task_ids
+from app.services.tokens import count_tokens
+
+SUMMARY_REQUEST = (
+    "Summarize our conversation so far in a few sentences: what was asked, "
+    "what you answered and anything that was decided. Leave out project data "
+    "that is already in the context."
+)
+
+
+@dataclass
+class ChatTurn:
+    # The user's next message, and what the model will have been told about
+    # the project once it has answered it
+    message: dict
+    delta: ProjectDelta | None = None
+    shown_task_ids: list[str] = field(default_factory=list)
+
+
+class ChatSession:
+    # A conversation about one project. The project context is written once
+    # and kept as the fixed start of every prompt, so the model server can
+    # reuse its cached prefix; each turn only adds the question, what changed
+    # in the project since the previous turn, and the answer.
+    def __init__(self, project_id: str, user_id: str, model_id: str):
+        self.id = str(uuid.uuid4())
+        self.project_id = project_id
+        self.user_id = user_id
+        self.model_id = model_id
+        self.created_at = datetime.utcnow()
+        self.context = ""
+        self.context_tokens = 0
+        self.summary = ""
+        self.turns: list[dict] = []
+        self.history_tokens = 0
+        # What the model has been told about, to find what changed since
+        self.task_digests: dict[str, tuple[str, str]] = {}
+        self.seen_task_ids: set[str] = set()
+        self.comments_seen_at: datetime | None = None
+        self._answering: asyncio.Task | None = None
+
+    def prompt_context(self) -> str:
+        if not self.summary:
+            return self.context
+        return f"{self.context}\n## Earlier in this conversation\n{self.summary}\n"
+
+    def snapshot(self, db: Session, project: DBProject) -> None:
+        # (Re)writes the context from the project's current state. It is the
+        # project part of a single question's context, so a conversation can
+        # start from a prompt prefix the model server already has cached.
+        builder = ContextBuilder(
+            db, project, context_budget(self.model_id), for_question=True
+        )
+        self.context = builder.build()
+        self.context_tokens = builder.report.tokens
+        self.seen_task_ids = set(builder.listed_task_ids)
+        self.task_digests = task_digests(db, project.id)
+        self.comments_seen_at = latest_comment_at(db, project.id)
+        chat_sessions.snapshots += 1
+
+    def claim(self) -> bool:
+        # One message at a time, as each is built on the history so far and
+        # recorded once answered. The claim lasts as long as the request's
+        # task, however the request ends.
+        if self._answering is not None and not self._answering.done():
+            return False
+        self._answering = asyncio.current_task()
+        return True
+
+    def record(self, turn: ChatTurn, answer: str) -> None:
+        # Only an answered message counts as told: after a failed or
+        # interrupted answer, the next message carries the same changes
+        if turn.delta is not None:
+            self.task_digests = turn.delta.task_digests
+            self.comments_seen_at = turn.delta.comments_seen_at
+            self.seen_task_ids.update(turn.delta.changed_task_ids)
+            if turn.delta.text:
+                chat_sessions.delta_messages += 1
+        self.seen_task_ids.update(turn.shown_task_ids)
+        self.turns += [turn.message, {"role": "assistant", "content": answer}]
+        self.history_tokens += count_tokens(turn.message["content"]) + count_tokens(answer)
+        chat_sessions.messages += 1
+        chat_sessions.touch(self)
+
+
+def _changes(db: Session, session: ChatSession) -> ProjectDelta:
+    # What changed in the project since the model last saw it
+    return project_delta(
+        db, session.project_id, session.task_digests, session.comments_seen_at
+    )
+
+
+def _related(db: Session, seen: set[str], relevant: list[str]) -> tuple[str, list[str]]:
+    # Tasks relevant to the question that the model has not been shown yet
+    missing = [task_id for task_id in relevant if task_id not in seen]
+    text = ""
+    shown = []
+    for task_id, line in tasks_text(db, missing).items():
+        if count_tokens(text + line) > settings.CHAT_MAX_DELTA_TOKENS:
+            break
+        text += line
+        shown.append(task_id)
+    return text, shown
+
+
+async def _summarize(session: ChatSession, llm_service: AiService) -> bool:
+    # Folds all but the most recent exchanges into the summary
+    keep = 2 * settings.CHAT_RECENT_EXCHANGES
+    earlier = session.turns[: len(session.turns) - keep]
+    if not earlier:
+        return False
+    session.summary = await llm_service.aconverse(
+        session.prompt_context(),
+        [*earlier, {"role": "user", "content": SUMMARY_REQUEST}],
+    )
+    session.turns = session.turns[len(earlier):]
+    session.history_tokens = sum(count_tokens(turn["content"]) for turn in session.turns)
+    chat_sessions.summaries += 1
+    return True
+
+
+async def next_turn(
+    session: ChatSession,
+    db: AsyncSession,
+    project: DBProject,
+    llm_service: AiService,
+    question: str,
+) -> ChatTurn:
+    # The user's next message: the question, preceded by whatever the model
+    # needs to know that its context does not say. The caller holds the
+    # session's claim.
+    summarize = session.history_tokens > settings.CHAT_HISTORY_TOKEN_BUDGET
+    if summarize:
+        # The connection is not held while the model summarizes
+        await release_connection(db)
+    if summarize and await _summarize(session, llm_service):
+        # The prompt prefix changes anyway, so the context is brought up
+        # to date instead of being followed by the summarized changes
+        await db.run_sync(session.snapshot, project)
+    delta = await db.run_sync(_changes, session)
+    if count_tokens(delta.text) > settings.CHAT_MAX_DELTA_TOKENS:
+        # Cheaper to write the context anew than to describe the changes
+        await db.run_sync(session.snapshot, project)
+        delta = None
+    seen = session.seen_task_ids | set(delta.changed_task_ids if delta else ())
+    relevant = await arelevant_task_ids(db, session.project_id, question)
+    related, shown = await db.run_sync(_related, seen, relevant)
+    # Nor while it answers
+    await release_connection(db)
+    parts = []
+    if delta is not None and delta.text:
+        parts.append("Changes to the project since my last message:\n" + delta.text)
+    if related:
+        parts.append("Related tasks not in the context:\n" + related)
+    content = "\n".join(parts)
+    if content:
+        content += f"\nQuestion: {question}"
+    return ChatTurn({"role": "user", "content": content or question}, delta, shown)
+
+
+async def reply(session: ChatSession, turn: ChatTurn, llm_service: AiService) -> str:
+    answer = await llm_service.aconverse(
+        session.prompt_context(), [*session.turns, turn.message]
+    )
+    session.record(turn, answer)
+    return answer
+
+
+async def stream_reply(
+    session: ChatSession, turn: ChatTurn, llm_service: AiService
+) -> AsyncIterator[str]:
+    parts = []
+    async for token in llm_service.stream_conversation(
+        session.prompt_context(), [*session.turns, turn.message]
+    ):
+        parts.append(token)
+        yield token
+    # An interrupted answer is not kept, nor the question that led to it
+    session.record(turn, "".join(parts))
+
+
+class ChatSessionStore:
+    # Sessions live in memory, least recently used first out; a session that
+    # is not used for CHAT_SESSION_TTL_SECONDS expires. Being per process,
+    # they need a single server process or sticky routing.
+    def __init__(self, maxsize: int, ttl: float):
+        self.sessions = TTLCache(maxsize, ttl)
+        self.started = 0
+        self.messages = 0
+        self.delta_messages = 0  # messages that carried project changes
+        self.snapshots = 0  # contexts written, at the start or anew
+        self.summaries = 0
+
+    def start(self, db: Session, project: DBProject, user_id: str, model_id: str) -> ChatSession:
+        session = ChatSession(project.id, user_id, model_id)
+        session.snapshot(db, project)
+        self.touch(session)
+        self.started += 1
+        return session
+
+    def get(self, session_id: str) -> ChatSession | None:
+        return self.sessions.get(session_id)
+
+    def touch(self, session: ChatSession) -> None:
+        # Storing the session again restarts its time to live
+        self.sessions.set(session.id, session)
+
+    def end(self, session_id: str) -> None:
+        self.sessions.pop(session_id)
+
+    def forget_projects(self, project_ids: Collection[str]) -> None:
+        if project_ids:
+            self.sessions.discard_where(
+                lambda key, session: session.project_id in project_ids
+            )
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.sessions),
+            "maxsize": self.sessions.maxsize,
+            "started": self.started,
+            "messages": self.messages,
+            "delta_messages": self.delta_messages,
+            "snapshots": self.snapshots,
+            "summaries": self.summaries,
+        }
+
+
+chat_sessions = ChatSessionStore(
+    settings.CHAT_SESSION_CACHE_SIZE, settings.CHAT_SESSION_TTL_SECONDS
+)
+
+
+@on_changes
+def _collect_deleted_projects(db: Session, changes: list[EntityChange]) -> None:
+    # Their sessions end only once the transaction commits
+    db.info.setdefault("chat_deleted_projects", set()).update(
+        change.entity_id
+        for change in changes
+        if change.entity == "project" and change.action == "delete"
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_deleted_projects(session):
+    chat_sessions.forget_projects(session.info.pop("chat_deleted_projects", set()))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _keep_deleted_projects(session, previous_transaction):
+    session.info.pop("chat_deleted_projects", None)
@@ -0,0 +1,424 @@
+import hashlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterator, Sequence
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from app.core.config import settings
+from app.models.comment import Comment as DBComment
+from app.models.loading import TASK_CONTEXT
+from app.models.project import Project as DBProject
+from app.models.subtask import Subtask as DBSubtask
+from app.models.task import Task as DBTask
+from app.models.user import User as DBUser
+from app.services.tokens import count_tokens
+
+_FETCH_SIZE = 50
+_CLIP = 300  # characters kept of descriptions and comments outside the focus
+# Share of the project part's budget it may have used by the end of a
+# section, so a long task list still leaves room for comments and done tasks.
+_SECTION_SHARES = {"open_tasks": 0.7, "comments": 0.9}
+_PROJECT_SECTIONS = ("project", "open_tasks", "comments", "done_tasks")
+
+
+def context_budget(model_id: str) -> int:
+    return settings.CONTEXT_TOKEN_BUDGETS.get(model_id, settings.CONTEXT_TOKEN_BUDGET)
+
+
+def _clip(text: str | None, limit: int = _CLIP) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def _task_line(task: DBTask, description_limit: int = _CLIP) -> str:
+    details = []
+    if task.due_date:
+        details.append(f"due {task.due_date.date().isoformat()}")
+    if task.assigned_to:
+        details.append(f"@{task.assigned_to.username}")
+    line = f"- [{task.status}] {task.title}"
+    if details:
+        line += f" ({', '.join(details)})"
+    if task.description:
+        line += f": {_clip(task.description, description_limit)}"
+    return line + "\n"
+
+
+def project_text(project: DBProject) -> str:
+    text = f"# Project: {project.name}\n"
+    if project.description:
+        text += f"{_clip(project.description, 1000)}\n"
+    return text
+
+
+def task_text(task: DBTask) -> str:
+    # A task with its subtasks, as open tasks are listed
+    return _task_line(task) + "".join(
+        f"  - subtask [{subtask.status}] {subtask.title}\n"
+        for subtask in task.subtasks
+    )
+
+
+def comment_text(
+    created_at: datetime | None, content: str, task_title: str, username: str | None
+) -> str:
+    when = created_at.date().isoformat() if created_at else ""
+    return f"- {when} @{username or 'unknown'} on \"{task_title}\": {_clip(content)}\n"
+
+
+def tasks_text(db: Session, task_ids: list[str]) -> dict[str, str]:
+    # Task id -> text, in the order of task_ids
+    if not task_ids:
+        return {}
+    tasks = {
+        task.id: task
+        for task in db.query(DBTask)
+        .options(joinedload(DBTask.assigned_to), selectinload(DBTask.subtasks))
+        .filter(DBTask.id.in_(task_ids))
+    }
+    return {task_id: task_text(tasks[task_id]) for task_id in task_ids if task_id in tasks}
+
+
+def task_digests(db: Session, project_id: str) -> dict[str, tuple[str, str]]:
+    # Task id -> (digest of everything a context shows of the task, title).
+    # Digests are stable across processes, so they can be stored.
+    subtasks = defaultdict(list)
+    rows = (
+        db.query(DBSubtask.task_id, DBSubtask.title, DBSubtask.status)
+        .join(DBTask, DBSubtask.task_id == DBTask.id)
+        .filter(DBTask.project_id == project_id)
+        .order_by(DBSubtask.id)
+    )
+    for task_id, title, status in rows:
+        subtasks[task_id].append((title, status))
+    tasks = db.query(
+        DBTask.id,
+        DBTask.title,
+        DBTask.description,
+        DBTask.status,
+        DBTask.assigned_user_id,
+        DBTask.due_date,
+    ).filter(DBTask.project_id == project_id)
+    return {
+        task.id: (
+            hashlib.sha1(repr((tuple(task), subtasks[task.id])).encode()).hexdigest()[:16],
+            task.title,
+        )
+        for task in tasks
+    }
+
+
+def latest_comment_at(db: Session, project_id: str) -> datetime | None:
+    return (
+        db.query(func.max(DBComment.created_at))
+        .join(DBTask, DBComment.task_id == DBTask.id)
+        .filter(DBTask.project_id == project_id)
+        .scalar()
+    )
+
+
+@dataclass
+class ProjectDelta:
+    text: str  # empty when nothing changed
+    task_digests: dict[str, tuple[str, str]]
+    comments_seen_at: datetime | None
+    changed_task_ids: list[str]
+
+
+def project_delta(
+    db: Session,
+    project_id: str,
+    digests: dict[str, tuple[str, str]],
+    comments_seen_at: datetime | None,
+) -> ProjectDelta:
+    # What changed in a project since `digests` were taken and the comment
+    # made at `comments_seen_at`: added, updated and removed tasks, and new
+    # comments
+    current = task_digests(db, project_id)
+    changed = [
+        task_id
+        for task_id, (digest, _) in current.items()
+        if task_id not in digests or digests[task_id][0] != digest
+    ]
+    removed = [title for task_id, (_, title) in digests.items() if task_id not in current]
+    comments = (
+        db.query(DBComment.created_at, DBComment.content, DBTask.title, DBUser.username)
+        .join(DBTask, DBComment.task_id == DBTask.id)
+        .outerjoin(DBUser, DBComment.user_id == DBUser.id)
+        .filter(DBTask.project_id == project_id)
+    )
+    if comments_seen_at is not None:
+        comments = comments.filter(DBComment.created_at > comments_seen_at)
+    comments = comments.order_by(DBComment.created_at).all()
+
+    sections = []
+    if changed:
+        sections.append("Added or updated tasks:\n" + "".join(tasks_text(db, changed).values()))
+    if removed:
+        sections.append("Removed tasks:\n" + "".join(f"- {_clip(title, 120)}\n" for title in removed))
+    if comments:
+        sections.append(
+            "New comments:\n" + "".join(comment_text(*comment) for comment in comments)
+        )
+    return ProjectDelta(
+        "".join(sections),
+        current,
+        comments[-1].created_at if comments else comments_seen_at,
+        changed,
+    )
+
+
+@dataclass
+class ContextReport:
+    budget: int
+    tokens: int = 0
+    included: Counter = field(default_factory=Counter)
+    truncated: Counter = field(default_factory=Counter)  # items left out per section
+
+    def headers(self) -> dict[str, str]:
+        return {
+            "X-Context-Tokens": str(self.tokens),
+            "X-Context-Budget": str(self.budget),
+            "X-Context-Truncated": str(sum(self.truncated.values())),
+        }
+
+
+class ContextStats:
+    def __init__(self):
+        self.builds = 0
+        self.truncated_builds = 0
+        self.tokens = 0
+        self.truncated_items = 0
+
+    def record(self, report: ContextReport) -> None:
+        self.builds += 1
+        self.tokens += report.tokens
+        truncated = sum(report.truncated.values())
+        self.truncated_items += truncated
+        if truncated:
+            self.truncated_builds += 1
+
+    def stats(self) -> dict:
+        return {
+            "builds": self.builds,
+            "truncated_builds": self.truncated_builds,
+            "average_tokens": self.tokens / self.builds if self.builds else 0.0,
+            "truncated_items": self.truncated_items,
+        }
+
+
+context_stats = ContextStats()
+
+
+class ContextBuilder:
+    # Writes a project's state as compact text for a prompt. The project part
+    # comes first: the project, open tasks, recent comments and the titles of
+    # done tasks, in a fixed order that does not depend on the question, so
+    # consecutive questions share a byte-identical prompt prefix that local
+    # model servers can keep in their KV cache. The question's part follows:
+    # the focused task in full, then relevant tasks the project part had no
+    # room for. Rows are fetched in batches as the text is produced, and
+    # nothing is written once the budget is spent; what was left out is
+    # counted in `report`.
+    def __init__(
+        self,
+        db: Session,
+        project: DBProject,
+        budget: int,
+        focus_task_id: str | None = None,
+        focus_subtask_id: str | None = None,
+        relevant_task_ids: Sequence[str] = (),
+        for_question: bool = False,
+    ):
+        self.db = db
+        self.project = project
+        self.focus_task_id = focus_task_id
+        self.focus_subtask_id = focus_subtask_id
+        self.relevant_task_ids = [
+            task_id for task_id in relevant_task_ids if task_id != focus_task_id
+        ]
+        # For questions the project part keeps to a fixed share of the budget,
+        # whatever is asked, leaving the rest to the question's part
+        self.project_budget = budget * (
+            1 - settings.CONTEXT_QUESTION_SHARE if for_question else 1
+        )
+        self.listed_task_ids: set[str] = set()
+        self.report = ContextReport(budget)
+
+    def _take(self, section: str, text: str, heading: str = "") -> str | None:
+        # heading is charged with the first item of its section
+        if heading and self.report.included[section]:
+            heading = ""
+        tokens = count_tokens(heading + text)
+        if section in _PROJECT_SECTIONS:
+            limit = self.project_budget * _SECTION_SHARES.get(section, 1.0)
+        else:
+            limit = self.report.budget
+        if self.report.tokens + tokens > limit:
+            self.report.truncated[section] += 1
+            return None
+        self.report.tokens += tokens
+        self.report.included[section] += 1
+        return heading + text
+
+    def fragments(self) -> Iterator[str]:
+        yield from self._project()
+        yield from self._open_tasks()
+        yield from self._recent_comments()
+        yield from self._done_tasks()
+        if self.focus_task_id:
+            yield from self._focused_task()
+        if self.relevant_task_ids:
+            yield from self._related_tasks()
+        context_stats.record(self.report)
+
+    def build(self) -> str:
+        return "".join(self.fragments())
+
+    def _project(self) -> Iterator[str]:
+        if (fragment := self._take("project", project_text(self.project))) is not None:
+            yield fragment
+
+    def _focused_task(self) -> Iterator[str]:
+        task = (
+            self.db.query(DBTask)
+            .options(*TASK_CONTEXT)
+            .filter(DBTask.id == self.focus_task_id)
+            .first()
+        )
+        if task is None:
+            return
+        heading = "\n## Focused task\n"
+        lines = [_task_line(task, description_limit=2000)]
+        subtasks = sorted(task.subtasks, key=lambda s: s.id != self.focus_subtask_id)
+        for subtask in subtasks:
+            line = f"  - subtask [{subtask.status}] {subtask.title}"
+            if subtask.description:
+                line += f": {_clip(subtask.description)}"
+            if subtask.id == self.focus_subtask_id:
+                line += " (the question is about this subtask)"
+            lines.append(line + "\n")
+        comments = sorted(
+            task.comments, key=lambda c: c.created_at or datetime.min, reverse=True
+        )
+        for comment in comments:
+            author = comment.user.username if comment.user else "unknown"
+            lines.append(f"  - comment by @{author}: {_clip(comment.content, 1000)}\n")
+        for line in lines:
+            if (fragment := self._take("focus", line, heading)) is None:
+                break
+            yield fragment
+        self.report.truncated["focus"] = len(lines) - self.report.included["focus"]
+
+    def _open_tasks(self) -> Iterator[str]:
+        base = self.db.query(DBTask).filter(
+            DBTask.project_id == self.project.id,
+            or_(DBTask.status.is_(None), DBTask.status != "done"),
+        )
+        tasks = (
+            base.options(joinedload(DBTask.assigned_to), selectinload(DBTask.subtasks))
+            .order_by(DBTask.due_date.is_(None), DBTask.due_date, DBTask.id)
+            .yield_per(_FETCH_SIZE)
+        )
+        for task in tasks:
+            fragment = self._take(
+                "open_tasks", task_text(task), "\n## Open tasks\n"
+            )
+            if fragment is None:
+                self.report.truncated["open_tasks"] = (
+                    base.count() - self.report.included["open_tasks"]
+                )
+                return
+            self.listed_task_ids.add(task.id)
+            yield fragment
+
+    def _related_tasks(self) -> Iterator[str]:
+        # Relevant tasks the project part had no room for, best match first
+        missing = [
+            task_id
+            for task_id in self.relevant_task_ids
+            if task_id not in self.listed_task_ids
+        ]
+        if not missing:
+            return
+        tasks = {
+            task.id: task
+            for task in self.db.query(DBTask)
+            .options(joinedload(DBTask.assigned_to), selectinload(DBTask.subtasks))
+            .filter(DBTask.id.in_(missing), DBTask.project_id == self.project.id)
+        }
+        for task_id in missing:
+            if task_id not in tasks:
+                continue
+            fragment = self._take(
+                "related",
+                task_text(tasks[task_id]),
+                "\n## Related tasks\n",
+            )
+            if fragment is None:
+                return
+            yield fragment
+
+    def _recent_comments(self) -> Iterator[str]:
+        base = (
+            self.db.query(DBComment.created_at, DBComment.content, DBTask.title, DBUser.username)
+            .join(DBTask, DBComment.task_id == DBTask.id)
+            .outerjoin(DBUser, DBComment.user_id == DBUser.id)
+            .filter(DBTask.project_id == self.project.id)
+        )
+        rows = base.order_by(DBComment.created_at.desc(), DBComment.id).yield_per(
+            _FETCH_SIZE
+        )
+        for created_at, content, task_title, username in rows:
+            fragment = self._take(
+                "comments",
+                comment_text(created_at, content, task_title, username),
+                "\n## Recent comments\n",
+            )
+            if fragment is None:
+                self.report.truncated["comments"] = (
+                    base.count() - self.report.included["comments"]
+                )
+                return
+            yield fragment
+
+    def _done_tasks(self) -> Iterator[str]:
+        base = self.db.query(DBTask.title).filter(
+            DBTask.project_id == self.project.id, DBTask.status == "done"
+        )
+        done = base.count()
+        if not done:
+            return
+        heading = f"\n## Done tasks ({done})\n"
+        for (title,) in base.order_by(DBTask.id).yield_per(_FETCH_SIZE):
+            fragment = self._take("done_tasks", f"- {_clip(title, 120)}\n", heading)
+            if fragment is None:
+                self.report.truncated["done_tasks"] = (
+                    done - self.report.included["done_tasks"]
+                )
+                return
+            yield fragment
+
+
+def build_context(
+    db: Session,
+    project: DBProject,
+    budget: int,
+    focus_task_id: str | None = None,
+    focus_subtask_id: str | None = None,
+    relevant_task_ids: Sequence[str] = (),
+    for_question: bool = False,
+) -> tuple[str, ContextReport]:
+    builder = ContextBuilder(
+        db,
+        project,
+        budget,
+        focus_task_id,
+        focus_subtask_id,
+        relevant_task_ids,
+        for_question,
+    )
+    return builder.build(), builder.report
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    func,
+    insert,
+    select,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.db import create_async_database_engine, threaded_session
+from app.core.db_profile import apply_profile, engine_options
+from app.core.permissions import (
+    is_project_member,
+    membership_cache,
+    project_organization_cache,
+)
+from app.models.loading import TASK_LIST
+from app.models.organization import Organization as DBOrganization
+from app.models.project import Project as DBProject
+from app.models.task import Task as DBTask
+from app.models.user import User as DBUser, user_organization_association
+from app.services import migrations
+
+TASKS_PER_REQUEST = 50
+
+
+def busiest_project_id(db: Session) -> str | None:
+    return db.scalar(
+        select(DBTask.project_id)
+        .group_by(DBTask.project_id)
+        .order_by(func.count(DBTask.id).desc())
+        .limit(1)
+    )
+
+
+async def read_project(session_factory: Callable[[], AsyncSession], project_id: str) -> None:
+    # The queries of a typical task listing: the project, then a page of its
+    # tasks with their assignees
+    async with session_factory() as db:
+        await db.get(DBProject, project_id)
+        tasks = await db.scalars(
+            select(DBTask)
+            .options(*TASK_LIST)
+            .where(DBTask.project_id == project_id)
+            .order_by(DBTask.status, DBTask.id)
+            .limit(TASKS_PER_REQUEST)
+        )
+        tasks.all()
+
+
+async def _requests_per_second(
+    session_factory: Callable[[], AsyncSession],
+    project_id: str,
+    requests: int,
+    concurrency: int,
+) -> float:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def request() -> None:
+        async with slots:
+            await read_project(session_factory, project_id)
+
+    # Fills the connection pool before anything is timed
+    await asyncio.gather(*(request() for _ in range(concurrency)))
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+async def compare_session_throughput(
+    project_id: str, requests: int, concurrency: int
+) -> dict[str, float]:
+    # Requests per second through each of the two session pipelines, the
+    # asyncio engine and the blocking engine behind the thread pool, with
+    # `concurrency` requests in flight at a time
+    engine = create_async_database_engine()
+    try:
+        return {
+            "async": await _requests_per_second(
+                async_sessionmaker(engine, expire_on_commit=False),
+                project_id,
+                requests,
+                concurrency,
+            ),
+            "threaded": await _requests_per_second(
+                threaded_session, project_id, requests, concurrency
+            ),
+        }
+    finally:
+        await engine.dispose()
+
+
+writes_table = Table(
+    "benchmark_writes",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("writer", Integer, nullable=False),
+    Column("payload", String, nullable=False),
+)
+
+
+def _write_throughput(
+    engine: Engine, writers: int, readers: int, writes: int
+) -> dict[str, float]:
+    # `writers` threads each commit `writes` single-row transactions while
+    # `readers` threads keep scanning the table, each on its own connection
+    # like the requests of separate server workers
+    writes_table.create(engine)
+    writing = threading.Event()
+    writing.set()
+
+    def write(writer: int) -> int:
+        failed = 0
+        for _ in range(writes):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(
+                        insert(writes_table).values(writer=writer, payload="x" * 200)
+                    )
+            except OperationalError:
+                # "database is locked"
+                failed += 1
+        return failed
+
+    def read() -> None:
+        while writing.is_set():
+            try:
+                with engine.connect() as connection:
+                    connection.execute(
+                        select(func.count(), func.max(writes_table.c.id))
+                    ).one()
+            except OperationalError:
+                pass
+
+    with ThreadPoolExecutor(writers + readers) as executor:
+        scans = [executor.submit(read) for _ in range(readers)]
+        started = time.perf_counter()
+        failed = sum(executor.map(write, range(writers)))
+        elapsed = time.perf_counter() - started
+        writing.clear()
+        for scan in scans:
+            scan.result()
+    committed = writers * writes - failed
+    return {"writes_per_second": committed / elapsed, "failed_writes": failed}
+
+
+def compare_sqlite_write_throughput(
+    writers: int, readers: int, writes: int
+) -> dict[str, dict[str, float]]:
+    # The same concurrent writes against a fresh SQLite file opened with the
+    # driver defaults (rollback journal, synchronous=FULL) and one opened
+    # with the SQLITE_* profile
+    pool = {"pool_size": writers + readers, "max_overflow": 0}
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("default", "profile"):
+            url = f"sqlite:///{os.path.join(directory, name)}.db"
+            engine = create_engine(url, **engine_options(url), **pool)
+            if name == "profile":
+                apply_profile(engine)
+            try:
+                results[name] = _write_throughput(engine, writers, readers, writes)
+            finally:
+                engine.dispose()
+    return results
+
+
+def _organization_with_members(engine: Engine, members: int) -> tuple[str, str]:
+    # A project whose organization has `members` members; returns the project
+    # and the member that joined last
+    organization_id = str(uuid.uuid4())
+    project_id = str(uuid.uuid4())
+    user_ids = [str(uuid.uuid4()) for _ in range(members)]
+    with engine.begin() as connection:
+        connection.execute(
+            insert(DBOrganization.__table__).values(
+                id=organization_id, name=f"benchmark {organization_id}"
+            )
+        )
+        connection.execute(
+            insert(DBProject.__table__).values(
+                id=project_id, name="benchmark", organization_id=organization_id
+            )
+        )
+        connection.execute(
+            insert(DBUser.__table__),
+            [{"id": user_id, "username": user_id} for user_id in user_ids],
+        )
+        connection.execute(
+            insert(user_organization_association),
+            [
+                {"user_id": user_id, "organization_id": organization_id}
+                for user_id in user_ids
+            ],
+        )
+    return project_id, user_ids[-1]
+
+
+def _member_list_check(db: Session, user_id: str, project_id: str) -> bool:
+    # The check the handlers made before: the user in the loaded member list
+    project = db.get(DBProject, project_id)
+    return db.get(DBUser, user_id) in project.organization.members
+
+
+def _exists_check(db: Session, user_id: str, project_id: str) -> bool:
+    # The cached check, missing both caches: two indexed lookups
+    membership_cache.clear()
+    project_organization_cache.clear()
+    return is_project_member(db, user_id, project_id)
+
+
+def _check_latency(
+    engine: Engine,
+    check: Callable[[Session, str, str], bool],
+    user_id: str,
+    project_id: str,
+    checks: int,
+) -> float:
+    # Milliseconds per check, each in a new session like a request's
+    started = time.perf_counter()
+    for _ in range(checks):
+        with Session(engine) as db:
+            assert check(db, user_id, project_id)
+    return (time.perf_counter() - started) * 1000 / checks
+
+
+def compare_membership_checks(
+    member_counts: list[int], checks: int
+) -> dict[int, dict[str, float]]:
+    # Milliseconds per project membership check, for organizations of each
+    # size: loading the member list, the EXISTS query and the cached answer
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'membership')}.db"
+        engine = apply_profile(create_engine(url, **engine_options(url)))
+        try:
+            migrations.migrate(engine)
+            for members in member_counts:
+                project_id, user_id = _organization_with_members(engine, members)
+                results[members] = {
+                    "member_list": _check_latency(
+                        engine, _member_list_check, user_id, project_id, checks
+                    ),
+                    "exists": _check_latency(
+                        engine, _exists_check, user_id, project_id, checks
+                    ),
+                    "cached": _check_latency(
+                        engine, is_project_member, user_id, project_id, checks
+                    ),
+                }
+        finally:
+            membership_cache.clear()
+            project_organization_cache.clear()
+            engine.dispose()
+    return results
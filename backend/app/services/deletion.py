@@ -0,0 +1,303 @@
+from datetime import datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import ColumnElement, Table, delete, event, func, select, update
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from app.core.config import settings
+from app.core.permissions import forget_organization, forget_project
+from app.models.comment import Comment as DBComment
+from app.models.job import Job
+from app.models.organization import Organization as DBOrganization
+from app.models.organization_revision import OrganizationRevision
+from app.models.project import Project as DBProject
+from app.models.subtask import Subtask as DBSubtask
+from app.models.task import Task as DBTask
+from app.models.user import user_organization_association
+from app.services.change_tracking import EntityChange, dispatch_changes
+from app.services.jobs import JobContext, job_handler, submit_job
+
+organizations_table = DBOrganization.__table__
+projects_table = DBProject.__table__
+tasks_table = DBTask.__table__
+subtasks_table = DBSubtask.__table__
+comments_table = DBComment.__table__
+jobs_table = Job.__table__
+organization_revisions_table = OrganizationRevision.__table__
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _hide_deleted(execute_state):
+    # As far as ORM queries go, a deleted project or organization is gone
+    # while its rows wait to be purged. The purge works on the tables, which
+    # still show them.
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get("include_deleted", False)
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(
+                DBProject, DBProject.deleted_at.is_(None), include_aliases=True
+            ),
+            with_loader_criteria(
+                DBOrganization, DBOrganization.deleted_at.is_(None), include_aliases=True
+            ),
+        )
+
+
+def count_tasks(db: Session, project_ids: list[str]) -> int:
+    if not project_ids:
+        return 0
+    return db.execute(
+        select(func.count())
+        .select_from(tasks_table)
+        .where(tasks_table.c.project_id.in_(project_ids))
+    ).scalar()
+
+
+def _is_deleted(db: Session, table: Table, entity_id: str) -> bool:
+    return (
+        db.execute(
+            select(table.c.id).where(table.c.id == entity_id, table.c.deleted_at.is_not(None))
+        ).first()
+        is not None
+    )
+
+
+def _hide_projects(db: Session, where: ColumnElement[bool]) -> list[str]:
+    # Marks the projects deleted. Their search documents, status counters,
+    # summaries, revisions and cached answers go now, as for a deleted row;
+    # the tasks and the rest wait for the purge.
+    rows = [
+        dict(row)
+        for row in db.execute(
+            select(projects_table).where(where, projects_table.c.deleted_at.is_(None))
+        ).mappings()
+    ]
+    if not rows:
+        return []
+    project_ids = [row["id"] for row in rows]
+    db.execute(
+        update(projects_table)
+        .where(projects_table.c.id.in_(project_ids))
+        .values(deleted_at=datetime.utcnow())
+    )
+    dispatch_changes(
+        db,
+        [
+            EntityChange(
+                "project",
+                "delete",
+                row["id"],
+                row["id"],
+                {key: (value, None) for key, value in row.items()},
+            )
+            for row in rows
+        ],
+    )
+    return project_ids
+
+
+def purge_project_chunk(db: Session, project_id: str) -> int:
+    # Deletes up to DELETE_CHUNK_SIZE tasks of a deleted project, with their
+    # subtasks and comments, in a transaction of their own so that writers
+    # never wait on one long delete. Returns how many tasks went.
+    task_ids = db.execute(
+        select(tasks_table.c.id)
+        .join(projects_table, projects_table.c.id == tasks_table.c.project_id)
+        .where(
+            tasks_table.c.project_id == project_id,
+            projects_table.c.deleted_at.is_not(None),
+        )
+        .limit(settings.DELETE_CHUNK_SIZE)
+    ).scalars().all()
+    if task_ids:
+        db.execute(delete(comments_table).where(comments_table.c.task_id.in_(task_ids)))
+        db.execute(delete(subtasks_table).where(subtasks_table.c.task_id.in_(task_ids)))
+        db.execute(delete(tasks_table).where(tasks_table.c.id.in_(task_ids)))
+    db.commit()
+    return len(task_ids)
+
+
+def finish_project_purge(db: Session, project_id: str) -> None:
+    # Once the tasks are gone. Jobs keep their history, without the project.
+    if not _is_deleted(db, projects_table, project_id):
+        return
+    db.execute(
+        update(jobs_table).where(jobs_table.c.project_id == project_id).values(project_id=None)
+    )
+    db.execute(delete(projects_table).where(projects_table.c.id == project_id))
+    db.commit()
+    forget_project(project_id)
+
+
+def purge_project(db: Session, project_id: str) -> int:
+    deleted = 0
+    while tasks := purge_project_chunk(db, project_id):
+        deleted += tasks
+    finish_project_purge(db, project_id)
+    return deleted
+
+
+def organization_projects(db: Session, organization_id: str) -> list[str]:
+    # The projects a deleted organization's purge goes through, hiding any
+    # created while the organization was being deleted
+    if not _is_deleted(db, organizations_table, organization_id):
+        return []
+    _hide_projects(db, projects_table.c.organization_id == organization_id)
+    db.commit()
+    return (
+        db.execute(
+            select(projects_table.c.id).where(
+                projects_table.c.organization_id == organization_id
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+
+def finish_organization_purge(db: Session, organization_id: str) -> None:
+    # Once its projects are gone
+    if not _is_deleted(db, organizations_table, organization_id):
+        return
+    association = user_organization_association
+    db.execute(delete(association).where(association.c.organization_id == organization_id))
+    db.execute(
+        delete(organization_revisions_table).where(
+            organization_revisions_table.c.organization_id == organization_id
+        )
+    )
+    db.execute(
+        update(jobs_table)
+        .where(jobs_table.c.organization_id == organization_id)
+        .values(organization_id=None)
+    )
+    db.execute(delete(organizations_table).where(organizations_table.c.id == organization_id))
+    db.commit()
+    forget_organization(organization_id)
+
+
+def purge_organization(db: Session, organization_id: str) -> int:
+    deleted = 0
+    for project_id in organization_projects(db, organization_id):
+        deleted += purge_project(db, project_id)
+    finish_organization_purge(db, organization_id)
+    return deleted
+
+
+def purge_deleted(db: Session) -> tuple[int, int, int]:
+    # Purges whatever deletions are still pending, e.g. with no job worker
+    # running. Returns the (organizations, projects, tasks) deleted.
+    organization_ids = (
+        db.execute(
+            select(organizations_table.c.id).where(
+                organizations_table.c.deleted_at.is_not(None)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    projects = tasks = 0
+    for organization_id in organization_ids:
+        for project_id in organization_projects(db, organization_id):
+            tasks += purge_project(db, project_id)
+            projects += 1
+        finish_organization_purge(db, organization_id)
+    for project_id in (
+        db.execute(select(projects_table.c.id).where(projects_table.c.deleted_at.is_not(None)))
+        .scalars()
+        .all()
+    ):
+        tasks += purge_project(db, project_id)
+        projects += 1
+    return len(organization_ids), projects, tasks
+
+
+def delete_project(
+    db: Session, project: DBProject, user_id: str, background: bool = False
+) -> JSONResponse | None:
+    # Hides the project, then purges it here, or hands the purge to a job
+    # (202 with the job) when asked to or when the project is large
+    background = background or (
+        count_tasks(db, [project.id]) >= settings.DELETE_BACKGROUND_MIN_TASKS
+    )
+    _hide_projects(db, projects_table.c.id == project.id)
+    if background:
+        # Commits the deletion with the job, or neither if the queue is full
+        response = submit_job(
+            db, "purge_project", project, user_id, {"project_id": project.id}
+        )
+        forget_project(project.id)
+        return response
+    db.commit()
+    forget_project(project.id)
+    purge_project(db, project.id)
+    return None
+
+
+def delete_organization(
+    db: Session, organization_id: str, user_id: str, background: bool = False
+) -> JSONResponse | None:
+    project_ids = (
+        db.execute(
+            select(projects_table.c.id).where(
+                projects_table.c.organization_id == organization_id
+            )
+        )
+        .scalars()
+        .all()
+    )
+    background = background or (
+        count_tasks(db, project_ids) >= settings.DELETE_BACKGROUND_MIN_TASKS
+    )
+    db.execute(
+        update(organizations_table)
+        .where(organizations_table.c.id == organization_id)
+        .values(deleted_at=datetime.utcnow())
+    )
+    _hide_projects(db, projects_table.c.organization_id == organization_id)
+    if background:
+        response = submit_job(
+            db,
+            "purge_organization",
+            None,
+            user_id,
+            {"organization_id": organization_id},
+            organization_id=organization_id,
+        )
+        forget_organization(organization_id)
+        return response
+    db.commit()
+    forget_organization(organization_id)
+    purge_organization(db, organization_id)
+    return None
+
+
+async def _purge_projects(job: JobContext, project_ids: list[str]) -> int:
+    # Progress is the number of tasks deleted so far
+    deleted = 0
+    for project_id in project_ids:
+        while tasks := await job.db.run_sync(purge_project_chunk, project_id):
+            deleted += tasks
+            await job.report_progress(deleted)
+        await job.db.run_sync(finish_project_purge, project_id)
+    return deleted
+
+
+@job_handler("purge_project")
+async def purge_project_job(job: JobContext) -> dict[str, Any]:
+    deleted = await _purge_projects(job, [job.params["project_id"]])
+    return {"deleted_tasks": deleted}
+
+
+@job_handler("purge_organization")
+async def purge_organization_job(job: JobContext) -> dict[str, Any]:
+    organization_id = job.params["organization_id"]
+    project_ids = await job.db.run_sync(organization_projects, organization_id)
+    deleted = await _purge_projects(job, project_ids)
+    await job.db.run_sync(finish_organization_purge, organization_id)
+    return {"deleted_projects": len(project_ids), "deleted_tasks": deleted}
@@ -0,0 +1,119 @@
+import asyncio
+import re
+from abc import ABC, abstractmethod
+import zlib
+from functools import lru_cache
+
+import google.generativeai as genai
+import numpy as np
+import ollama
+import openai
+
+from app.core.config import settings
+from app.services.llm_service import LlmException, _sync_executor
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class Embedder(ABC):
+    # Turns texts into unit-length float32 rows, so a dot product is the
+    # cosine similarity. `name` identifies the vector space on disk.
+    name = "none"
+
+    @abstractmethod
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        ...
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        try:
+            return self._embed(texts)
+        except Exception as e:
+            raise LlmException(f"{self.name} embedding error: {e}")
+
+    async def aembed(self, texts: list[str]) -> np.ndarray:
+        # The provider clients are sync, so the request runs on the pool the
+        # sync LLM backends use rather than on the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_sync_executor, self.embed, texts)
+
+
+class HashingEmbedder(Embedder):
+    # Deterministic and offline: words, word pairs and character trigrams are
+    # hashed into signed buckets. Good enough to rank by shared vocabulary.
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            features += [padded[i : i + 3] for i in range(len(padded) - 2)]
+        return features
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode())
+                vectors[row, digest % self.dim] += 1.0 if digest >> 31 else -1.0
+        return normalize(vectors)
+
+
+class OllamaEmbedder(Embedder):
+    def __init__(self, host: str, model: str):
+        self.client = ollama.Client(host=host)
+        self.model = model
+        self.name = f"ollama-{model}"
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        response = self.client.embed(model=self.model, input=texts)
+        return normalize(response["embeddings"])
+
+
+class OpenAIEmbedder(Embedder):
+    def __init__(self, base_url: str, model: str, api_key: str):
+        self.client = openai.OpenAI(base_url=base_url, api_key=api_key)
+        self.model = model
+        self.name = f"openai-{model}"
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        response = self.client.embeddings.create(model=self.model, input=texts)
+        return normalize([item.embedding for item in response.data])
+
+
+class GeminiEmbedder(Embedder):
+    def __init__(self, api_key: str, model: str):
+        genai.configure(api_key=api_key)
+        self.model = model
+        self.name = f"gemini-{model}"
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        response = genai.embed_content(model=self.model, content=texts)
+        return normalize(response["embedding"])
+
+
+@lru_cache()
+def get_embedder() -> Embedder:
+    if settings.EMBEDDER == "ollama":
+        return OllamaEmbedder(
+            settings.OLLAMA_API_URL, settings.EMBEDDING_MODEL or "nomic-embed-text"
+        )
+    if settings.EMBEDDER == "openai":
+        return OpenAIEmbedder(
+            settings.OPENAI_API_URL,
+            settings.EMBEDDING_MODEL or settings.OPENAI_MODEL,
+            settings.OPENAI_API_KEY,
+        )
+    if settings.EMBEDDER == "gemini":
+        return GeminiEmbedder(
+            settings.GEMINI_API_KEY,
+            settings.EMBEDDING_MODEL or "models/text-embedding-004",
+        )
+    return HashingEmbedder(settings.HASHING_EMBEDDING_DIM)
@@ -0,0 +1,189 @@
+import json
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Callable
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import threaded_session
+from app.models.project import Project as DBProject
+from app.models.subtask import Subtask as DBSubtask
+from app.models.task import Task as DBTask
+from app.services.jobs import JobContext, job_handler
+from app.services.llm_scheduler import LlmOverloaded
+from app.services.llm_service import LlmException
+from app.services.retrieval import aretrieve, format_context
+from app.services.streaming import sse_event
+from app.services.summaries import refresh_summary
+
+
+async def objective_context(db: AsyncSession, project_id: str, objective: str) -> str:
+    # The existing work most related to the objective
+    if not settings.RAG_TOP_K:
+        return ""
+    return format_context(await aretrieve(db, project_id, objective, settings.RAG_TOP_K))
+
+
+def task_prompt(objective: str, context: str) -> str:
+    return f"""
+    Objective: {objective}
+
+    Context:
+    {context}
+
+    Based on the objective and context, generate a list of tasks to complete the objective.
+    Return the tasks as a JSON array of objects with the following keys: id, title, description.
+    """
+
+
+def subtask_prompt(task: DBTask, objective: str) -> str:
+    return f"""
+    Given the following main task: "{task.title} - {task.description}"
+    And the objective: "{objective}"
+
+    Break down the objective into a list of smaller, actionable subtasks.
+    Return the subtasks as a JSON array of objects with the following keys: title, description.
+    """
+
+
+class InvalidGeneratedItem(ValueError):
+    pass
+
+
+def _generated_fields(data: object) -> tuple[str, str | None]:
+    # The title and description of an item the model wrote. Model-supplied ids
+    # and anything else are ignored; an item without a title is rejected.
+    if not isinstance(data, dict):
+        raise InvalidGeneratedItem("not an object")
+    title, description = data.get("title"), data.get("description")
+    if not isinstance(title, str) or not title.strip():
+        raise InvalidGeneratedItem("missing title")
+    if description is not None and not isinstance(description, str):
+        raise InvalidGeneratedItem("description is not text")
+    return title, description
+
+
+def new_task(
+    data: dict, project_id: str, user_id: str, due_date: datetime | None
+) -> DBTask:
+    title, description = _generated_fields(data)
+    return DBTask(
+        id=str(uuid.uuid4()),
+        title=title,
+        description=description or "",
+        project_id=project_id,
+        assigned_user_id=user_id,
+        due_date=due_date,
+    )
+
+
+def new_subtask(data: dict, task_id: str) -> DBSubtask:
+    title, description = _generated_fields(data)
+    return DBSubtask(
+        id=str(uuid.uuid4()),
+        title=title,
+        description=description,
+        task_id=task_id,
+    )
+
+
+async def _enumerate(items: AsyncIterator[dict]) -> AsyncIterator[tuple[int, dict]]:
+    index = 0
+    async for item in items:
+        yield index, item
+        index += 1
+
+
+async def stream_created_rows(
+    event: str,
+    items: AsyncIterator[dict],
+    build_row: Callable[[dict], object],
+    to_response: Callable[[object], BaseModel],
+) -> AsyncIterator[str]:
+    # Persists every generated item as soon as the model has produced it and
+    # emits it as an SSE event. An unusable item gets an error event and the
+    # stream goes on. The stream outlives the request's dependencies, so it
+    # works on its own session.
+    count = 0
+    db = threaded_session()
+    try:
+        async for index, item in _enumerate(items):
+            try:
+                row = build_row(item)
+            except InvalidGeneratedItem as e:
+                yield sse_event(
+                    "error", {"detail": f"Skipped generated {event} {index}: {e}"}
+                )
+                continue
+            db.add(row)
+            await db.commit()
+            count += 1
+            yield sse_event(event, to_response(row).model_dump(mode="json"))
+        yield sse_event("done", {"count": count})
+    except LlmException as e:
+        yield sse_event("error", {"detail": f"LLM API error: {e.message}"})
+    except json.JSONDecodeError:
+        yield sse_event("error", {"detail": "Failed to parse LLM response as JSON."})
+    except LlmOverloaded as e:
+        yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+    finally:
+        await items.aclose()
+        await db.close()
+
+
+# Background jobs. Each generated row is committed with the job's progress, so
+# a job that fails part way keeps what it had already produced.
+
+
+@job_handler("generate_tasks")
+async def generate_tasks_job(job: JobContext) -> dict:
+    objective = job.params["objective"]
+    due_date = job.params.get("due_date")
+    due_date = datetime.fromisoformat(due_date) if due_date else None
+    context = await objective_context(job.db, job.project_id, objective)
+    prompt = task_prompt(objective, context)
+    task_ids = []
+    async for task_data in job.llm_service.stream_tasks(prompt):
+        try:
+            task = new_task(task_data, job.project_id, job.user_id, due_date)
+        except InvalidGeneratedItem:
+            continue
+        job.db.add(task)
+        task_ids.append(task.id)
+        await job.report_progress(len(task_ids), {"task_ids": list(task_ids)})
+    return {"task_ids": task_ids}
+
+
+@job_handler("generate_subtasks")
+async def generate_subtasks_job(job: JobContext) -> dict:
+    task = await job.db.get(DBTask, job.params["task_id"])
+    if task is None:
+        raise LookupError("Task not found")
+    prompt = subtask_prompt(task, job.params["objective"])
+    subtask_ids = []
+    async for subtask_data in job.llm_service.stream_tasks(prompt):
+        try:
+            subtask = new_subtask(subtask_data, task.id)
+        except InvalidGeneratedItem:
+            continue
+        job.db.add(subtask)
+        subtask_ids.append(subtask.id)
+        await job.report_progress(len(subtask_ids), {"subtask_ids": list(subtask_ids)})
+    return {"subtask_ids": subtask_ids}
+
+
+@job_handler("summary")
+async def summary_job(job: JobContext) -> dict:
+    project = await job.db.get(DBProject, job.project_id)
+    if project is None:
+        raise LookupError("Project not found")
+    summary = await refresh_summary(
+        job.db, project, job.llm_service, full=job.params.get("full", False)
+    )
+    return {
+        "summary": summary.summary,
+        "revision": summary.revision,
+        "context_tokens": summary.context_tokens,
+    }
@@ -0,0 +1,372 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.db import SessionLocal, ThreadedSession
+from app.models.job import Job, JobResponse
+from app.models.project import Project as DBProject
+from app.services.llm_scheduler import shed_load
+from app.services.llm_service import (
+    AiService,
+    LlmException,
+    current_organization_id,
+    current_project_id,
+    get_llm_service,
+)
+from app.services.streaming import sse_event
+
+FINISHED = ("succeeded", "failed")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobContext:
+    # What a handler works with: its job, a session of its own and the model.
+    # The session is awaited like a request's; its calls run in the thread
+    # pool, so the event loop never waits on the database.
+    def __init__(self, job: Job, db: Session, llm_service: AiService):
+        self.job = job
+        self.db = ThreadedSession(db)
+        self.llm_service = llm_service
+        self.params = dict(job.params)
+        self.project_id = job.project_id
+        self.user_id = job.user_id
+
+    async def report_progress(self, progress: int, result: Any = None) -> None:
+        # Commits the session too, so rows written so far become visible
+        self.job.progress = progress
+        if result is not None:
+            self.job.result = result
+        await self.db.commit()
+        job_events.notify(self.job.id)
+
+
+JobHandler = Callable[[JobContext], Awaitable[Any]]
+
+_handlers: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = handler
+        return handler
+
+    return register
+
+
+class JobEvents:
+    # Wakes in-process listeners when a job changes. Listeners also poll, which
+    # covers jobs run by a worker in another process.
+    def __init__(self):
+        self._listeners: dict[str, set[asyncio.Event]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def subscribe(self, job_id: str) -> asyncio.Event:
+        self._loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        self._listeners.setdefault(job_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, job_id: str, event: asyncio.Event) -> None:
+        listeners = self._listeners.get(job_id, set())
+        listeners.discard(event)
+        if not listeners:
+            self._listeners.pop(job_id, None)
+
+    def notify(self, job_id: str) -> None:
+        # Called from the thread pool too
+        for event in list(self._listeners.get(job_id, ())):
+            self._loop.call_soon_threadsafe(event.set)
+
+
+job_events = JobEvents()
+
+
+def _lease_deadline() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+
+class JobWorkerPool:
+    # A fixed number of asyncio workers that claim jobs from the jobs table.
+    # A claim is a conditional UPDATE, so several processes can share the
+    # table. Running jobs hold a lease their worker keeps renewing; a job whose
+    # lease ran out (its worker died) is claimed again, up to JOB_MAX_ATTEMPTS.
+    def __init__(
+        self,
+        workers: int,
+        service_factory: Callable[[], AiService] = get_llm_service,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self.workers = workers
+        self.service_factory = service_factory
+        self.session_factory = session_factory
+        self.succeeded = 0
+        self.failed = 0
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._loop = asyncio.get_running_loop()
+            self._tasks = [
+                asyncio.create_task(self._work()) for _ in range(self.workers)
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        # Called from the thread pool too
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _claim(self, db: Session) -> Job | None:
+        now = datetime.utcnow()
+        claimable = or_(
+            Job.status == "queued",
+            and_(Job.status == "running", Job.lease_expires_at < now),
+        )
+        candidates = db.scalars(
+            select(Job.id)
+            .where(claimable)
+            .order_by(Job.priority.desc(), Job.created_at)
+            .limit(self.workers + 1)
+        ).all()
+        for job_id in candidates:
+            claimed = db.execute(
+                update(Job)
+                .where(Job.id == job_id, claimable)
+                .values(
+                    status="running",
+                    started_at=now,
+                    attempts=Job.attempts + 1,
+                    lease_expires_at=_lease_deadline(),
+                )
+            ).rowcount
+            db.commit()
+            if claimed:
+                return db.get(Job, job_id)
+        return None
+
+    async def _work(self) -> None:
+        while True:
+            self._wakeup.clear()
+            with self.session_factory() as db:
+                job = await run_in_threadpool(self._claim, db)
+                if job is not None:
+                    await self._run(db, job)
+                    continue
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), settings.JOB_POLL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def _extend_lease(self, job_id: str) -> None:
+        with self.session_factory() as db:
+            db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "running")
+                .values(lease_expires_at=_lease_deadline())
+            )
+            db.commit()
+
+    async def _renew_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            await run_in_threadpool(self._extend_lease, job_id)
+
+    def _finish(
+        self, db: Session, job: Job, outcome: str, result: Any = None, error: str | None = None
+    ) -> None:
+        job.status = outcome
+        if result is not None:
+            job.result = result
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        job.lease_expires_at = None
+        db.commit()
+        job_events.notify(job.id)
+        if outcome == "succeeded":
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+    def _requeue(self, db: Session, job: Job) -> None:
+        # The job did not fail, so this claim is not counted as an attempt
+        db.rollback()
+        job.status = "queued"
+        job.lease_expires_at = None
+        job.attempts = Job.attempts - 1
+        db.commit()
+
+    async def _run(self, db: Session, job: Job) -> None:
+        job_events.notify(job.id)
+        if job.attempts > settings.JOB_MAX_ATTEMPTS:
+            await run_in_threadpool(
+                self._finish, db, job, "failed", error="Gave up after repeated worker failures"
+            )
+            return
+        handler = _handlers.get(job.kind)
+        if handler is None:
+            await run_in_threadpool(
+                self._finish, db, job, "failed", error=f"Unknown job kind: {job.kind}"
+            )
+            return
+
+        project_token = current_project_id.set(job.project_id)
+        organization_token = current_organization_id.set(job.organization_id)
+        # A queued job waits for the model rather than being turned away
+        shed_token = shed_load.set(False)
+        lease = asyncio.create_task(self._renew_lease(job.id))
+        try:
+            result = await asyncio.wait_for(
+                handler(JobContext(job, db, self.service_factory())),
+                job.timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            await run_in_threadpool(db.rollback)
+            await run_in_threadpool(
+                self._finish,
+                db,
+                job,
+                "failed",
+                error=f"Timed out after {job.timeout_seconds}s",
+            )
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so that it runs after a restart
+            await run_in_threadpool(self._requeue, db, job)
+            raise
+        except LlmException as e:
+            await run_in_threadpool(db.rollback)
+            await run_in_threadpool(self._finish, db, job, "failed", error=e.message)
+        except Exception as e:
+            await run_in_threadpool(db.rollback)
+            await run_in_threadpool(
+                self._finish, db, job, "failed", error=f"{type(e).__name__}: {e}"
+            )
+        else:
+            await run_in_threadpool(self._finish, db, job, "succeeded", result=result)
+        finally:
+            lease.cancel()
+            current_project_id.reset(project_token)
+            current_organization_id.reset(organization_token)
+            shed_load.reset(shed_token)
+
+    def stats(self, db: Session) -> dict:
+        counts = dict(
+            db.query(Job.status, func.count(Job.id))
+            .filter(Job.status.in_(("queued", "running")))
+            .group_by(Job.status)
+            .all()
+        )
+        return {
+            "workers": len(self._tasks),
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "max_queued": settings.JOB_QUEUE_MAX_DEPTH,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
+
+
+job_workers = JobWorkerPool(settings.JOB_WORKERS)
+
+
+def enqueue_job(
+    db: Session,
+    kind: str,
+    project: DBProject | None,
+    user_id: str | None,
+    params: dict,
+    organization_id: str | None = None,
+) -> Job:
+    # Without a project, the job is the organization's
+    queued = db.query(func.count(Job.id)).filter(Job.status == "queued").scalar()
+    if queued >= settings.JOB_QUEUE_MAX_DEPTH:
+        raise QueueFull(f"{queued} jobs are already queued")
+    if project is not None:
+        organization_id = project.organization_id
+    job = Job(
+        kind=kind,
+        priority=settings.JOB_ORG_PRIORITIES.get(
+            organization_id, settings.JOB_DEFAULT_PRIORITY
+        ),
+        organization_id=organization_id,
+        project_id=project.id if project is not None else None,
+        user_id=user_id,
+        params=params,
+        timeout_seconds=settings.JOB_TIMEOUTS.get(kind, settings.JOB_TIMEOUT_SECONDS),
+    )
+    db.add(job)
+    db.commit()
+    job_workers.wake()
+    return job
+
+
+def submit_job(
+    db: Session,
+    kind: str,
+    project: DBProject | None,
+    user_id: str,
+    params: dict,
+    organization_id: str | None = None,
+) -> JSONResponse:
+    # 202 Accepted with the job; poll GET /api/jobs/{id} or follow its events
+    try:
+        job = enqueue_job(db, kind, project, user_id, params, organization_id)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Job queue is full: {e}",
+        )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=JobResponse.model_validate(job).model_dump(mode="json"),
+        headers={"Location": f"/api/jobs/{job.id}"},
+    )
+
+
+async def job_events_stream(job_id: str) -> AsyncIterator[str]:
+    # A "progress" event whenever the job's status or progress changes, then
+    # a "done" event with the finished job
+    listener = job_events.subscribe(job_id)
+    db = ThreadedSession(SessionLocal())
+    last = None
+    try:
+        while True:
+            listener.clear()
+            job = await db.get(Job, job_id, populate_existing=True)
+            if job is None:
+                yield sse_event("error", {"detail": "Job not found"})
+                return
+            if job.status in FINISHED:
+                yield sse_event(
+                    "done", JobResponse.model_validate(job).model_dump(mode="json")
+                )
+                return
+            if (job.status, job.progress) != last:
+                last = (job.status, job.progress)
+                yield sse_event("progress", {"status": job.status, "progress": job.progress})
+            await db.rollback()  # don't hold a read transaction while waiting
+            try:
+                await asyncio.wait_for(listener.wait(), settings.JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        job_events.unsubscribe(job_id, listener)
+        await db.close()
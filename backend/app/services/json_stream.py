@@ -0,0 +1,67 @@
+import json
+
+
+class JsonArrayStream:
+    # Incrementally extracts the objects of the first JSON array in a stream of
+    # text chunks, e.g. model tokens. Anything around the array (prose, code
+    # fences, a {"tasks": [...]} wrapper) is ignored, and each element object
+    # is returned by feed() as soon as its closing brace arrives.
+
+    def __init__(self):
+        self.text = ""  # everything fed so far, for whole-answer fallbacks
+        self.done = False
+        self._in_array = False
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0  # nesting depth inside the current element
+        self._element: list[str] = []
+
+    def feed(self, chunk: str) -> list[dict]:
+        self.text += chunk
+        items = []
+        for char in chunk:
+            if self.done:
+                break
+            if self._in_string:
+                if self._depth:
+                    self._element.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth:
+                    self._element.append(char)
+            elif not self._in_array:
+                if char == "[":
+                    self._in_array = True
+            elif self._depth:
+                self._element.append(char)
+                if char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if not self._depth:
+                        item = self._finish_element()
+                        if item is not None:
+                            items.append(item)
+            elif char == "{":
+                self._depth = 1
+                self._element = [char]
+            elif char == "]":
+                self.done = True
+        return items
+
+    def _finish_element(self) -> dict | None:
+        raw = "".join(self._element)
+        self._element = []
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        return item if isinstance(item, dict) else None
@@ -0,0 +1,323 @@
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.core.db import AsyncSessionLocal, async_engine, threaded_session
+from app.core.db_profile import apply_profile, engine_options
+from app.models.comment import Comment as DBComment
+from app.models.organization import Organization as DBOrganization
+from app.models.project import Project as DBProject
+from app.models.task import Task as DBTask
+from app.models.user import User as DBUser
+from app.services import migrations
+from app.services.context_builder import build_context
+from app.services.db_benchmark import read_project
+from app.services.llm_service import ChatAiService, SlotAffinity
+from app.services.retrieval import relevant_task_ids, vector_indexes
+from app.services.tokens import count_tokens
+
+IDLE_READS = 20
+# Characters per token of the stand-in model's output
+TOKEN_CHARS = 4
+# What the generated projects' tasks are about, and what is asked of them
+TOPICS = [
+    "login", "billing", "search", "export", "email",
+    "upload", "reports", "permissions", "caching", "mobile",
+]
+ACTIONS = ["Design", "Build", "Test", "Fix", "Document", "Review"]
+
+
+class SlowChatService(ChatAiService):
+    # A chat backend that answers after `delay` seconds, blocking its thread
+    # like the sync provider clients do
+    name = "benchmark"
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def _chat(self, messages: list[dict], json_mode: bool = False) -> str:
+        time.sleep(self.delay)
+        return "[]"
+
+    def _parse_tasks(self, content: str) -> list[dict]:
+        return json.loads(content)
+
+
+class TokenStreamService(ChatAiService):
+    # A chat backend that writes a JSON array of `tasks` tasks at `rate`
+    # tokens per second
+    name = "benchmark"
+
+    def __init__(self, tasks: int, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.content = json.dumps(
+            [
+                {
+                    "id": str(number),
+                    "title": f"Task {number}",
+                    "description": f"What has to be done for step {number} of the objective.",
+                }
+                for number in range(tasks)
+            ]
+        )
+
+    async def _astream(self, messages: list[dict], json_mode: bool = False):
+        for start in range(0, len(self.content), TOKEN_CHARS):
+            await asyncio.sleep(1 / self.rate)
+            yield self.content[start : start + TOKEN_CHARS]
+
+    async def _achat(self, messages: list[dict], json_mode: bool = False) -> str:
+        return "".join([token async for token in self._astream(messages, json_mode)])
+
+    def _chat(self, messages: list[dict], json_mode: bool = False) -> str:
+        return self.content
+
+    def _parse_tasks(self, content: str) -> list[dict]:
+        return json.loads(content)
+
+
+async def compare_first_task_latency(tasks: int, rate: float) -> dict[str, dict[str, float]]:
+    # Seconds until the first generated task is available and until the last,
+    # for a buffered generation and a streamed one from the same token stream
+    service = TokenStreamService(tasks, rate)
+    started = time.perf_counter()
+    await service.aget_tasks("benchmark")
+    buffered = time.perf_counter() - started
+
+    started = time.perf_counter()
+    arrivals = [
+        time.perf_counter() - started async for _ in service.stream_tasks("benchmark")
+    ]
+    return {
+        "buffered": {"first_s": buffered, "last_s": buffered},
+        "streamed": {"first_s": arrivals[0], "last_s": time.perf_counter() - started},
+    }
+
+
+async def _timed_read(project_id: str) -> float:
+    # Milliseconds for a task listing through the request handlers' sessions
+    session_factory = AsyncSessionLocal if async_engine is not None else threaded_session
+    started = time.perf_counter()
+    await read_project(session_factory, project_id)
+    return (time.perf_counter() - started) * 1000
+
+
+async def _reads_during_generation(
+    project_id: str, generations: int, delay: float, awaited: bool
+) -> list[float]:
+    # Reads the project, one request after another, for as long as the model
+    # calls are in flight
+    service = SlowChatService(delay)
+    calls = []
+
+    async def generate() -> None:
+        if awaited:
+            await service.aget_tasks("benchmark")
+        else:
+            # As the handlers did before the async interface
+            service.get_tasks("benchmark")
+
+    async def read() -> list[float]:
+        latencies = []
+        while not latencies or not all(call.done() for call in calls):
+            latencies.append(await _timed_read(project_id))
+        return latencies
+
+    # The first read is under way when the calls start
+    reads = asyncio.create_task(read())
+    await asyncio.sleep(0)
+    calls += [asyncio.create_task(generate()) for _ in range(generations)]
+    await asyncio.gather(*calls)
+    return await reads
+
+
+async def compare_read_latency_during_generation(
+    project_id: str, generations: int, delay: float
+) -> dict[str, dict[str, float]]:
+    # Task listing latency with no model calls, and while `generations` calls
+    # to a backend that takes `delay` seconds wait, awaited on the thread pool
+    # or made inline on the event loop
+    await _timed_read(project_id)
+    runs = {
+        "idle": [await _timed_read(project_id) for _ in range(IDLE_READS)],
+        "awaited": await _reads_during_generation(project_id, generations, delay, True),
+        "inline": await _reads_during_generation(project_id, generations, delay, False),
+    }
+    return {
+        name: {
+            "reads": len(latencies),
+            "median_ms": statistics.median(latencies),
+            "max_ms": max(latencies),
+        }
+        for name, latencies in runs.items()
+    }
+
+
+def _project_with_tasks(db: Session, tasks: int) -> DBProject:
+    # A project whose tasks each touch one of TOPICS, with a comment each
+    user = DBUser(username=f"benchmark-{tasks}", hashed_password="")
+    project = DBProject(
+        name=f"benchmark {tasks}",
+        description="A generated project",
+        organization=DBOrganization(name=f"benchmark {tasks}", members=[user]),
+    )
+    db.add(project)
+    db.flush()
+    for number in range(tasks):
+        topic = TOPICS[number % len(TOPICS)]
+        action = ACTIONS[number // len(TOPICS) % len(ACTIONS)]
+        task = DBTask(
+            title=f"{action} {topic} step {number}",
+            description=(
+                f"{action} the {topic} part of the product: agree on the scope "
+                f"with the team, make the change, and check that the {topic} "
+                "pages still work for existing customers."
+            ),
+            project_id=project.id,
+            assigned_user_id=user.id,
+        )
+        db.add(task)
+        db.flush()
+        db.add(
+            DBComment(
+                content=f"Waiting on the {topic} owners before going further.",
+                task_id=task.id,
+                user_id=user.id,
+            )
+        )
+    db.commit()
+    return project
+
+
+def _question_context(
+    db: Session, project: DBProject, budget: int, question: str, retrieval: bool
+) -> tuple[float, int]:
+    # Milliseconds and tokens for the context of a question, as the ask
+    # endpoints build it or with every task and no budget
+    started = time.perf_counter()
+    if retrieval:
+        relevant = relevant_task_ids(db, project.id, question)
+        _, report = build_context(
+            db, project, budget, relevant_task_ids=relevant, for_question=True
+        )
+    else:
+        _, report = build_context(db, project, 10**9, for_question=True)
+    return (time.perf_counter() - started) * 1000, report.tokens
+
+
+def compare_question_context(
+    task_counts: list[int], budget: int
+) -> dict[int, dict[str, float]]:
+    # For projects of each size: the time to build the first vector index, and
+    # the mean time and tokens of a question's context with retrieval within
+    # `budget` and with every task
+    questions = [f"What is left to do on {topic}?" for topic in TOPICS]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'context')}.db"
+        engine = apply_profile(create_engine(url, **engine_options(url)))
+        project_ids = []
+        try:
+            migrations.migrate(engine)
+            for tasks in task_counts:
+                with Session(engine) as db:
+                    project = _project_with_tasks(db, tasks)
+                    project_ids.append(project.id)
+                    started = time.perf_counter()
+                    relevant_task_ids(db, project.id, questions[0])
+                    result = {"index_build_ms": (time.perf_counter() - started) * 1000}
+                    for name, retrieval in (("retrieval", True), ("all_tasks", False)):
+                        # Untimed, so that one-off setup is not counted
+                        _question_context(db, project, budget, questions[0], retrieval)
+                        runs = [
+                            _question_context(db, project, budget, question, retrieval)
+                            for question in questions
+                        ]
+                        result[f"{name}_ms"] = statistics.mean(ms for ms, _ in runs)
+                        result[f"{name}_tokens"] = statistics.mean(tokens for _, tokens in runs)
+                    results[tasks] = result
+        finally:
+            # The indexes were written next to the real ones
+            for project_id in project_ids:
+                vector_indexes.forget(project_id)
+            engine.dispose()
+    return results
+
+
+def _shared_prefix(first: str, second: str) -> str:
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return first[:length]
+
+
+def _prompt(db: Session, project: DBProject, budget: int, question: str) -> str:
+    # The text of the messages the ask endpoint sends, in order
+    relevant = relevant_task_ids(db, project.id, question)
+    context, _ = build_context(
+        db, project, budget, relevant_task_ids=relevant, for_question=True
+    )
+    messages = SlowChatService(0)._question_messages(context, question)
+    return "".join(message["content"] for message in messages)
+
+
+def compare_prompt_prefill(
+    tasks: int, projects: int, questions: int, budget: int
+) -> dict[str, float]:
+    # Mean prompt tokens the server has to prefill per question, for
+    # questions taking turns across `projects` projects. The server is
+    # modelled as llama.cpp with cache_prompt: a slot reuses the prefix its
+    # new prompt shares with the last one it ran. Unpinned, sequential
+    # requests all land on the first idle slot.
+    asked = [f"What is left to do on {topic}?" for topic in TOPICS]
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'prefill')}.db"
+        engine = apply_profile(create_engine(url, **engine_options(url)))
+        project_ids = []
+        try:
+            migrations.migrate(engine)
+            with Session(engine) as db:
+                for number in range(projects):
+                    project = _project_with_tasks(db, tasks + number)
+                    project_ids.append(project.id)
+                prompts = [
+                    (
+                        project_ids[number % projects],
+                        _prompt(
+                            db,
+                            db.get(DBProject, project_ids[number % projects]),
+                            budget,
+                            asked[number // projects % len(asked)],
+                        ),
+                    )
+                    for number in range(questions)
+                ]
+        finally:
+            for project_id in project_ids:
+                vector_indexes.forget(project_id)
+            engine.dispose()
+    affinity = SlotAffinity(projects)
+    results = {"prompt_tokens": statistics.mean(count_tokens(p) for _, p in prompts)}
+    for name, slot_of in (
+        ("cached", lambda project_id: 0),
+        ("pinned", affinity.slot),
+    ):
+        cached: dict[int, str] = {}
+        prefilled = []
+        for project_id, prompt in prompts:
+            slot = slot_of(project_id)
+            reused = count_tokens(_shared_prefix(cached.get(slot, ""), prompt))
+            prefilled.append(count_tokens(prompt) - reused)
+            cached[slot] = prompt
+        results[f"{name}_prefill_tokens"] = statistics.mean(prefilled)
+    return results
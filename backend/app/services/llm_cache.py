@@ -0,0 +1,198 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Collection
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.change_tracking import EntityChange, on_changes
+
+
+@dataclass
+class CachedAnswer:
+    text: str
+    project_id: str | None
+    tokens: int  # estimated prompt + completion tokens a hit saves
+
+
+def response_key(*parts) -> str:
+    # Content address of a model call: identical inputs in any key order give
+    # the same key, and any change to the project data gives a new one.
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class DiskResponseStore:
+    # Second tier in a standalone SQLite file, so answers survive restarts and
+    # are shared by the worker processes of one host.
+    def __init__(self, path: str, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    project_id TEXT,
+                    value TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    expires_at REAL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_llm_responses_project_id
+                    ON llm_responses (project_id);
+                CREATE INDEX IF NOT EXISTS ix_llm_responses_last_used
+                    ON llm_responses (last_used);
+                """
+            )
+
+    def get(self, key: str) -> CachedAnswer | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT project_id, value, tokens, expires_at FROM llm_responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[3] is not None and row[3] <= now:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE llm_responses SET last_used = ? WHERE key = ?", (now, key)
+            )
+        return CachedAnswer(row[1], row[0], row[2])
+
+    def set(self, key: str, answer: CachedAnswer) -> None:
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, answer.project_id, answer.text, answer.tokens, expires_at, now),
+            )
+            self._conn.execute(
+                "DELETE FROM llm_responses WHERE expires_at <= ?", (now,)
+            )
+            self._conn.execute(
+                "DELETE FROM llm_responses WHERE key IN ("
+                "SELECT key FROM llm_responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def forget_projects(self, project_ids: Collection[str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM llm_responses WHERE project_id = ?",
+                [(project_id,) for project_id in project_ids],
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM llm_responses"
+            ).fetchone()[0]
+
+
+class LlmResponseCache:
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float | None = None,
+        disk_path: str | None = None,
+        disk_maxsize: int = 0,
+    ):
+        self.memory = TTLCache(maxsize, ttl)
+        self.disk = (
+            DiskResponseStore(disk_path, disk_maxsize, ttl) if disk_path else None
+        )
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    def get(self, key: str) -> CachedAnswer | None:
+        answer = self.memory.get(key)
+        if answer is not None:
+            self.memory_hits += 1
+        elif self.disk is not None and (answer := self.disk.get(key)) is not None:
+            self.disk_hits += 1
+            self.memory.set(key, answer)
+        else:
+            self.misses += 1
+            return None
+        self.saved_tokens += answer.tokens
+        return answer
+
+    def set(self, key: str, answer: CachedAnswer) -> None:
+        self.memory.set(key, answer)
+        if self.disk is not None:
+            self.disk.set(key, answer)
+
+    def forget_projects(self, project_ids: Collection[str]) -> None:
+        if not project_ids:
+            return
+        self.memory.discard_where(lambda key, answer: answer.project_id in project_ids)
+        if self.disk is not None:
+            self.disk.forget_projects(project_ids)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_size": len(self.memory),
+            "memory_maxsize": self.memory.maxsize,
+            "disk_size": len(self.disk) if self.disk is not None else None,
+            "disk_maxsize": self.disk.maxsize if self.disk is not None else None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+llm_response_cache = LlmResponseCache(
+    settings.LLM_CACHE_SIZE,
+    settings.LLM_CACHE_TTL_SECONDS,
+    disk_path=settings.LLM_CACHE_DB_PATH or None,
+    disk_maxsize=settings.LLM_CACHE_DB_SIZE,
+)
+
+
+@on_changes
+def _collect_changed_projects(db: Session, changes: list[EntityChange]) -> None:
+    # Keys already change with the data; this only frees the stale entries,
+    # once the transaction commits.
+    db.info.setdefault("llm_cache_changed", set()).update(
+        change.project_id for change in changes if change.project_id
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_changed_projects(session):
+    llm_response_cache.forget_projects(session.info.pop("llm_cache_changed", set()))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _keep_changed_projects(session, previous_transaction):
+    session.info.pop("llm_cache_changed", None)
@@ -0,0 +1,162 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+
+from app.core.config import settings
+
+_TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+_LATENCY_WINDOW = 200
+
+
+def is_transient(error: BaseException) -> bool:
+    # Provider errors arrive wrapped in LlmException, so the whole chain of
+    # causes is inspected
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+            return True
+        status = getattr(error, "status_code", None) or getattr(error, "code", None)
+        if status in _TRANSIENT_STATUS:
+            return True
+        if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter: uniform in [0, base * 2^(attempt - 1)], capped
+    ceiling = min(
+        settings.LLM_RETRY_MAX_DELAY_SECONDS,
+        settings.LLM_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1),
+    )
+    return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failures and then refuses calls for
+    # `reset_after` seconds. After that a single trial call is let through:
+    # its success closes the breaker, its failure opens it again.
+    def __init__(self, threshold: int, reset_after: float):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        # Like allow(), without claiming the trial call
+        return self.opened_at is None or (
+            not self._trial and time.monotonic() - self.opened_at >= self.reset_after
+        )
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self._trial = True
+            return True
+
+    def release(self) -> None:
+        # The trial call ended without an outcome, e.g. it was cancelled
+        with self._lock:
+            self._trial = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class LatencyWindow:
+    # The most recent latencies, for percentiles
+    def __init__(self, size: int = _LATENCY_WINDOW):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        return ordered[min(rank, len(ordered) - 1)]
+
+
+class BackendHealth:
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS
+        )
+        self.latency = LatencyWindow()
+        self.first_token_latency = LatencyWindow()
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.rejected = 0  # calls refused by the open breaker
+        self.hedged = 0  # calls this backend was asked to race as the hedge
+        self.hedges_won = 0
+
+    def record_success(self, seconds: float, streamed: bool = False) -> None:
+        self.successes += 1
+        (self.first_token_latency if streamed else self.latency).add(seconds)
+        self.breaker.record_success()
+
+    def record_failure(self, error: BaseException, transient: bool) -> None:
+        self.failures += 1
+        if isinstance(error, TimeoutError):
+            self.timeouts += 1
+        if transient:
+            self.breaker.record_failure()
+        else:
+            # The backend answered, if badly; that says nothing against its health
+            self.breaker.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "hedged": self.hedged,
+            "hedges_won": self.hedges_won,
+            "latency_p50_seconds": self.latency.percentile(50),
+            "latency_p95_seconds": self.latency.percentile(95),
+            "first_token_p95_seconds": self.first_token_latency.percentile(95),
+        }
+
+
+# One per configured backend, by LLM_SERVICE name
+backend_health: dict[str, BackendHealth] = {}
@@ -0,0 +1,133 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator
+
+# Set to False by callers that would rather wait than be turned away, such as
+# background job workers
+shed_load: ContextVar[bool] = ContextVar("llm_shed_load", default=True)
+
+_EWMA_WEIGHT = 0.2
+
+
+class LlmOverloaded(Exception):
+    def __init__(self, backend: str, retry_after: float):
+        self.backend = backend
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{backend} is overloaded, retry in {self.retry_after}s")
+
+
+class LlmScheduler:
+    # Admits at most `max_in_flight` concurrent calls to one backend. Waiting
+    # callers are queued per organization and a freed slot goes to the next
+    # organization in turn, so one busy organization cannot starve the rest.
+    # A caller whose estimated wait exceeds `max_wait` is turned away at once.
+    def __init__(self, backend: str, max_in_flight: int, max_wait: float, max_queued: int):
+        self.backend = backend
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self.max_queued = max_queued
+        self.in_flight = 0
+        self._waiters: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self._queued = 0
+        self.service_time = 0.0  # moving average, seconds
+        self.calls = 0
+        self.rejected = 0
+        self.waited = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def estimated_wait(self) -> float:
+        if self.in_flight < self.max_in_flight and not self._queued:
+            return 0.0
+        return (self._queued + 1) / self.max_in_flight * self.service_time
+
+    def admit(self) -> None:
+        # Raises instead of queueing a caller that would wait too long
+        if not shed_load.get():
+            return
+        wait = self.estimated_wait()
+        if self._queued >= self.max_queued or wait > self.max_wait:
+            self.rejected += 1
+            raise LlmOverloaded(self.backend, wait or self.service_time)
+
+    async def _acquire(self, organization_id: str) -> None:
+        if self.in_flight < self.max_in_flight and not self._queued:
+            self.in_flight += 1
+            return
+        self.admit()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(organization_id, deque()).append(waiter)
+        self._queued += 1
+        started = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the caller gave up
+                self._release()
+            else:
+                self._remove(organization_id, waiter)
+            raise
+        waited = time.monotonic() - started
+        self.waited += 1
+        self.wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+
+    def _remove(self, organization_id: str, waiter: asyncio.Future) -> None:
+        queue = self._waiters.get(organization_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._waiters[organization_id]
+
+    def _release(self) -> None:
+        # Hands the slot straight to the next organization's oldest waiter
+        while self._waiters:
+            organization_id, queue = next(iter(self._waiters.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._waiters.move_to_end(organization_id)
+            else:
+                del self._waiters[organization_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, organization_id: str | None) -> AsyncIterator[None]:
+        await self._acquire(organization_id or "")
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.calls += 1
+            self.service_time = (
+                elapsed
+                if self.calls == 1
+                else (1 - _EWMA_WEIGHT) * self.service_time + _EWMA_WEIGHT * elapsed
+            )
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued": self._queued,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "average_service_seconds": self.service_time,
+            "average_wait_seconds": self.wait_time / self.waited if self.waited else 0.0,
+            "max_wait_seconds": self.max_wait_time,
+        }
+
+
+# One scheduler per configured backend, by LLM_SERVICE name
+llm_schedulers: dict[str, LlmScheduler] = {}
@@ -1,10 +1,62 @@
+import asyncio
 import ollama
 import openai
 import google.generativeai as genai
 import json
 import re
-from functools import lru_cache
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import lru_cache, partial
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
+from app.core.permissions import get_project_organization_id
+from app.services.json_stream import JsonArrayStream
+from app.services.tokens import count_tokens
+from app.services.llm_cache import (
+    CachedAnswer,
+    LlmResponseCache,
+    llm_response_cache,
+    response_key,
+)
+from app.services.llm_scheduler import LlmOverloaded, LlmScheduler, llm_schedulers
+from app.services.single_flight import SingleFlight, llm_single_flight
+from app.services.llm_resilience import (
+    BackendHealth,
+    backend_health,
+    backoff_delay,
+    is_transient,
+)
+
+
+SUMMARY_SYSTEM_PROMPT = "You are a project manager. Your task is to provide a summary of the project status. Return the summary as a single string in Markdown format."
+QUESTION_SYSTEM_PROMPT = "You are a project manager. Your task is to answer questions about the project based on the provided data. Answer in Markdown format."
+
+# Sync-only backends are driven from this pool so that awaiting them never
+# blocks the event loop; its size caps how many such calls run at once.
+_sync_executor = ThreadPoolExecutor(
+    max_workers=settings.LLM_THREAD_POOL_SIZE, thread_name_prefix="llm"
+)
+
+# The project the current request asks the model about, set by use_project.
+# Cached answers are filed under it.
+current_project_id: ContextVar[str | None] = ContextVar(
+    "current_project_id", default=None
+)
+# Its organization, by which the scheduler shares a busy backend out fairly
+current_organization_id: ContextVar[str | None] = ContextVar(
+    "current_organization_id", default=None
+)
+
+
+def project_cache_option(name: str, default: bool | str) -> bool | str:
+    # The current project's prompt-cache option, else the global setting
+    options = settings.PROMPT_CACHE_PROJECTS.get(current_project_id.get(), {})
+    return options.get(name, default)
 
 
 class LlmException(Exception):
@@ -16,244 +68,1092 @@ class LlmException(Exception):
 
 
 class AiService:
+    model_id = "dummy"
+
     def __init__(self):
         pass
 
+    @property
+    def provider(self) -> str:
+        # The backend behind any wrappers
+        return type(self).__name__
+
+    def admit(self) -> None:
+        # Raises LlmOverloaded when a call now would wait too long
+        pass
+
     def get_tasks(self, prompt: str) -> list[dict]:
         return []
 
-    def get_summary(self, project_data: dict) -> str:
+    def get_summary(self, context: str) -> str:
         return "This is a dummy summary."
 
-    def ask_question(self, project_data: dict, question: str) -> str:
+    def ask_question(self, context: str, question: str) -> str:
         return "This is a dummy answer."
 
+    def converse(self, context: str, turns: list[dict]) -> str:
+        # turns are the conversation's {"role", "content"} messages, ending
+        # with the user's latest one
+        return "This is a dummy answer."
 
-class OllamaService(AiService):
-    def __init__(self, host="http://127.0.0.1:11434", model="gemma3:1b"):
-        super().__init__()
-        self.model = model
-        self.host = host
-        self.client = ollama.Client(host=host)
+    async def run_sync(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_sync_executor, partial(func, *args))
+
+    async def aget_tasks(self, prompt: str) -> list[dict]:
+        return await self.run_sync(self.get_tasks, prompt)
+
+    async def aget_summary(self, context: str) -> str:
+        return await self.run_sync(self.get_summary, context)
+
+    async def aask_question(self, context: str, question: str) -> str:
+        return await self.run_sync(self.ask_question, context, question)
+
+    async def aconverse(self, context: str, turns: list[dict]) -> str:
+        return await self.run_sync(self.converse, context, turns)
+
+    # Streams. Backends without streaming yield the whole answer at once.
+    async def stream_tasks(self, prompt: str) -> AsyncIterator[dict]:
+        for task in await self.aget_tasks(prompt):
+            yield task
+
+    async def stream_summary(self, context: str) -> AsyncIterator[str]:
+        yield await self.aget_summary(context)
+
+    async def stream_answer(
+        self, context: str, question: str
+    ) -> AsyncIterator[str]:
+        yield await self.aask_question(context, question)
+
+    async def stream_conversation(
+        self, context: str, turns: list[dict]
+    ) -> AsyncIterator[str]:
+        yield await self.aconverse(context, turns)
+
+
+class ChatAiService(AiService, ABC):
+    # Base for chat-completion providers. Subclasses implement _chat/_achat for
+    # a list of {"role", "content"} messages and _parse_tasks for their output.
+    name = "LLM"
+    tasks_system_prompt = "You are a project manager. Your task is to break down an objective into a list of tasks. Return the tasks as a JSON array of objects with the following keys: id, title, description."
+
+    @abstractmethod
+    def _chat(self, messages: list[dict], json_mode: bool = False) -> str:
+        ...
+
+    async def _achat(self, messages: list[dict], json_mode: bool = False) -> str:
+        return await self.run_sync(self._chat, messages, json_mode)
+
+    async def _astream(
+        self, messages: list[dict], json_mode: bool = False
+    ) -> AsyncIterator[str]:
+        yield await self._achat(messages, json_mode)
+
+    @abstractmethod
+    def _parse_tasks(self, content: str) -> list[dict]:
+        ...
+
+    def _tasks_messages(self, prompt: str) -> list[dict]:
+        return [
+            {"role": "system", "content": self.tasks_system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+
+    def _summary_messages(self, context: str) -> list[dict]:
+        return [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": context},
+        ]
+
+    def _conversation_messages(self, context: str, turns: list[dict]) -> list[dict]:
+        # The context goes in the system message, so each turn of a
+        # conversation extends the same prompt prefix, which also starts like
+        # that of a single question about the project
+        return [
+            {"role": "system", "content": f"{QUESTION_SYSTEM_PROMPT}\n\nContext:\n{context}"},
+            *turns,
+        ]
+
+    def _question_messages(self, context: str, question: str) -> list[dict]:
+        return self._conversation_messages(
+            context, [{"role": "user", "content": question}]
+        )
+
+    def _error(self, e: Exception) -> LlmException:
+        return LlmException(f"{self.name} API error: {e}")
 
     def get_tasks(self, prompt: str) -> list[dict]:
         try:
-            response = self.client.chat(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a project manager. Your task is to break down an objective into a list of tasks. Return the tasks as a JSON array of objects with the following keys: id, title, description.",
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    },
-                ],
-                format="json",
-            )
+            content = self._chat(self._tasks_messages(prompt), json_mode=True)
         except Exception as e:
-            raise LlmException("Ollama API error: " + e)
+            raise self._error(e)
+        return self._parse_tasks(content)
 
-        tasks_json = json.loads(response["message"]["content"])
-        tasks = [tasks_json] if "tasks" not in tasks_json else tasks_json["tasks"]
-        return tasks
+    def get_summary(self, context: str) -> str:
+        try:
+            return self._chat(self._summary_messages(context))
+        except Exception as e:
+            raise self._error(e)
 
-    def get_summary(self, project_data: dict) -> str:
+    def ask_question(self, context: str, question: str) -> str:
         try:
-            response = self.client.chat(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a project manager. Your task is to provide a summary of the project status. Return the summary as a single string in Markdown format.",
-                    },
-                    {
-                        "role": "user",
-                        "content": json.dumps(project_data),
-                    },
-                ],
-            )
+            return self._chat(self._question_messages(context, question))
         except Exception as e:
-            raise LlmException("Ollama API error: " + e)
+            raise self._error(e)
 
-        return response["message"]["content"]
+    def converse(self, context: str, turns: list[dict]) -> str:
+        try:
+            return self._chat(self._conversation_messages(context, turns))
+        except Exception as e:
+            raise self._error(e)
 
-    def ask_question(self, project_data: dict, question: str) -> str:
+    async def aget_tasks(self, prompt: str) -> list[dict]:
         try:
-            response = self.client.chat(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a project manager. Your task is to answer questions about the project based on the provided data. Answer in Markdown format.",
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Context:\n{json.dumps(project_data)}\n\nQuestion: {question}",
-                    },
-                ],
-            )
+            content = await self._achat(self._tasks_messages(prompt), json_mode=True)
+        except Exception as e:
+            raise self._error(e)
+        return self._parse_tasks(content)
+
+    async def aget_summary(self, context: str) -> str:
+        try:
+            return await self._achat(self._summary_messages(context))
+        except Exception as e:
+            raise self._error(e)
+
+    async def aask_question(self, context: str, question: str) -> str:
+        try:
+            return await self._achat(self._question_messages(context, question))
+        except Exception as e:
+            raise self._error(e)
+
+    async def aconverse(self, context: str, turns: list[dict]) -> str:
+        try:
+            return await self._achat(self._conversation_messages(context, turns))
         except Exception as e:
-            raise LlmException("Ollama API error: " + e)
+            raise self._error(e)
+
+    async def _stream(
+        self, messages: list[dict], json_mode: bool = False
+    ) -> AsyncIterator[str]:
+        tokens = self._astream(messages, json_mode)
+        try:
+            async for token in tokens:
+                yield token
+        except Exception as e:
+            raise self._error(e)
+        finally:
+            # Also runs when the consumer is cancelled, e.g. on client
+            # disconnect, so the provider's HTTP stream is released at once.
+            await tokens.aclose()
+
+    async def stream_tasks(self, prompt: str) -> AsyncIterator[dict]:
+        # Each task is yielded as soon as its object is complete in the token
+        # stream, long before the model finishes the whole array.
+        parser = JsonArrayStream()
+        emitted = False
+        async for token in self._stream(self._tasks_messages(prompt), json_mode=True):
+            for task in parser.feed(token):
+                emitted = True
+                yield task
+        if not emitted:
+            # No array in the answer, e.g. a single bare object in JSON mode
+            for task in self._parse_tasks(parser.text):
+                yield task
+
+    async def stream_summary(self, context: str) -> AsyncIterator[str]:
+        async for token in self._stream(self._summary_messages(context)):
+            yield token
+
+    async def stream_answer(
+        self, context: str, question: str
+    ) -> AsyncIterator[str]:
+        async for token in self._stream(self._question_messages(context, question)):
+            yield token
+
+    async def stream_conversation(
+        self, context: str, turns: list[dict]
+    ) -> AsyncIterator[str]:
+        async for token in self._stream(self._conversation_messages(context, turns)):
+            yield token
 
+
+class OllamaService(ChatAiService):
+    name = "Ollama"
+
+    def __init__(
+        self,
+        host="http://127.0.0.1:11434",
+        model="gemma3:1b",
+        timeout: float | None = None,
+    ):
+        super().__init__()
+        self.model = model
+        self.model_id = model
+        self.host = host
+        self.client = ollama.Client(host=host, timeout=timeout)
+        self.async_client = ollama.AsyncClient(host=host, timeout=timeout)
+
+    def _chat_args(self, messages: list[dict], json_mode: bool) -> dict:
+        # keep_alive keeps the model, and with it the KV cache of the last
+        # prompt, loaded between questions
+        return {
+            "model": self.model,
+            "messages": messages,
+            "format": "json" if json_mode else None,
+            "keep_alive": project_cache_option("keep_alive", settings.OLLAMA_KEEP_ALIVE),
+        }
+
+    def _chat(self, messages: list[dict], json_mode: bool = False) -> str:
+        response = self.client.chat(**self._chat_args(messages, json_mode))
+        return response["message"]["content"]
+
+    async def _achat(self, messages: list[dict], json_mode: bool = False) -> str:
+        response = await self.async_client.chat(**self._chat_args(messages, json_mode))
         return response["message"]["content"]
 
+    async def _astream(
+        self, messages: list[dict], json_mode: bool = False
+    ) -> AsyncIterator[str]:
+        parts = await self.async_client.chat(
+            **self._chat_args(messages, json_mode), stream=True
+        )
+        try:
+            async for part in parts:
+                yield part["message"]["content"]
+        finally:
+            await parts.aclose()
+
+    def _parse_tasks(self, content: str) -> list[dict]:
+        tasks_json = json.loads(content)
+        tasks = [tasks_json] if "tasks" not in tasks_json else tasks_json["tasks"]
+        return tasks
+
+
+class SlotAffinity:
+    # Gives each project a server slot of its own while it is active, taking
+    # the least recently used project's slot when all are in use, so that
+    # active projects do not evict one another's cached prompt.
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._assigned: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def slot(self, project_id: str) -> int:
+        with self._lock:
+            if project_id in self._assigned:
+                self._assigned.move_to_end(project_id)
+            elif len(self._assigned) < self.slots:
+                self._assigned[project_id] = len(self._assigned)
+            else:
+                _, slot = self._assigned.popitem(last=False)
+                self._assigned[project_id] = slot
+            return self._assigned[project_id]
+
+
+class OpenAIService(ChatAiService):
+    name = "OpenAI"
+    tasks_system_prompt = (
+        "You are a project manager. Break down the objective into a list of tasks. "
+        "Return ONLY a **valid JSON array** of objects with id, title, description. "
+        "Make sure each object is comma-separated except for the last item, and the output is valid JSON."
+    )
 
-class OpenAIService(AiService):
     def __init__(
         self,
         base_url="http://localhost:8012/v1/",
         model="gemma-3-1b-it-Q2_K.gguf",
         api_key="llama",
+        timeout: float | None = None,
     ):
         super().__init__()
         self.base_url = base_url
         self.model = model
+        self.model_id = model
         self.api_key = api_key
-        openai.base_url = base_url
-        openai.api_key = self.api_key
-
-    def get_tasks(self, prompt: str) -> list[dict]:
-        try:
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a project manager. Break down the objective into a list of tasks. "
-                            "Return ONLY a **valid JSON array** of objects with id, title, description. "
-                            "Make sure each object is comma-separated except for the last item, and the output is valid JSON."
-                        ),
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    },
-                ],
-                response_format="json",
-            )
-        except Exception as e:
-            raise LlmException("OpenAI API error: " + str(e))
+        self.slots = SlotAffinity(settings.LLAMACPP_SLOTS) if settings.LLAMACPP_SLOTS else None
+        # Retries are left to GuardedAiService
+        self.client = openai.OpenAI(
+            base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0
+        )
+        self.async_client = openai.AsyncOpenAI(
+            base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0
+        )
 
-        try:
-            content = response.choices[0].message.content
-            match = re.search(r"```json\s*(\[.*?\])\s*```", content, re.DOTALL)
-            if match:
-                json_str = match.group(1)
-                try:
-                    tasks = json.loads(json_str)
-                    return tasks
-                except json.JSONDecodeError as e:
-                    raise LlmException("Failed to parse JSON:" + e)
-            else:
-                raise LlmException("No JSON block found.")
-        except (KeyError, json.JSONDecodeError) as e:
-            raise LlmException("Failed to parse OpenAI response: " + str(e))
+    def _completion_args(self, messages: list[dict], json_mode: bool) -> dict:
+        args = {"model": self.model, "messages": messages}
+        if json_mode:
+            args["response_format"] = "json"
+        if project_cache_option("cache_prompt", settings.LLAMACPP_CACHE_PROMPT):
+            # llama.cpp server: reuse the slot's KV cache for the prompt prefix
+            # it shares with the previous request, and send each project's
+            # requests to the same slot so that its context is the one cached
+            options = {"cache_prompt": True}
+            project_id = current_project_id.get()
+            if self.slots and project_id and project_cache_option("pin_slot", True):
+                options["id_slot"] = self.slots.slot(project_id)
+            args["extra_body"] = options
+        return args
 
-    def get_summary(self, project_data: dict) -> str:
-        try:
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a project manager. Your task is to provide a summary of the project status. Return the summary as a single string in Markdown format.",
-                    },
-                    {
-                        "role": "user",
-                        "content": json.dumps(project_data),
-                    },
-                ],
-            )
-        except Exception as e:
-            raise LlmException("OpenAI API error: " + str(e))
+    def _chat(self, messages: list[dict], json_mode: bool = False) -> str:
+        response = self.client.chat.completions.create(
+            **self._completion_args(messages, json_mode)
+        )
+        return response.choices[0].message.content
 
+    async def _achat(self, messages: list[dict], json_mode: bool = False) -> str:
+        response = await self.async_client.chat.completions.create(
+            **self._completion_args(messages, json_mode)
+        )
         return response.choices[0].message.content
 
-    def ask_question(self, project_data: dict, question: str) -> str:
+    async def _astream(
+        self, messages: list[dict], json_mode: bool = False
+    ) -> AsyncIterator[str]:
+        stream = await self.async_client.chat.completions.create(
+            **self._completion_args(messages, json_mode), stream=True
+        )
         try:
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a project manager. Your task is to answer questions about the project based on the provided data. Answer in Markdown format.",
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Context:\n{json.dumps(project_data)}\n\nQuestion: {question}",
-                    },
-                ],
-            )
-        except Exception as e:
-            raise LlmException("OpenAI API error: " + str(e))
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    def _parse_tasks(self, content: str) -> list[dict]:
+        match = re.search(r"```json\s*(\[.*?\])\s*```", content, re.DOTALL)
+        if not match:
+            raise LlmException("No JSON block found.")
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError as e:
+            raise LlmException("Failed to parse OpenAI response: " + str(e))
 
-        return response.choices[0].message.content
 
+class GeminiService(ChatAiService):
+    name = "Gemini"
+    tasks_system_prompt = (
+        "You are a project manager. Break down the objective into a list of tasks. "
+        "Return ONLY a **valid JSON array** of objects with id, title, description. "
+        "Ensure it is valid JSON, with commas between objects (except the last one). "
+        "Wrap the output in triple backticks and json (```json ... ```)."
+    )
 
-class GeminiService:
-    def __init__(self, api_key: str, model: str = "gemini-2.0-flash"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gemini-2.0-flash",
+        timeout: float | None = None,
+    ):
+        super().__init__()
         self.api_key = api_key
         self.model_name = model
+        self.model_id = model
+        self.request_options = {"timeout": timeout} if timeout else {}
         genai.configure(api_key=self.api_key)
         self.model = genai.GenerativeModel(model)
 
-    def get_tasks(self, prompt: str) -> list[dict]:
+    def _prompt(self, messages: list[dict]) -> str:
+        return "\n\n".join(message["content"] for message in messages)
+
+    def _chat(self, messages: list[dict], json_mode: bool = False) -> str:
+        response = self.model.generate_content(
+            self._prompt(messages), request_options=self.request_options
+        )
+        return response.text.strip()
+
+    async def _achat(self, messages: list[dict], json_mode: bool = False) -> str:
+        response = await self.model.generate_content_async(
+            self._prompt(messages), request_options=self.request_options
+        )
+        return response.text.strip()
+
+    async def _astream(
+        self, messages: list[dict], json_mode: bool = False
+    ) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(
+            self._prompt(messages), stream=True, request_options=self.request_options
+        )
+        async for chunk in response:
+            yield chunk.text
+
+    def _parse_tasks(self, content: str) -> list[dict]:
+        match = re.search(r"```json\s*(\[\s*{.*?}\s*])\s*```", content, re.DOTALL)
+        if not match:
+            raise LlmException("No valid JSON block found in Gemini response.")
         try:
-            system_message = (
-                "You are a project manager. Break down the objective into a list of tasks. "
-                "Return ONLY a **valid JSON array** of objects with id, title, description. "
-                "Ensure it is valid JSON, with commas between objects (except the last one). "
-                "Wrap the output in triple backticks and json (```json ... ```)."
-            )
+            return json.loads(match.group(1))
+        except json.JSONDecodeError as e:
+            raise LlmException("Failed to parse JSON: " + str(e))
 
-            full_prompt = f"{system_message}\n\n{prompt}"
-            response = self.model.generate_content(full_prompt)
 
-            content = response.text.strip()
+class AiServiceWrapper(AiService):
+    # Passes every call through to the wrapped service; subclasses override
+    # the calls they add behaviour to.
+    def __init__(self, service: AiService):
+        super().__init__()
+        self.service = service
+        self.model_id = service.model_id
+
+    @property
+    def provider(self) -> str:
+        return self.service.provider
+
+    def admit(self) -> None:
+        self.service.admit()
+
+    def get_tasks(self, prompt: str) -> list[dict]:
+        return self.service.get_tasks(prompt)
+
+    def get_summary(self, context: str) -> str:
+        return self.service.get_summary(context)
+
+    def ask_question(self, context: str, question: str) -> str:
+        return self.service.ask_question(context, question)
+
+    def converse(self, context: str, turns: list[dict]) -> str:
+        return self.service.converse(context, turns)
+
+    async def aget_tasks(self, prompt: str) -> list[dict]:
+        return await self.service.aget_tasks(prompt)
+
+    async def aget_summary(self, context: str) -> str:
+        return await self.service.aget_summary(context)
+
+    async def aask_question(self, context: str, question: str) -> str:
+        return await self.service.aask_question(context, question)
+
+    async def aconverse(self, context: str, turns: list[dict]) -> str:
+        return await self.service.aconverse(context, turns)
+
+    async def stream_tasks(self, prompt: str) -> AsyncIterator[dict]:
+        async for task in self.service.stream_tasks(prompt):
+            yield task
+
+    async def stream_summary(self, context: str) -> AsyncIterator[str]:
+        async for token in self.service.stream_summary(context):
+            yield token
+
+    async def stream_answer(
+        self, context: str, question: str
+    ) -> AsyncIterator[str]:
+        async for token in self.service.stream_answer(context, question):
+            yield token
+
+    async def stream_conversation(
+        self, context: str, turns: list[dict]
+    ) -> AsyncIterator[str]:
+        async for token in self.service.stream_conversation(context, turns):
+            yield token
+
+
+class CachedAiService(AiServiceWrapper):
+    # Answers summaries and questions about unchanged project data from the
+    # response cache. Task generation always reaches the model.
+    def __init__(self, service: AiService, cache: LlmResponseCache):
+        super().__init__(service)
+        self.cache = cache
+        self.identity = (service.provider, service.model_id)
+
+    def _entry(
+        self, system_prompt: str, context: str, question: str | None = None
+    ) -> tuple[str, int]:
+        key = response_key(*self.identity, system_prompt, context, question)
+        return key, count_tokens(system_prompt + context + (question or ""))
+
+    def _lookup(self, key: str) -> str | None:
+        answer = self.cache.get(key)
+        return answer.text if answer is not None else None
+
+    def _store(self, key: str, prompt_tokens: int, text: str):
+        self.cache.set(
+            key,
+            CachedAnswer(
+                text, current_project_id.get(), prompt_tokens + count_tokens(text)
+            ),
+        )
+
+    def get_summary(self, context: str) -> str:
+        key, tokens = self._entry(SUMMARY_SYSTEM_PROMPT, context)
+        text = self._lookup(key)
+        if text is None:
+            text = self.service.get_summary(context)
+            self._store(key, tokens, text)
+        return text
+
+    def ask_question(self, context: str, question: str) -> str:
+        key, tokens = self._entry(QUESTION_SYSTEM_PROMPT, context, question)
+        text = self._lookup(key)
+        if text is None:
+            text = self.service.ask_question(context, question)
+            self._store(key, tokens, text)
+        return text
+
+    async def aget_summary(self, context: str) -> str:
+        key, tokens = self._entry(SUMMARY_SYSTEM_PROMPT, context)
+        text = self._lookup(key)
+        if text is None:
+            text = await self.service.aget_summary(context)
+            self._store(key, tokens, text)
+        return text
+
+    async def aask_question(self, context: str, question: str) -> str:
+        key, tokens = self._entry(QUESTION_SYSTEM_PROMPT, context, question)
+        text = self._lookup(key)
+        if text is None:
+            text = await self.service.aask_question(context, question)
+            self._store(key, tokens, text)
+        return text
+
+    async def _cached_stream(
+        self, key: str, tokens: int, stream: AsyncIterator[str]
+    ) -> AsyncIterator[str]:
+        text = self._lookup(key)
+        if text is not None:
+            yield text
+            return
+        parts = []
+        async for token in stream:
+            parts.append(token)
+            yield token
+        # Only complete answers are stored; an interrupted stream never gets here
+        self._store(key, tokens, "".join(parts))
+
+    async def stream_summary(self, context: str) -> AsyncIterator[str]:
+        key, tokens = self._entry(SUMMARY_SYSTEM_PROMPT, context)
+        async for token in self._cached_stream(
+            key, tokens, self.service.stream_summary(context)
+        ):
+            yield token
+
+    async def stream_answer(
+        self, context: str, question: str
+    ) -> AsyncIterator[str]:
+        key, tokens = self._entry(QUESTION_SYSTEM_PROMPT, context, question)
+        async for token in self._cached_stream(
+            key, tokens, self.service.stream_answer(context, question)
+        ):
+            yield token
+
 
-            match = re.search(r"```json\s*(\[\s*{.*?}\s*])\s*```", content, re.DOTALL)
-            if match:
-                json_str = match.group(1)
+class ScheduledAiService(AiServiceWrapper):
+    # Queues async calls to a backend behind its scheduler. A stream holds its
+    # slot until it ends. Sync calls are bounded by the thread pool instead.
+    def __init__(self, service: AiService, scheduler: LlmScheduler):
+        super().__init__(service)
+        self.scheduler = scheduler
+
+    def admit(self) -> None:
+        self.scheduler.admit()
+
+    def _slot(self):
+        return self.scheduler.slot(current_organization_id.get())
+
+    async def aget_tasks(self, prompt: str) -> list[dict]:
+        async with self._slot():
+            return await self.service.aget_tasks(prompt)
+
+    async def aget_summary(self, context: str) -> str:
+        async with self._slot():
+            return await self.service.aget_summary(context)
+
+    async def aask_question(self, context: str, question: str) -> str:
+        async with self._slot():
+            return await self.service.aask_question(context, question)
+
+    async def aconverse(self, context: str, turns: list[dict]) -> str:
+        async with self._slot():
+            return await self.service.aconverse(context, turns)
+
+    async def _scheduled(self, stream: AsyncIterator) -> AsyncIterator:
+        async with self._slot():
+            try:
+                async for item in stream:
+                    yield item
+            finally:
+                await stream.aclose()
+
+    async def stream_tasks(self, prompt: str) -> AsyncIterator[dict]:
+        async for task in self._scheduled(self.service.stream_tasks(prompt)):
+            yield task
+
+    async def stream_summary(self, context: str) -> AsyncIterator[str]:
+        async for token in self._scheduled(self.service.stream_summary(context)):
+            yield token
+
+    async def stream_answer(
+        self, context: str, question: str
+    ) -> AsyncIterator[str]:
+        async for token in self._scheduled(
+            self.service.stream_answer(context, question)
+        ):
+            yield token
+
+    async def stream_conversation(
+        self, context: str, turns: list[dict]
+    ) -> AsyncIterator[str]:
+        async for token in self._scheduled(
+            self.service.stream_conversation(context, turns)
+        ):
+            yield token
+
+
+class CoalescingAiService(AiServiceWrapper):
+    # Identical summaries and questions asked at the same time share one model
+    # call. The context is the project's current state, so equal keys mean
+    # equal answers. Streams and task generation are not shared.
+    def __init__(self, service: AiService, flights: SingleFlight):
+        super().__init__(service)
+        self.flights = flights
+
+    def _key(self, operation: str, *parts: str) -> str:
+        return response_key(self.provider, self.model_id, operation, *parts)
+
+    def get_summary(self, context: str) -> str:
+        return self.flights.run_sync(
+            self._key("summary", context), partial(self.service.get_summary, context)
+        )
+
+    def ask_question(self, context: str, question: str) -> str:
+        return self.flights.run_sync(
+            self._key("question", context, question),
+            partial(self.service.ask_question, context, question),
+        )
+
+    async def aget_summary(self, context: str) -> str:
+        return await self.flights.run(
+            self._key("summary", context), partial(self.service.aget_summary, context)
+        )
+
+    async def aask_question(self, context: str, question: str) -> str:
+        return await self.flights.run(
+            self._key("question", context, question),
+            partial(self.service.aask_question, context, question),
+        )
+
+
+T = TypeVar("T")
+
+
+class GuardedAiService(AiServiceWrapper):
+    # One backend's calls under a deadline and behind its circuit breaker,
+    # retried with jittered exponential backoff on transient errors. Streams
+    # are retried until their first chunk; the deadline then applies to each
+    # gap between chunks.
+    def __init__(self, service: AiService, health: BackendHealth):
+        super().__init__(service)
+        self.health = health
+
+    def _check_breaker(self) -> None:
+        if not self.health.breaker.allow():
+            self.health.rejected += 1
+            raise LlmException(f"{self.health.name} is unavailable (circuit open)")
+
+    def _retry(self, error: Exception, attempt: int) -> bool:
+        # Records the failure and tells whether to try again
+        transient = isinstance(error, TimeoutError) or is_transient(error)
+        self.health.record_failure(error, transient)
+        if (
+            transient
+            and attempt < settings.LLM_RETRIES
+            and self.health.breaker.allow()
+        ):
+            self.health.retries += 1
+            return True
+        return False
+
+    def _error(self, error: Exception) -> LlmException:
+        if isinstance(error, LlmException):
+            return error
+        if isinstance(error, TimeoutError):
+            return LlmException(
+                f"{self.health.name} timed out after {settings.LLM_TIMEOUT_SECONDS}s"
+            )
+        return LlmException(f"{self.health.name} error: {error}")
+
+    async def _call(self, call: Callable[[], Awaitable[T]]) -> T:
+        self._check_breaker()
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                async with asyncio.timeout(settings.LLM_TIMEOUT_SECONDS):
+                    result = await call()
+            except asyncio.CancelledError:
+                self.health.breaker.release()
+                raise
+            except Exception as e:
+                if not self._retry(e, attempt):
+                    raise self._error(e)
+                attempt += 1
                 try:
-                    tasks = json.loads(json_str)
-                    return tasks
-                except json.JSONDecodeError as e:
-                    raise LlmException("Failed to parse JSON: " + str(e))
-            else:
-                raise LlmException("No valid JSON block found in Gemini response.")
-        except Exception as e:
-            raise LlmException("Gemini API error: " + str(e))
+                    await asyncio.sleep(backoff_delay(attempt))
+                except asyncio.CancelledError:
+                    self.health.breaker.release()
+                    raise
+                continue
+            self.health.record_success(time.monotonic() - started)
+            return result
+
+    def _call_sync(self, call: Callable[[], T]) -> T:
+        # The providers' clients enforce the deadline on sync calls
+        self._check_breaker()
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                result = call()
+            except Exception as e:
+                if not self._retry(e, attempt):
+                    raise self._error(e)
+                attempt += 1
+                time.sleep(backoff_delay(attempt))
+                continue
+            self.health.record_success(time.monotonic() - started)
+            return result
 
-    def get_summary(self, project_data: dict) -> str:
+    async def _stream(self, open_stream: Callable[[], AsyncIterator]) -> AsyncIterator:
+        self._check_breaker()
+        attempt = 0
+        while True:
+            stream = open_stream()
+            started = time.monotonic()
+            try:
+                async with asyncio.timeout(settings.LLM_TIMEOUT_SECONDS):
+                    first = await anext(stream)
+            except StopAsyncIteration:
+                self.health.record_success(time.monotonic() - started, streamed=True)
+                return
+            except asyncio.CancelledError:
+                self.health.breaker.release()
+                await stream.aclose()
+                raise
+            except Exception as e:
+                await stream.aclose()
+                if not self._retry(e, attempt):
+                    raise self._error(e)
+                attempt += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            break
+
+        self.health.record_success(time.monotonic() - started, streamed=True)
         try:
-            full_prompt = f"You are a project manager. Your task is to provide a summary of the project status. Return the summary as a single string in Markdown format.\n\n{json.dumps(project_data)}"
-            response = self.model.generate_content(full_prompt)
-            return response.text.strip()
+            yield first
+            while True:
+                try:
+                    async with asyncio.timeout(settings.LLM_TIMEOUT_SECONDS):
+                        item = await anext(stream)
+                except StopAsyncIteration:
+                    return
+                yield item
         except Exception as e:
-            raise LlmException("Gemini API error: " + str(e))
+            self.health.record_failure(e, isinstance(e, TimeoutError) or is_transient(e))
+            raise self._error(e)
+        finally:
+            await stream.aclose()
+
+    def get_tasks(self, prompt: str) -> list[dict]:
+        return self._call_sync(partial(self.service.get_tasks, prompt))
+
+    def get_summary(self, context: str) -> str:
+        return self._call_sync(partial(self.service.get_summary, context))
+
+    def ask_question(self, context: str, question: str) -> str:
+        return self._call_sync(partial(self.service.ask_question, context, question))
+
+    def converse(self, context: str, turns: list[dict]) -> str:
+        return self._call_sync(partial(self.service.converse, context, turns))
+
+    async def aget_tasks(self, prompt: str) -> list[dict]:
+        return await self._call(partial(self.service.aget_tasks, prompt))
+
+    async def aget_summary(self, context: str) -> str:
+        return await self._call(partial(self.service.aget_summary, context))
+
+    async def aask_question(self, context: str, question: str) -> str:
+        return await self._call(partial(self.service.aask_question, context, question))
+
+    async def aconverse(self, context: str, turns: list[dict]) -> str:
+        return await self._call(partial(self.service.aconverse, context, turns))
 
-    def ask_question(self, project_data: dict, question: str) -> str:
+    async def stream_tasks(self, prompt: str) -> AsyncIterator[dict]:
+        async for task in self._stream(partial(self.service.stream_tasks, prompt)):
+            yield task
+
+    async def stream_summary(self, context: str) -> AsyncIterator[str]:
+        async for token in self._stream(
+            partial(self.service.stream_summary, context)
+        ):
+            yield token
+
+    async def stream_answer(
+        self, context: str, question: str
+    ) -> AsyncIterator[str]:
+        async for token in self._stream(
+            partial(self.service.stream_answer, context, question)
+        ):
+            yield token
+
+    async def stream_conversation(
+        self, context: str, turns: list[dict]
+    ) -> AsyncIterator[str]:
+        async for token in self._stream(
+            partial(self.service.stream_conversation, context, turns)
+        ):
+            yield token
+
+
+class RoutedAiService(AiService):
+    # Tries the backends in order, skipping those whose breaker is open and
+    # falling back to the next one when a call fails or the backend is
+    # saturated. A stream can only fall back before it has produced anything.
+    # With LLM_HEDGE_PERCENTILE set, a call to the first backend that runs
+    # longer than that percentile of its latency is raced against the next.
+    def __init__(self, backends: list[tuple[AiService, BackendHealth]]):
+        super().__init__()
+        self.backends = backends
+        self.model_id = backends[0][0].model_id
+
+    @property
+    def provider(self) -> str:
+        return self.backends[0][0].provider
+
+    def _candidates(self) -> list[tuple[AiService, BackendHealth]]:
+        # With every breaker open, each backend is still asked so that the
+        # error says why
+        available = [
+            backend for backend in self.backends if backend[1].breaker.available()
+        ]
+        return available or self.backends
+
+    def admit(self) -> None:
+        error = None
+        for service, _ in self._candidates():
+            try:
+                service.admit()
+                return
+            except LlmOverloaded as e:
+                error = e
+        raise error
+
+    async def _hedged(
+        self,
+        call: Callable[[AiService], Awaitable[T]],
+        primary: tuple[AiService, BackendHealth],
+        hedge: tuple[AiService, BackendHealth],
+    ) -> T:
+        # Answers from one of the two backends unless both fail: the second
+        # is raced against a slow first call, or asked in turn when the first
+        # fails before then (or before its latency is known)
+        latency = primary[1].latency
+        timeout = None
+        if len(latency) >= settings.LLM_HEDGE_MIN_SAMPLES:
+            timeout = latency.percentile(settings.LLM_HEDGE_PERCENTILE)
+        first = asyncio.ensure_future(call(primary[0]))
+        tasks = {first}
+        raced = False
         try:
-            full_prompt = f"You are a project manager. Your task is to answer questions about the project based on the provided data. Answer in Markdown format.\n\nContext:\n{json.dumps(project_data)}\n\nQuestion: {question}"
-            response = self.model.generate_content(full_prompt)
-            return response.text.strip()
-        except Exception as e:
-            raise LlmException("Gemini API error: " + str(e))
+            done, _ = await asyncio.wait(tasks, timeout=timeout)
+            if not done:
+                raced = True
+                hedge[1].hedged += 1
+                tasks.add(asyncio.ensure_future(call(hedge[0])))
+            elif first.cancelled() or isinstance(
+                first.exception(), (LlmException, LlmOverloaded)
+            ):
+                tasks.add(asyncio.ensure_future(call(hedge[0])))
+            pending, error = tasks, None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.cancelled():
+                        error = error or LlmException("LLM call was cancelled")
+                    elif task.exception() is None:
+                        if raced and task is not first:
+                            hedge[1].hedges_won += 1
+                        return task.result()
+                    else:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
 
+    async def _route(self, call: Callable[[AiService], Awaitable[T]]) -> T:
+        candidates = self._candidates()
+        error = None
+        index = 0
+        while index < len(candidates):
+            hedging = (
+                index == 0 and settings.LLM_HEDGE_PERCENTILE and len(candidates) > 1
+            )
+            try:
+                if hedging:
+                    return await self._hedged(call, candidates[0], candidates[1])
+                return await call(candidates[index][0])
+            except (LlmException, LlmOverloaded) as e:
+                error = e
+            # A hedged call has tried the first two
+            index += 2 if hedging else 1
+        raise error
 
-@lru_cache()
-def get_llm_service():
-    if settings.LLM_SERVICE == "ollama":
-        return OllamaService(host=settings.OLLAMA_API_URL, model=settings.OLLAMA_MODEL)
-    if settings.LLM_SERVICE == "openai":
+    def _route_sync(self, call: Callable[[AiService], T]) -> T:
+        error = None
+        for service, _ in self._candidates():
+            try:
+                return call(service)
+            except LlmException as e:
+                error = e
+        raise error
+
+    async def _route_stream(
+        self, open_stream: Callable[[AiService], AsyncIterator]
+    ) -> AsyncIterator:
+        error = None
+        for service, _ in self._candidates():
+            stream = open_stream(service)
+            started = False
+            try:
+                async for item in stream:
+                    started = True
+                    yield item
+                return
+            except (LlmException, LlmOverloaded) as e:
+                if started:
+                    raise
+                error = e
+            finally:
+                await stream.aclose()
+        raise error
+
+    def get_tasks(self, prompt: str) -> list[dict]:
+        return self._route_sync(lambda service: service.get_tasks(prompt))
+
+    def get_summary(self, context: str) -> str:
+        return self._route_sync(lambda service: service.get_summary(context))
+
+    def ask_question(self, context: str, question: str) -> str:
+        return self._route_sync(
+            lambda service: service.ask_question(context, question)
+        )
+
+    def converse(self, context: str, turns: list[dict]) -> str:
+        return self._route_sync(lambda service: service.converse(context, turns))
+
+    async def aget_tasks(self, prompt: str) -> list[dict]:
+        return await self._route(lambda service: service.aget_tasks(prompt))
+
+    async def aget_summary(self, context: str) -> str:
+        return await self._route(lambda service: service.aget_summary(context))
+
+    async def aask_question(self, context: str, question: str) -> str:
+        return await self._route(
+            lambda service: service.aask_question(context, question)
+        )
+
+    async def aconverse(self, context: str, turns: list[dict]) -> str:
+        return await self._route(lambda service: service.aconverse(context, turns))
+
+    async def stream_tasks(self, prompt: str) -> AsyncIterator[dict]:
+        async for task in self._route_stream(
+            lambda service: service.stream_tasks(prompt)
+        ):
+            yield task
+
+    async def stream_summary(self, context: str) -> AsyncIterator[str]:
+        async for token in self._route_stream(
+            lambda service: service.stream_summary(context)
+        ):
+            yield token
+
+    async def stream_answer(
+        self, context: str, question: str
+    ) -> AsyncIterator[str]:
+        async for token in self._route_stream(
+            lambda service: service.stream_answer(context, question)
+        ):
+            yield token
+
+    async def stream_conversation(
+        self, context: str, turns: list[dict]
+    ) -> AsyncIterator[str]:
+        async for token in self._route_stream(
+            lambda service: service.stream_conversation(context, turns)
+        ):
+            yield token
+
+
+def scheduled(backend: str, service: AiService) -> AiService:
+    max_in_flight = settings.LLM_MAX_IN_FLIGHT.get(backend)
+    if not max_in_flight:
+        return service
+    scheduler = llm_schedulers.setdefault(
+        backend,
+        LlmScheduler(
+            backend,
+            max_in_flight,
+            settings.LLM_MAX_QUEUE_WAIT_SECONDS,
+            settings.LLM_MAX_QUEUED,
+        ),
+    )
+    return ScheduledAiService(service, scheduler)
+
+
+def create_provider(backend: str) -> AiService | None:
+    timeout = settings.LLM_TIMEOUT_SECONDS
+    if backend == "ollama":
+        return OllamaService(
+            host=settings.OLLAMA_API_URL, model=settings.OLLAMA_MODEL, timeout=timeout
+        )
+    if backend == "openai":
         return OpenAIService(
             base_url=settings.OPENAI_API_URL,
             model=settings.OPENAI_MODEL,
             api_key=settings.OPENAI_API_KEY,
+            timeout=timeout,
         )
-    if settings.LLM_SERVICE == "gemini":
-        return GeminiService(settings.GEMINI_API_KEY)
-    return AiService()
+    if backend == "gemini":
+        return GeminiService(settings.GEMINI_API_KEY, timeout=timeout)
+    return None
+
+
+def create_llm_service() -> AiService:
+    # LLM_SERVICE first, then the fallbacks. Each backend's calls are guarded
+    # by its own deadline, retries and breaker, and queued by its scheduler.
+    backends = []
+    for backend in dict.fromkeys([settings.LLM_SERVICE, *settings.LLM_FALLBACK_SERVICES]):
+        provider = create_provider(backend)
+        if provider is None:
+            continue
+        health = backend_health.setdefault(backend, BackendHealth(backend))
+        backends.append((scheduled(backend, GuardedAiService(provider, health)), health))
+    if not backends:
+        return AiService()
+    return RoutedAiService(backends)
+
+
+@lru_cache()
+def get_llm_service():
+    service = create_llm_service()
+    if settings.LLM_COALESCE_REQUESTS:
+        service = CoalescingAiService(service, llm_single_flight)
+    if settings.LLM_CACHE_ENABLED:
+        service = CachedAiService(service, llm_response_cache)
+    return service
+
+
+async def use_project(
+    llm_service: AiService, db: AsyncSession, project_id: str
+) -> AiService:
+    # Called by the handlers once the user may use the project, from the
+    # coroutine that makes the calls so that the context variables are set in
+    # its context
+    current_project_id.set(project_id)
+    current_organization_id.set(
+        await db.run_sync(get_project_organization_id, project_id)
+    )
+    # A saturated backend turns the request away (429) before any work is done
+    llm_service.admit()
+    return llm_service
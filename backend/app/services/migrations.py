@@ -0,0 +1,111 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.core.db import Base
+# Every table has to be registered before the schema is created or compared
+from app.models import (  # noqa: F401
+    change_log,
+    comment,
+    job,
+    organization,
+    organization_revision,
+    project,
+    project_revision,
+    project_status_count,
+    project_summary,
+    search_document,
+    subtask,
+    task,
+    user,
+)
+from app.services.search import ensure_search_index, rebuild_search_index
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
+# The schema create_all built before the database carried a version
+BASELINE_REVISION = "0001"
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def _config(connection: Connection) -> Config:
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    # Run on this connection, in its transaction
+    config.attributes["connection"] = connection
+    return config
+
+
+@contextmanager
+def migration_connection(engine: Engine) -> Iterator[Connection]:
+    # A connection in a transaction to migrate on. SQLite alters most of a
+    # table by copying it and dropping the old one, which foreign keys to it
+    # would refuse, so they are off until the migration committed; the
+    # pragma only takes effect outside a transaction.
+    with engine.connect() as connection:
+        foreign_keys = None
+        if connection.dialect.name == "sqlite":
+            foreign_keys = connection.exec_driver_sql("PRAGMA foreign_keys").scalar()
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+        try:
+            with connection.begin():
+                yield connection
+        finally:
+            if foreign_keys is not None:
+                connection.exec_driver_sql(f"PRAGMA foreign_keys={foreign_keys}")
+                connection.commit()
+
+
+def head_revision() -> str:
+    return ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+
+
+def current_revision(engine: Engine) -> str | None:
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def migrate(engine: Engine) -> str:
+    # Brings the database to the latest revision. A new database is created
+    # from the models as they are now; one that predates versioning gets the
+    # tables it is missing, as create_all used to, and is then upgraded from
+    # the baseline. If that includes the search index, it is built from the
+    # existing tasks, subtasks and comments.
+    with engine.begin() as connection:
+        revision = MigrationContext.configure(connection).get_current_revision()
+        if revision is None:
+            tables = inspect(connection).get_table_names()
+            new_database = not tables
+            Base.metadata.create_all(connection)
+            command.stamp(
+                _config(connection),
+                "head" if new_database else BASELINE_REVISION,
+            )
+    if revision is None:
+        ensure_search_index(engine)
+    with migration_connection(engine) as connection:
+        command.upgrade(_config(connection), "head")
+    if revision is None and not new_database and "search_documents" not in tables:
+        with Session(engine) as db:
+            rebuild_search_index(db)
+    return head_revision()
+
+
+def check_schema(engine: Engine) -> None:
+    current, head = current_revision(engine), head_revision()
+    if current != head:
+        raise SchemaOutOfDate(
+            f"Database schema is at revision {current or 'none'}, the code "
+            f"expects {head}; run `python -m app.cli migrate`"
+        )
@@ -0,0 +1,91 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Select, and_, or_
+from sqlalchemy.orm import Session
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Malformed cursor")
+    if (
+        not isinstance(payload, dict)
+        or not isinstance(payload.get("id"), str)
+        or not isinstance(payload.get("value", []), (str, int, float, type(None)))
+    ):
+        raise InvalidCursor("Malformed cursor")
+    return payload
+
+
+def _load_value(value: Any, sample_column) -> Any:
+    if value is not None and sample_column.type.python_type is datetime:
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise InvalidCursor("Malformed cursor")
+    return value
+
+
+def keyset_page(
+    db: Session,
+    statement: Select,
+    sort_column,
+    id_column,
+    limit: int,
+    cursor: str | None = None,
+) -> tuple[list, str | None]:
+    # Returns one page ordered by (sort_column, id_column) and the cursor for the
+    # next one. Rows whose sort value is NULL come last, ordered by id, so the
+    # order is the same on every database. Each phase is a plain range scan
+    # over a (..., sort_column, id) index.
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None and after.get("sort") != sort_column.key:
+        raise InvalidCursor("Cursor belongs to a different ordering")
+
+    rows = []
+    if after is None or after["value"] is not None:
+        page = statement.where(sort_column.is_not(None))
+        if after is not None:
+            value = _load_value(after["value"], sort_column)
+            page = page.where(
+                or_(
+                    sort_column > value,
+                    and_(sort_column == value, id_column > after["id"]),
+                )
+            )
+        rows = db.scalars(page.order_by(sort_column, id_column).limit(limit + 1)).all()
+
+    if len(rows) <= limit:
+        page = statement.where(sort_column.is_(None))
+        if after is not None and after["value"] is None:
+            page = page.where(id_column > after["id"])
+        rows += db.scalars(page.order_by(id_column).limit(limit + 1 - len(rows))).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    value = getattr(last, sort_column.key)
+    next_cursor = encode_cursor(
+        {
+            "sort": sort_column.key,
+            "value": value.isoformat() if isinstance(value, datetime) else value,
+            "id": getattr(last, id_column.key),
+        }
+    )
+    return rows, next_cursor
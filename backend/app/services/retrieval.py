@@ -0,0 +1,348 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Collection
+
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.project import Project as DBProject
+from app.models.search_document import SearchDocument
+from app.services.change_tracking import EntityChange, on_changes
+from app.services.embeddings import Embedder, get_embedder
+
+documents = SearchDocument.__table__
+
+_EMBED_BATCH_SIZE = 64
+
+
+@dataclass
+class RetrievedDocument:
+    entity: str
+    entity_id: str
+    task_id: str | None
+    text: str
+    score: float
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _batches(texts: list[str]) -> list[list[str]]:
+    return [
+        texts[start : start + _EMBED_BATCH_SIZE]
+        for start in range(0, len(texts), _EMBED_BATCH_SIZE)
+    ]
+
+
+def _embed(embedder: Embedder, texts: list[str]) -> np.ndarray:
+    return np.concatenate([embedder.embed(batch) for batch in _batches(texts)] or [[]])
+
+
+async def _aembed(embedder: Embedder, texts: list[str]) -> np.ndarray:
+    return np.concatenate(
+        [await embedder.aembed(batch) for batch in _batches(texts)] or [[]]
+    )
+
+
+class ProjectVectorIndex:
+    # The embedded search documents of one project as parallel arrays. Only
+    # documents whose text is new or has changed are embedded again.
+    def __init__(self, embedder_name: str):
+        self.embedder_name = embedder_name
+        self.keys: list[str] = []  # "<entity>:<id>"
+        self.task_ids: list[str] = []  # "" when there is no task
+        self.texts: list[str] = []
+        self.digests: list[str] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str, embedder_name: str) -> "ProjectVectorIndex | None":
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["embedder"]) != embedder_name:
+                    return None
+                index = cls(embedder_name)
+                index.keys = data["keys"].tolist()
+                index.task_ids = data["task_ids"].tolist()
+                index.texts = data["texts"].tolist()
+                index.digests = data["digests"].tolist()
+                index.vectors = data["vectors"]
+        except (OSError, KeyError, ValueError):
+            return None
+        return index
+
+    def save(self, path: str) -> None:
+        # Written aside and renamed, so readers never see a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                embedder=np.array(self.embedder_name),
+                keys=np.array(self.keys, dtype=str),
+                task_ids=np.array(self.task_ids, dtype=str),
+                texts=np.array(self.texts, dtype=str),
+                digests=np.array(self.digests, dtype=str),
+                vectors=self.vectors,
+            )
+        os.replace(tmp_path, path)
+
+    def stale_rows(self, rows: list[tuple[str, str, str]]) -> list[int]:
+        # rows are (key, task_id, text) for every current document. Returns
+        # the positions of those whose text is new or has changed.
+        positions = {key: i for i, key in enumerate(self.keys)}
+        return [
+            row
+            for row, (key, _, text) in enumerate(rows)
+            if key not in positions or self.digests[positions[key]] != _digest(text)
+        ]
+
+    def updated(
+        self, rows: list[tuple[str, str, str]], stale: list[int], embedded: np.ndarray
+    ) -> "ProjectVectorIndex":
+        # A new index of `rows`, with `embedded` the vectors of the stale ones.
+        # This one is left as it is for whoever is still searching it.
+        if not stale and len(rows) == len(self.keys):
+            return self
+        positions = {key: i for i, key in enumerate(self.keys)}
+        dim = embedded.shape[1] if len(stale) else self.vectors.shape[1]
+        vectors = np.zeros((len(rows), dim), dtype=np.float32)
+        fresh = dict(zip(stale, embedded))
+        for row, (key, _, _) in enumerate(rows):
+            vectors[row] = fresh[row] if row in fresh else self.vectors[positions[key]]
+
+        index = ProjectVectorIndex(self.embedder_name)
+        index.keys = [key for key, _, _ in rows]
+        index.task_ids = [task_id for _, task_id, _ in rows]
+        index.texts = [text for _, _, text in rows]
+        index.digests = [_digest(text) for _, _, text in rows]
+        index.vectors = vectors
+        return index
+
+    def search(self, query_vector: np.ndarray, k: int) -> list[tuple[int, float]]:
+        if not self.keys or k <= 0:
+            return []
+        scores = self.vectors @ query_vector
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def _project_rows(db: Session, project_id: str) -> list[tuple[str, str, str]]:
+    rows = db.execute(
+        select(
+            documents.c.entity_type,
+            documents.c.entity_id,
+            documents.c.task_id,
+            documents.c.title,
+            documents.c.body,
+        )
+        .where(documents.c.project_id == project_id)
+        .order_by(documents.c.id)
+    )
+    return [
+        (
+            f"{entity}:{entity_id}",
+            task_id or "",
+            f"{title}: {body or ''}" if title else body or "",
+        )
+        for entity, entity_id, task_id, title, body in rows
+    ]
+
+
+class VectorIndexStore:
+    # Per-project indexes, kept on disk under `directory` and the most
+    # recently used ones in memory. Projects written to since their index was
+    # last synced are marked dirty and synced again on their next search.
+    def __init__(self, directory: str, maxsize: int):
+        self.directory = directory
+        self._indexes = TTLCache(maxsize)
+        self._dirty: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _path(self, project_id: str) -> str:
+        return os.path.join(self.directory, f"{project_id}.npz")
+
+    def mark_dirty(self, project_ids: Collection[str]) -> None:
+        with self._lock:
+            self._dirty.update(project_ids)
+
+    def forget(self, project_id: str) -> None:
+        with self._lock:
+            self._indexes.pop(project_id)
+            self._dirty.discard(project_id)
+            try:
+                os.remove(self._path(project_id))
+            except FileNotFoundError:
+                pass
+
+    def _cached(
+        self, project_id: str, embedder_name: str
+    ) -> tuple[ProjectVectorIndex | None, bool]:
+        # The index in memory, if any, and whether it is up to date
+        with self._lock:
+            index = self._indexes.get(project_id)
+            if index is not None and index.embedder_name != embedder_name:
+                index = None
+            if index is not None and project_id not in self._dirty:
+                return index, True
+            self._dirty.discard(project_id)
+            return index, False
+
+    def _base(
+        self, project_id: str, index: ProjectVectorIndex | None, embedder_name: str
+    ) -> ProjectVectorIndex:
+        # Whatever is on disk may predate writes from other processes, so a
+        # loaded index is always reconciled with the documents.
+        if index is not None:
+            return index
+        return ProjectVectorIndex.load(
+            self._path(project_id), embedder_name
+        ) or ProjectVectorIndex(embedder_name)
+
+    def _keep(
+        self, project_id: str, index: ProjectVectorIndex, updated: ProjectVectorIndex
+    ) -> ProjectVectorIndex:
+        with self._lock:
+            if updated is not index:
+                os.makedirs(self.directory, exist_ok=True)
+                updated.save(self._path(project_id))
+            self._indexes.set(project_id, updated)
+        return updated
+
+    def get(
+        self, db: Session, project_id: str, embedder: Embedder
+    ) -> ProjectVectorIndex:
+        index, fresh = self._cached(project_id, embedder.name)
+        if fresh:
+            return index
+        rows = _project_rows(db, project_id)
+        index = self._base(project_id, index, embedder.name)
+        stale = index.stale_rows(rows)
+        embedded = _embed(embedder, [rows[row][2] for row in stale])
+        return self._keep(project_id, index, index.updated(rows, stale, embedded))
+
+    async def aget(
+        self, db: AsyncSession, project_id: str, embedder: Embedder
+    ) -> ProjectVectorIndex:
+        # As get(), with the documents read on the session and embedded on
+        # the thread pool, so neither holds up the event loop
+        index, fresh = self._cached(project_id, embedder.name)
+        if fresh:
+            return index
+        rows = await db.run_sync(_project_rows, project_id)
+        index = self._base(project_id, index, embedder.name)
+        stale = index.stale_rows(rows)
+        embedded = await _aembed(embedder, [rows[row][2] for row in stale])
+        return self._keep(project_id, index, index.updated(rows, stale, embedded))
+
+    def stats(self) -> dict:
+        return {**self._indexes.stats(), "dirty": len(self._dirty)}
+
+
+vector_indexes = VectorIndexStore(
+    settings.VECTOR_INDEX_DIR, settings.VECTOR_INDEX_CACHE_SIZE
+)
+
+
+def _retrieved(
+    index: ProjectVectorIndex, query_vector: np.ndarray, k: int
+) -> list[RetrievedDocument]:
+    return [
+        RetrievedDocument(
+            *index.keys[i].split(":", 1),
+            task_id=index.task_ids[i] or None,
+            text=index.texts[i],
+            score=score,
+        )
+        for i, score in index.search(query_vector, k)
+    ]
+
+
+def retrieve(
+    db: Session, project_id: str, query: str, k: int
+) -> list[RetrievedDocument]:
+    embedder = get_embedder()
+    index = vector_indexes.get(db, project_id, embedder)
+    if not index.keys:
+        return []
+    return _retrieved(index, embedder.embed([query])[0], k)
+
+
+async def aretrieve(
+    db: AsyncSession, project_id: str, query: str, k: int
+) -> list[RetrievedDocument]:
+    embedder = get_embedder()
+    index = await vector_indexes.aget(db, project_id, embedder)
+    if not index.keys:
+        return []
+    return _retrieved(index, (await embedder.aembed([query]))[0], k)
+
+
+def format_context(retrieved: list[RetrievedDocument]) -> str:
+    return "\n".join(f"- [{doc.entity}] {doc.text}" for doc in retrieved)
+
+
+def _task_ids(retrieved: list[RetrievedDocument]) -> list[str]:
+    task_ids = []
+    for doc in retrieved:
+        if doc.task_id and doc.task_id not in task_ids:
+            task_ids.append(doc.task_id)
+    return task_ids
+
+
+def relevant_task_ids(db: Session, project_id: str, query: str) -> list[str]:
+    # Tasks behind the top RAG_TOP_K documents for the query, best match first
+    if not settings.RAG_TOP_K:
+        return []
+    return _task_ids(retrieve(db, project_id, query, settings.RAG_TOP_K))
+
+
+async def arelevant_task_ids(db: AsyncSession, project_id: str, query: str) -> list[str]:
+    if not settings.RAG_TOP_K:
+        return []
+    return _task_ids(await aretrieve(db, project_id, query, settings.RAG_TOP_K))
+
+
+def rebuild_vector_indexes(db: Session) -> int:
+    embedder = get_embedder()
+    count = 0
+    for (project_id,) in db.execute(select(DBProject.id)):
+        vector_indexes.forget(project_id)
+        count += len(vector_indexes.get(db, project_id, embedder).keys)
+    return count
+
+
+@on_changes
+def _collect_dirty_projects(db: Session, changes: list[EntityChange]) -> None:
+    # Applied only once the transaction commits, so a sync never reads rows
+    # that are still uncommitted or later rolled back.
+    dirty = db.info.setdefault("vector_index_dirty", set())
+    deleted = db.info.setdefault("vector_index_deleted", set())
+    for change in changes:
+        if change.entity == "project" and change.action == "delete":
+            deleted.add(change.entity_id)
+        elif change.entity != "project" and change.project_id:
+            dirty.add(change.project_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_dirty_projects(session):
+    vector_indexes.mark_dirty(session.info.pop("vector_index_dirty", ()))
+    for project_id in session.info.pop("vector_index_deleted", ()):
+        vector_indexes.forget(project_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_dirty_projects(session, previous_transaction):
+    session.info.pop("vector_index_dirty", None)
+    session.info.pop("vector_index_deleted", None)
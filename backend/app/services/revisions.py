@@ -0,0 +1,155 @@
+from collections import defaultdict
+
+from sqlalchemy import Table, delete, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.core.db_profile import upsert
+from app.models.change_log import ChangeLogEntry
+from app.models.organization_revision import OrganizationRevision
+from app.models.project import Project as DBProject
+from app.models.project_revision import ProjectRevision
+from app.services.change_tracking import EntityChange, on_changes
+
+revisions_table = ProjectRevision.__table__
+organization_revisions_table = OrganizationRevision.__table__
+change_log_table = ChangeLogEntry.__table__
+
+
+def get_project_revision(db: Session, project_id: str) -> int:
+    revision = (
+        db.query(ProjectRevision.revision)
+        .filter(ProjectRevision.project_id == project_id)
+        .scalar()
+    )
+    return revision or 0
+
+
+def get_organization_revision(db: Session, organization_id: str) -> int:
+    revision = (
+        db.query(OrganizationRevision.revision)
+        .filter(OrganizationRevision.organization_id == organization_id)
+        .scalar()
+    )
+    return revision or 0
+
+
+def _bump(connection: Connection, table: Table, key: str, value: str) -> int:
+    # One statement, so that two first writers cannot both insert
+    return connection.execute(
+        upsert(connection, table)
+        .values({key: value, "revision": 1})
+        .on_conflict_do_update(
+            index_elements=[table.c[key]], set_={"revision": table.c.revision + 1}
+        )
+        .returning(table.c.revision)
+    ).scalar_one()
+
+
+def _organization_ids(
+    connection: Connection, changes_by_project: dict[str, list[EntityChange]]
+) -> dict[str, str | None]:
+    organizations = {}
+    for project_id, changes in changes_by_project.items():
+        for change in changes:
+            if change.entity == "project" and "organization_id" in change.fields:
+                # New, deleted or moved: the row may not be there to ask
+                organizations[project_id] = (
+                    change.new("organization_id") or change.old("organization_id")
+                )
+    missing = [
+        project_id for project_id in changes_by_project if project_id not in organizations
+    ]
+    if missing:
+        organizations.update(
+            connection.execute(
+                select(DBProject.id, DBProject.organization_id).where(
+                    DBProject.id.in_(missing)
+                )
+            ).all()
+        )
+    return organizations
+
+
+@on_changes
+def _record_changes(db: Session, changes: list[EntityChange]) -> None:
+    # Each flush moves every project it wrote, and those projects'
+    # organizations, to their next revision, and logs its changes under them
+    changes_by_project = defaultdict(list)
+    for change in changes:
+        if change.project_id:
+            changes_by_project[change.project_id].append(change)
+    if not changes_by_project:
+        return
+
+    connection = db.connection()
+    organizations = _organization_ids(connection, changes_by_project)
+    organization_revisions = {
+        organization_id: _bump(
+            connection, organization_revisions_table, "organization_id", organization_id
+        )
+        for organization_id in set(organizations.values())
+        if organization_id
+    }
+    entries = []
+    for project_id, project_changes in changes_by_project.items():
+        revision = _bump(connection, revisions_table, "project_id", project_id)
+        organization_id = organizations.get(project_id)
+        for change in project_changes:
+            entries.append(
+                {
+                    "organization_id": organization_id,
+                    "organization_revision": organization_revisions.get(organization_id),
+                    "project_id": project_id,
+                    "revision": revision,
+                    "entity": change.entity,
+                    "action": change.action,
+                    "entity_id": change.entity_id,
+                    "task_id": change.task_id,
+                    "fields": sorted(change.fields),
+                }
+            )
+        if any(
+            change.entity == "project" and change.action == "delete"
+            for change in project_changes
+        ):
+            connection.execute(
+                delete(revisions_table).where(revisions_table.c.project_id == project_id)
+            )
+    connection.execute(insert(change_log_table), entries)
+
+
+def changes_since(
+    db: Session,
+    since: int,
+    limit: int,
+    project_id: str | None = None,
+    organization_id: str | None = None,
+) -> tuple[list[ChangeLogEntry], bool]:
+    # The changes after revision `since` of a project, or of an organization,
+    # oldest first, and whether there are more. A page only ends on a whole
+    # revision, so asking again from its last revision misses nothing.
+    if project_id is not None:
+        revision = ChangeLogEntry.revision
+        query = db.query(ChangeLogEntry).filter(ChangeLogEntry.project_id == project_id)
+    else:
+        revision = ChangeLogEntry.organization_revision
+        query = db.query(ChangeLogEntry).filter(
+            ChangeLogEntry.organization_id == organization_id
+        )
+    rows = (
+        query.filter(revision > since)
+        .order_by(revision, ChangeLogEntry.id)
+        .limit(limit + 1)
+        .all()
+    )
+    if len(rows) <= limit:
+        return rows, False
+    page, following = rows[:limit], rows[limit]
+    split = getattr(following, revision.key)
+    if getattr(page[-1], revision.key) == split:
+        page = [row for row in page if getattr(row, revision.key) != split]
+        if not page:
+            # A single revision larger than a page is returned whole
+            page = query.filter(revision == split).order_by(ChangeLogEntry.id).all()
+    return page, True
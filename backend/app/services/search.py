@@ -0,0 +1,301 @@
+import re
+from collections import defaultdict
+
+from sqlalchemy import String, bindparam, delete, insert, or_, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.models.comment import Comment as DBComment
+from app.models.search_document import SearchDocument, SearchResult
+from app.models.subtask import Subtask as DBSubtask
+from app.models.task import Task as DBTask
+from app.services.change_tracking import EntityChange, on_changes
+
+documents = SearchDocument.__table__
+
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5(
+        title, body,
+        content='search_documents', content_rowid='id',
+        tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_documents_fts(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO search_documents_fts(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+
+_POSTGRES_DDL = [
+    """
+    ALTER TABLE search_documents ADD COLUMN IF NOT EXISTS document tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_search_documents_document
+    ON search_documents USING GIN (document)
+    """,
+]
+
+
+def ensure_search_index(engine: Engine) -> None:
+    ddl = {"sqlite": _SQLITE_DDL, "postgresql": _POSTGRES_DDL}.get(
+        engine.dialect.name, []
+    )
+    SearchDocument.__table__.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        for statement in ddl:
+            connection.execute(text(statement))
+
+
+def _fts5_query(query: str) -> str:
+    # Quote every term so user input can never be parsed as FTS5 syntax, and
+    # prefix-match the terms to stay close to the old substring search.
+    terms = re.findall(r"\w+", query)
+    return " ".join('"' + term + '"*' for term in terms)
+
+
+def _ranked_statement(dialect: str, project_id: str, query: str, limit: int):
+    if dialect == "sqlite":
+        match = _fts5_query(query)
+        if not match:
+            return None
+        return text(
+            """
+            SELECT d.entity_type, d.entity_id, d.task_id, d.title,
+                   snippet(search_documents_fts, -1, '<mark>', '</mark>', '…', 12) AS snippet,
+                   -bm25(search_documents_fts, 5.0, 1.0) AS score
+            FROM search_documents_fts
+            JOIN search_documents d ON d.id = search_documents_fts.rowid
+            WHERE search_documents_fts MATCH :match AND d.project_id = :project_id
+            ORDER BY score DESC
+            LIMIT :limit
+            """
+        ).bindparams(match=match, project_id=project_id, limit=limit)
+    if dialect == "postgresql":
+        return text(
+            """
+            SELECT entity_type, entity_id, task_id, title,
+                   ts_headline('english', coalesce(title, '') || ' ' || coalesce(body, ''), q,
+                               'StartSel=<mark>,StopSel=</mark>,MaxWords=24,MinWords=8') AS snippet,
+                   ts_rank(document, q) AS score
+            FROM search_documents, websearch_to_tsquery('english', :query) q
+            WHERE project_id = :project_id AND document @@ q
+            ORDER BY score DESC
+            LIMIT :limit
+            """
+        ).bindparams(query=query, project_id=project_id, limit=limit)
+    return None
+
+
+def _matching_statement(dialect: str, project_id: str, query: str):
+    if dialect == "sqlite":
+        return text(
+            """
+            SELECT d.entity_type, d.entity_id
+            FROM search_documents_fts
+            JOIN search_documents d ON d.id = search_documents_fts.rowid
+            WHERE search_documents_fts MATCH :match AND d.project_id = :project_id
+            """
+        ).bindparams(match=_fts5_query(query) or '""', project_id=project_id)
+    if dialect == "postgresql":
+        return text(
+            """
+            SELECT entity_type, entity_id FROM search_documents
+            WHERE project_id = :project_id
+              AND document @@ websearch_to_tsquery('english', :query)
+            """
+        ).bindparams(query=query, project_id=project_id)
+    return None
+
+
+def search_project(db: Session, project_id: str, query: str, limit: int = 20) -> list[SearchResult]:
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite" and not _fts5_query(query):
+        return []
+    statement = _ranked_statement(dialect, project_id, query, limit)
+    if statement is not None:
+        rows = db.execute(statement).mappings().all()
+        return [SearchResult(**row) for row in rows]
+
+    # Databases without a full-text index fall back to a substring scan
+    pattern = f"%{query}%"
+    rows = db.execute(
+        select(documents)
+        .where(
+            documents.c.project_id == project_id,
+            or_(documents.c.title.ilike(pattern), documents.c.body.ilike(pattern)),
+        )
+        .limit(limit)
+    ).mappings().all()
+    return [
+        SearchResult(
+            entity_type=row.entity_type,
+            entity_id=row.entity_id,
+            task_id=row.task_id,
+            title=row.title,
+            snippet=(row.body or row.title or "")[:200],
+            score=0.0,
+        )
+        for row in rows
+    ]
+
+
+def matching_task_ids(db: Session, project_id: str, query: str):
+    # Selectable of the ids of tasks in the project whose title or description
+    # match the query, for use in an IN clause.
+    statement = _matching_statement(db.get_bind().dialect.name, project_id, query)
+    if statement is None:
+        pattern = f"%{query}%"
+        return select(DBTask.id).where(
+            DBTask.project_id == project_id,
+            or_(DBTask.title.ilike(pattern), DBTask.description.ilike(pattern)),
+        )
+    matches = statement.columns(
+        entity_type=String, entity_id=String
+    ).subquery()
+    return select(matches.c.entity_id).where(matches.c.entity_type == "task")
+
+
+_SOURCES = {
+    "task": (DBTask, DBTask.title, DBTask.description),
+    "subtask": (DBSubtask, DBSubtask.title, DBSubtask.description),
+    "comment": (DBComment, None, DBComment.content),
+}
+_SOURCE_FIELDS = {
+    "task": {"title", "description"},
+    "subtask": {"title", "description"},
+    "comment": {"content"},
+}
+
+
+def _delete_documents(connection: Connection, entity_ids: dict[str, list[str]]) -> None:
+    # Entity type -> ids, one DELETE per type
+    for entity_type, ids in entity_ids.items():
+        if ids:
+            connection.execute(
+                delete(documents).where(
+                    documents.c.entity_type == entity_type,
+                    documents.c.entity_id.in_(ids),
+                )
+            )
+
+
+def _replace_documents(connection: Connection, rows: list[dict]) -> None:
+    entity_ids = defaultdict(list)
+    for row in rows:
+        entity_ids[row["entity_type"]].append(row["entity_id"])
+    _delete_documents(connection, entity_ids)
+    connection.execute(insert(documents), rows)
+
+
+def index_entities(db: Session, entity: str, ids_to_project: dict[str, str | None]) -> None:
+    model, title_column, body_column = _SOURCES[entity]
+    task_column = model.id if entity == "task" else model.task_id
+    columns = [model.id, task_column, body_column]
+    if title_column is not None:
+        columns.append(title_column)
+    connection = db.connection()
+    rows = []
+    for row in connection.execute(
+        select(*columns).where(model.id.in_(list(ids_to_project)))
+    ):
+        project_id = ids_to_project[row[0]]
+        rows.append(
+            {
+                "entity_type": entity,
+                "entity_id": row[0],
+                "project_id": project_id,
+                "task_id": row[1],
+                "body": row[2],
+                "title": row[3] if title_column is not None else None,
+            }
+        )
+    if rows:
+        _replace_documents(connection, rows)
+
+
+@on_changes
+def _sync_search_documents(db: Session, changes: list[EntityChange]) -> None:
+    connection = db.connection()
+    to_index = {entity: {} for entity in _SOURCES}
+    to_delete = defaultdict(list)
+    for change in changes:
+        if change.entity == "project":
+            if change.action == "delete":
+                connection.execute(
+                    delete(documents).where(documents.c.project_id == change.entity_id)
+                )
+            continue
+        if change.action == "delete":
+            to_delete[change.entity].append(change.entity_id)
+        elif change.action == "insert" or (
+            _SOURCE_FIELDS[change.entity] & change.fields.keys()
+        ):
+            to_index[change.entity][change.entity_id] = change.project_id
+    _delete_documents(connection, to_delete)
+    if to_delete["task"]:
+        # Subtasks and comments go with their task
+        connection.execute(
+            delete(documents).where(documents.c.task_id.in_(to_delete["task"]))
+        )
+    for entity, ids in to_index.items():
+        if ids:
+            index_entities(db, entity, ids)
+
+
+def rebuild_search_index(db: Session) -> int:
+    ensure_search_index(db.get_bind())
+    db.execute(delete(documents))
+    count = 0
+    for entity, (model, title_column, body_column) in _SOURCES.items():
+        if entity == "task":
+            statement = select(
+                bindparam("entity_type", entity),
+                DBTask.id,
+                DBTask.project_id,
+                DBTask.id,
+                DBTask.title,
+                DBTask.description,
+            )
+        else:
+            statement = select(
+                bindparam("entity_type", entity),
+                model.id,
+                DBTask.project_id,
+                model.task_id,
+                title_column if title_column is not None else bindparam("title", None, type_=String),
+                body_column,
+            ).join(DBTask, DBTask.id == model.task_id)
+        count += db.execute(
+            insert(documents).from_select(
+                ["entity_type", "entity_id", "project_id", "task_id", "title", "body"],
+                statement,
+            )
+        ).rowcount
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(
+            text("INSERT INTO search_documents_fts(search_documents_fts) VALUES ('rebuild')")
+        )
+    db.commit()
+    return count
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one run of the first caller's
+    # function and all get its result or exception. A caller that is
+    # cancelled only stops waiting; the run is cancelled once nobody waits.
+    def __init__(self):
+        self._flights: dict[str, _Flight] = {}
+        self._sync_flights: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.shared = 0  # callers that got another caller's result
+
+    async def run(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+            self.runs += 1
+        else:
+            self.shared += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+                self._land(key, flight)
+
+    def _land(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def run_sync(self, key: str, func: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._sync_flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._sync_flights[key] = Future()
+                self.runs += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._sync_flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights) + len(self._sync_flights),
+            "runs": self.runs,
+            "shared": self.shared,
+        }
+
+
+llm_single_flight = SingleFlight()
@@ -0,0 +1,43 @@
+import json
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+from app.services.llm_scheduler import LlmOverloaded
+from app.services.llm_service import LlmException
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _token_events(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    try:
+        async for token in tokens:
+            yield sse_event("token", {"text": token})
+        yield sse_event("done", {})
+    except LlmException as e:
+        yield sse_event("error", {"detail": e.message})
+    except LlmOverloaded as e:
+        yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+    finally:
+        await tokens.aclose()
+
+
+def sse_response(
+    events: AsyncIterator[str], headers: dict[str, str] | None = None
+) -> StreamingResponse:
+    # Starlette cancels the response task when the client disconnects; the
+    # cancellation propagates into the generators, whose finally blocks close
+    # the upstream model stream.
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})},
+    )
+
+
+def stream_tokens(
+    tokens: AsyncIterator[str], headers: dict[str, str] | None = None
+) -> StreamingResponse:
+    return sse_response(_token_events(tokens), headers)
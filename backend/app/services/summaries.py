@@ -0,0 +1,314 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.db import SessionLocal, release_connection
+from app.models.job import Job
+from app.models.project import Project as DBProject
+from app.models.project_summary import ProjectSummary
+from app.services.change_tracking import EntityChange, on_changes
+from app.services.context_builder import (
+    build_context,
+    context_budget,
+    latest_comment_at,
+    project_delta,
+    project_text,
+    task_digests,
+)
+from app.services.jobs import QueueFull, enqueue_job
+from app.services.llm_service import AiService
+from app.services.revisions import get_project_revision
+from app.services.tokens import count_tokens
+
+summaries_table = ProjectSummary.__table__
+
+
+class SummaryStats:
+    def __init__(self):
+        self.full = 0
+        self.incremental = 0
+        self.unchanged = 0  # refreshes that found nothing the summary covers
+        self.served = 0
+        self.served_stale = 0
+
+    def stats(self) -> dict:
+        return {
+            "full": self.full,
+            "incremental": self.incremental,
+            "unchanged": self.unchanged,
+            "served": self.served,
+            "served_stale": self.served_stale,
+        }
+
+
+summary_stats = SummaryStats()
+
+
+def get_stored_summary(db: Session, project_id: str) -> ProjectSummary | None:
+    return db.get(ProjectSummary, project_id)
+
+
+def summary_headers(summary: ProjectSummary, revision: int) -> dict[str, str]:
+    return {
+        "X-Summary-Revision": str(summary.revision),
+        "X-Project-Revision": str(revision),
+        "X-Summary-Stale": "true" if summary.revision < revision else "false",
+        "X-Summary-Generated-At": summary.generated_at.isoformat(),
+    }
+
+
+def _incremental_context(project: DBProject, stored: ProjectSummary, changes: str) -> str:
+    return (
+        f"{project_text(project)}\n"
+        f"## Status summary at revision {stored.revision}\n{stored.summary}\n\n"
+        f"## Changes since that summary\n{changes}\n"
+        "Update the summary so that it reflects these changes."
+    )
+
+
+@dataclass
+class _Rewrite:
+    # What the model is asked to write, and what the summary will then cover
+    revision: int
+    incremental: bool
+    context: str
+    context_tokens: int
+    task_digests: dict
+    comments_seen_at: datetime | None
+
+
+def _plan_refresh(
+    db: Session, project: DBProject, model_id: str, full: bool
+) -> ProjectSummary | _Rewrite:
+    # The revision is read first: a write made while the model is working
+    # leaves the new summary stale, so it is refreshed again.
+    revision = get_project_revision(db, project.id)
+    stored = get_stored_summary(db, project.id)
+    incremental = (
+        stored is not None
+        and not full
+        and stored.model_id == model_id
+        and stored.incremental_updates < settings.SUMMARY_MAX_INCREMENTAL_UPDATES
+    )
+    if incremental:
+        if stored.revision == revision:
+            return stored
+        delta = project_delta(db, project.id, stored.task_digests, stored.comments_seen_at)
+        if not delta.text:
+            # Only rows the summary does not describe changed
+            stored.revision = revision
+            db.commit()
+            summary_stats.unchanged += 1
+            return stored
+        if count_tokens(delta.text) > settings.SUMMARY_MAX_DELTA_TOKENS:
+            incremental = False
+    if incremental:
+        context = _incremental_context(project, stored, delta.text)
+        return _Rewrite(
+            revision,
+            True,
+            context,
+            count_tokens(context),
+            delta.task_digests,
+            delta.comments_seen_at,
+        )
+    digests = task_digests(db, project.id)
+    comments_seen_at = latest_comment_at(db, project.id)
+    context, report = build_context(db, project, context_budget(model_id))
+    return _Rewrite(revision, False, context, report.tokens, digests, comments_seen_at)
+
+
+def _store_summary(
+    db: Session, project_id: str, rewrite: _Rewrite, model_id: str, text: str
+) -> ProjectSummary:
+    stored = get_stored_summary(db, project_id)
+    if stored is None:
+        stored = ProjectSummary(project_id=project_id)
+        db.add(stored)
+    stored.summary = text
+    stored.revision = rewrite.revision
+    stored.model_id = model_id
+    stored.task_digests = rewrite.task_digests
+    stored.comments_seen_at = rewrite.comments_seen_at
+    stored.incremental_updates = (
+        stored.incremental_updates + 1 if rewrite.incremental else 0
+    )
+    stored.context_tokens = rewrite.context_tokens
+    stored.generated_at = datetime.utcnow()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker stored a summary of this project first
+        db.rollback()
+        return get_stored_summary(db, project_id)
+    if rewrite.incremental:
+        summary_stats.incremental += 1
+    else:
+        summary_stats.full += 1
+    return stored
+
+
+async def refresh_summary(
+    db: AsyncSession, project: DBProject, llm_service: AiService, full: bool = False
+) -> ProjectSummary:
+    # Brings the stored summary up to the project's current revision. Unless
+    # `full` is asked for, a summary is updated from its previous text and
+    # the changes since, and only written from the whole project again every
+    # SUMMARY_MAX_INCREMENTAL_UPDATES updates, when the changes are large or
+    # when the model changed.
+    project_id = project.id
+    rewrite = await db.run_sync(_plan_refresh, project, llm_service.model_id, full)
+    if isinstance(rewrite, ProjectSummary):
+        return rewrite
+    await release_connection(db)
+    text = await llm_service.aget_summary(rewrite.context)
+    return await db.run_sync(
+        _store_summary, project_id, rewrite, llm_service.model_id, text
+    )
+
+
+class SummaryRefresher:
+    # Refreshes stored summaries after writes, as summary jobs. Each write
+    # pushes its project's refresh back by SUMMARY_REFRESH_DEBOUNCE_SECONDS,
+    # so a burst of edits leads to one refresh, but by no more than
+    # SUMMARY_REFRESH_MAX_DELAY_SECONDS after the first. A project is
+    # refreshed at most once every SUMMARY_REFRESH_MIN_INTERVAL_SECONDS.
+    # Only projects that have a stored summary are refreshed.
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        # Project id -> (first write since the last refresh, refresh due at)
+        self._due: dict[str, tuple[float, float]] = {}
+        self._last_refresh: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self.scheduled = 0
+        self.deferred = 0  # refreshes put off by the per-project rate limit
+
+    def mark(self, project_ids: Iterable[str]) -> None:
+        # Called from any thread, after the writes committed
+        now = time.monotonic()
+        with self._lock:
+            for project_id in project_ids:
+                first = self._due.get(project_id, (now, 0.0))[0]
+                due = min(
+                    now + settings.SUMMARY_REFRESH_DEBOUNCE_SECONDS,
+                    first + settings.SUMMARY_REFRESH_MAX_DELAY_SECONDS,
+                )
+                earliest = (
+                    self._last_refresh.get(project_id, -float("inf"))
+                    + settings.SUMMARY_REFRESH_MIN_INTERVAL_SECONDS
+                )
+                if due < earliest:
+                    due = earliest
+                    self.deferred += 1
+                self._due[project_id] = (first, due)
+
+    def forget(self, project_ids: Iterable[str]) -> None:
+        with self._lock:
+            for project_id in project_ids:
+                self._due.pop(project_id, None)
+                self._last_refresh.pop(project_id, None)
+
+    def _take_due(self) -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            due = [project_id for project_id, (_, at) in self._due.items() if at <= now]
+            for project_id in due:
+                del self._due[project_id]
+                self._last_refresh[project_id] = now
+            # Past the rate limit a project needs no record any more
+            horizon = now - settings.SUMMARY_REFRESH_MIN_INTERVAL_SECONDS
+            for project_id in [p for p, at in self._last_refresh.items() if at < horizon]:
+                del self._last_refresh[project_id]
+        return due
+
+    def _enqueue(self, db: Session, project_id: str) -> None:
+        if get_stored_summary(db, project_id) is None:
+            return
+        already_queued = (
+            db.query(Job.id)
+            .filter(Job.kind == "summary", Job.project_id == project_id, Job.status == "queued")
+            .first()
+        )
+        project = db.get(DBProject, project_id)
+        if already_queued or project is None:
+            return
+        try:
+            enqueue_job(db, "summary", project, None, {})
+        except QueueFull:
+            self.mark([project_id])
+            return
+        self.scheduled += 1
+
+    def _enqueue_all(self, project_ids: list[str]) -> None:
+        with self.session_factory() as db:
+            for project_id in project_ids:
+                self._enqueue(db, project_id)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            due = self._take_due()
+            if due:
+                await run_in_threadpool(self._enqueue_all, due)
+
+    def start(self) -> None:
+        if settings.SUMMARY_REFRESH_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            **summary_stats.stats(),
+            "pending_refreshes": len(self._due),
+            "scheduled_refreshes": self.scheduled,
+            "deferred_refreshes": self.deferred,
+        }
+
+
+summary_refresher = SummaryRefresher()
+
+
+@on_changes
+def _collect_changed_projects(db: Session, changes: list[EntityChange]) -> None:
+    # Marked for a refresh only once the transaction commits
+    changed = db.info.setdefault("summary_changed", set())
+    deleted = db.info.setdefault("summary_deleted", set())
+    for change in changes:
+        if change.entity == "project" and change.action == "delete":
+            deleted.add(change.entity_id)
+            db.connection().execute(
+                summaries_table.delete().where(
+                    summaries_table.c.project_id == change.entity_id
+                )
+            )
+        elif change.project_id:
+            changed.add(change.project_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_changed_projects(session):
+    deleted = session.info.pop("summary_deleted", set())
+    summary_refresher.mark(session.info.pop("summary_changed", set()) - deleted)
+    summary_refresher.forget(deleted)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changed_projects(session, previous_transaction):
+    session.info.pop("summary_changed", None)
+    session.info.pop("summary_deleted", None)
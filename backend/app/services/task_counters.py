@@ -0,0 +1,110 @@
+from collections import Counter
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.db_profile import upsert
+from app.models.project_status_count import ProjectStatusCount
+from app.models.task import Task as DBTask
+from app.services.change_tracking import EntityChange, on_changes
+
+counts_table = ProjectStatusCount.__table__
+
+
+def count_tasks_by_status(db: Session, project_id: str) -> dict[str, int]:
+    rows = (
+        db.query(DBTask.status, func.count(DBTask.id))
+        .filter(DBTask.project_id == project_id)
+        .group_by(DBTask.status)
+        .all()
+    )
+    return {status: count for status, count in rows}
+
+
+def get_status_counts(db: Session, project_id: str) -> dict[str, int]:
+    if not settings.TASK_STATUS_COUNTERS:
+        return count_tasks_by_status(db, project_id)
+
+    rows = (
+        db.query(ProjectStatusCount.status, ProjectStatusCount.count)
+        .filter(ProjectStatusCount.project_id == project_id)
+        .all()
+    )
+    return {status: count for status, count in rows if count}
+
+
+def apply_status_deltas(db: Session, deltas: Counter) -> None:
+    connection = db.connection()
+    for (project_id, status), delta in deltas.items():
+        if not delta or project_id is None:
+            continue
+        # One statement, so that two first writers of a status cannot both insert
+        connection.execute(
+            upsert(connection, counts_table)
+            .values(project_id=project_id, status=status, count=delta)
+            .on_conflict_do_update(
+                index_elements=[counts_table.c.project_id, counts_table.c.status],
+                set_={"count": counts_table.c.count + delta},
+            )
+        )
+
+
+@on_changes
+def _track_status_counts(db: Session, changes: list[EntityChange]) -> None:
+    if not settings.TASK_STATUS_COUNTERS:
+        return
+
+    deltas = Counter()
+    for change in changes:
+        if change.entity == "project" and change.action == "delete":
+            db.connection().execute(
+                counts_table.delete().where(
+                    counts_table.c.project_id == change.project_id
+                )
+            )
+            continue
+        if change.entity != "task":
+            continue
+        if change.action == "update" and "status" not in change.fields:
+            continue
+        if change.action != "insert":
+            deltas[(change.project_id, change.old("status"))] -= 1
+        if change.action != "delete":
+            deltas[(change.project_id, change.new("status"))] += 1
+    apply_status_deltas(db, deltas)
+
+
+def find_count_mismatches(db: Session) -> list[tuple[str, str, int, int]]:
+    # (project_id, status, stored count, actual count) for every difference
+    actual = {
+        (project_id, status): count
+        for project_id, status, count in db.query(
+            DBTask.project_id, DBTask.status, func.count(DBTask.id)
+        )
+        .group_by(DBTask.project_id, DBTask.status)
+        .all()
+    }
+    stored = {
+        (row.project_id, row.status): row.count
+        for row in db.query(ProjectStatusCount).all()
+    }
+    mismatches = []
+    for key in sorted(actual.keys() | stored.keys(), key=str):
+        if actual.get(key, 0) != stored.get(key, 0):
+            mismatches.append((*key, stored.get(key, 0), actual.get(key, 0)))
+    return mismatches
+
+
+def rebuild_status_counts(db: Session) -> None:
+    db.execute(counts_table.delete())
+    db.execute(
+        insert(counts_table).from_select(
+            ["project_id", "status", "count"],
+            db.query(DBTask.project_id, DBTask.status, func.count(DBTask.id))
+            .filter(DBTask.project_id.is_not(None))
+            .group_by(DBTask.project_id, DBTask.status)
+            .statement,
+        )
+    )
+    db.commit()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# The app reads its settings at import: a throwaway database, no model, and
+# nothing running in the background to add statements of its own
+_database_dir = tempfile.mkdtemp()
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_database_dir, 'test.db')}",
+    VECTOR_INDEX_DIR=os.path.join(_database_dir, "vector_index"),
+    GEMINI_API_KEY="test",
+    LLM_SERVICE="none",
+    JOB_WORKERS="0",
+    SUMMARY_REFRESH_ENABLED="false",
+)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.core.db import async_engine, engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+class StatementCounter:
+    # Counts the statements sent to the database, by either engine
+    def __init__(self):
+        self.count = 0
+        self._engines = [engine]
+        if async_engine is not None:
+            self._engines.append(async_engine.sync_engine)
+
+    def _count(self, *args):
+        self.count += 1
+
+    def start(self) -> None:
+        for counted in self._engines:
+            event.listen(counted, "before_cursor_execute", self._count)
+
+    def stop(self) -> None:
+        for counted in self._engines:
+            event.remove(counted, "before_cursor_execute", self._count)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def statements():
+    counter = StatementCounter()
+    counter.start()
+    yield counter
+    counter.stop()
+
+
+@pytest.fixture
+def login(client):
+    def login(username: str | None = None) -> dict[str, str]:
+        username = username or f"user-{uuid.uuid4()}"
+        client.post("/api/register", json={"username": username, "password": "secret"})
+        response = client.post(
+            "/api/token", data={"username": username, "password": "secret"}
+        )
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return login
+
+
+@pytest.fixture
+def project(client, login):
+    # A new organization and project, with the headers of their only member
+    headers = login()
+    organization = client.post(
+        "/api/organizations", json={"name": f"organization-{uuid.uuid4()}"}, headers=headers
+    ).json()
+    project = client.post(
+        "/api/projects",
+        json={
+            "name": "project",
+            "description": "",
+            "organization_id": organization["id"],
+        },
+        headers=headers,
+    ).json()
+    project["user_id"] = organization["members"][0]["id"]
+    project["headers"] = headers
+    return project
+
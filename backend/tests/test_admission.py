@@ -0,0 +1,31 @@
+import pytest
+
+from app.main import app
+from app.services.llm_scheduler import LlmOverloaded
+from app.services.llm_service import AiService, get_llm_service
+
+
+class SaturatedService(AiService):
+    def admit(self) -> None:
+        raise LlmOverloaded("saturated", 5)
+
+
+@pytest.fixture
+def saturated():
+    app.dependency_overrides[get_llm_service] = SaturatedService
+    yield
+    del app.dependency_overrides[get_llm_service]
+
+
+def test_overload_is_reported_only_to_members(client, project, login, saturated):
+    url = f"/api/projects/{project['id']}/ask"
+    question = {"question": "What is left?"}
+
+    assert client.post(url, json=question, headers=project["headers"]).status_code == 429
+    assert client.post(url, json=question, headers=login()).status_code == 403
+    assert (
+        client.post("/api/projects/missing/ask", json=question, headers=project["headers"])
+        .status_code
+        == 404
+    )
+    assert client.post(url, json=question).status_code == 401
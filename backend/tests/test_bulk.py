@@ -0,0 +1,184 @@
+import uuid
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.services.task_counters import count_tasks_by_status, get_status_counts
+
+NOT_A_MEMBER = "Assigned user is not a member of this organization."
+
+
+def other_project(client, login) -> tuple[str, str, dict]:
+    # A project of another user's organization: (project id, user id, headers)
+    headers = login()
+    organization = client.post(
+        "/api/organizations", json={"name": f"organization-{uuid.uuid4()}"}, headers=headers
+    ).json()
+    project = client.post(
+        "/api/projects",
+        json={"name": "other", "description": "", "organization_id": organization["id"]},
+        headers=headers,
+    ).json()
+    return project["id"], organization["members"][0]["id"], headers
+
+
+def task_titles(client, project: dict) -> list[str]:
+    tasks = client.get(f"/api/projects/{project['id']}/tasks", headers=project["headers"])
+    return sorted(task["title"] for task in tasks.json())
+
+
+def test_invalid_items_are_reported_by_index(client, project, login):
+    _, outsider, _ = other_project(client, login)
+
+    response = client.post(
+        f"/api/projects/{project['id']}/tasks/bulk",
+        json={
+            "tasks": [
+                {"title": "first", "description": ""},
+                {"title": "second", "description": "", "assigned_user_id": outsider},
+                {"title": "third", "description": "", "assigned_user_id": project["user_id"]},
+            ]
+        },
+        headers=project["headers"],
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [task["title"] for task in body["tasks"]] == ["first", "third"]
+    assert body["errors"] == [{"index": 1, "id": None, "detail": NOT_A_MEMBER}]
+    assert task_titles(client, project) == ["first", "third"]
+
+
+def test_atomic_batch_with_an_invalid_item_writes_nothing(client, project, login):
+    _, outsider, _ = other_project(client, login)
+
+    response = client.post(
+        f"/api/projects/{project['id']}/tasks/bulk",
+        json={
+            "tasks": [
+                {"title": "first", "description": ""},
+                {"title": "second", "description": "", "assigned_user_id": outsider},
+            ],
+            "atomic": True,
+        },
+        headers=project["headers"],
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == [{"index": 1, "id": None, "detail": NOT_A_MEMBER}]
+    assert task_titles(client, project) == []
+
+
+def test_items_of_another_project_are_rejected(client, project, login):
+    other_id, _, other_headers = other_project(client, login)
+    own = client.post(
+        f"/api/projects/{project['id']}/tasks",
+        json={"title": "own", "description": ""},
+        headers=project["headers"],
+    ).json()
+    foreign = client.post(
+        f"/api/projects/{other_id}/tasks",
+        json={"title": "foreign", "description": ""},
+        headers=other_headers,
+    ).json()
+    url = f"/api/projects/{project['id']}"
+
+    updated = client.patch(
+        f"{url}/tasks/bulk",
+        json={"tasks": [{"id": own["id"], "status": "done"}, {"id": foreign["id"], "status": "done"}]},
+        headers=project["headers"],
+    ).json()
+    subtasks = client.post(
+        f"{url}/subtasks/bulk",
+        json={"subtasks": [{"title": "step", "task_id": foreign["id"]}]},
+        headers=project["headers"],
+    ).json()
+    deleted = client.post(
+        f"{url}/tasks/bulk/delete", json={"ids": [foreign["id"]]}, headers=project["headers"]
+    ).json()
+
+    assert [task["id"] for task in updated["tasks"]] == [own["id"]]
+    assert updated["errors"] == [
+        {"index": 1, "id": foreign["id"], "detail": "Task not found in this project"}
+    ]
+    assert subtasks == {
+        "subtasks": [],
+        "errors": [{"index": 0, "id": None, "detail": "Task not found in this project"}],
+    }
+    assert deleted["deleted"] == []
+    assert deleted["errors"][0]["id"] == foreign["id"]
+    foreign_now = client.get(
+        f"/api/projects/{other_id}/tasks/{foreign['id']}", headers=other_headers
+    ).json()
+    assert foreign_now["status"] == "todo"
+
+
+def test_update_to_a_non_member_assignee_is_rejected(client, project, login):
+    _, outsider, _ = other_project(client, login)
+    task = client.post(
+        f"/api/projects/{project['id']}/tasks",
+        json={"title": "own", "description": ""},
+        headers=project["headers"],
+    ).json()
+
+    response = client.patch(
+        f"/api/projects/{project['id']}/tasks/bulk",
+        json={"tasks": [{"id": task["id"], "assigned_user_id": outsider}]},
+        headers=project["headers"],
+    )
+
+    assert response.json() == {
+        "tasks": [],
+        "errors": [{"index": 0, "id": task["id"], "detail": NOT_A_MEMBER}],
+    }
+
+
+def test_bulk_writes_reach_counters_search_and_change_log(client, project, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_STATUS_COUNTERS", True)
+    url = f"/api/projects/{project['id']}"
+    headers = project["headers"]
+
+    def counts() -> dict[str, int]:
+        with SessionLocal() as db:
+            stored = get_status_counts(db, project["id"])
+            assert stored == count_tasks_by_status(db, project["id"])
+            return stored
+
+    def found(query: str) -> set[str]:
+        results = client.get(f"{url}/search", params={"q": query}, headers=headers).json()
+        return {result["entity_id"] for result in results}
+
+    def logged() -> list[tuple[str, str, str]]:
+        changes = client.get(f"{url}/changes", headers=headers).json()["changes"]
+        return [(change["entity"], change["action"], change["entity_id"]) for change in changes]
+
+    tasks = client.post(
+        f"{url}/tasks/bulk",
+        json={"tasks": [{"title": f"zeppelin {n}", "description": ""} for n in range(3)]},
+        headers=headers,
+    ).json()["tasks"]
+    ids = [task["id"] for task in tasks]
+    subtask = client.post(
+        f"{url}/subtasks/bulk",
+        json={"subtasks": [{"title": "inflate the zeppelin", "task_id": ids[0]}]},
+        headers=headers,
+    ).json()["subtasks"][0]
+    assert counts() == {"todo": 3}
+    assert found("zeppelin") == {*ids, subtask["id"]}
+    assert logged() == [
+        ("project", "insert", project["id"]),
+        *[("task", "insert", task_id) for task_id in ids],
+        ("subtask", "insert", subtask["id"]),
+    ]
+
+    client.patch(
+        f"{url}/tasks/bulk", json={"tasks": [{"id": ids[1], "status": "done"}]}, headers=headers
+    )
+    assert counts() == {"todo": 2, "done": 1}
+    assert logged()[-1] == ("task", "update", ids[1])
+
+    client.post(f"{url}/tasks/bulk/delete", json={"ids": ids[:2]}, headers=headers)
+    assert counts() == {"todo": 1}
+    assert found("zeppelin") == {ids[2]}
+    assert sorted(logged()[-3:]) == sorted(
+        [("subtask", "delete", subtask["id"]), ("task", "delete", ids[0]), ("task", "delete", ids[1])]
+    )
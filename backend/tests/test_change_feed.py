@@ -0,0 +1,90 @@
+from collections import Counter
+
+import pytest
+
+
+def follow(client, url: str, headers: dict, key: str, since: int, limit: int):
+    # Pages through a feed as a client would: from the last change's
+    # revision while there is more, then from the feed's revision. Returns
+    # the pages and that revision.
+    pages = []
+    while True:
+        page = client.get(url, params={"since": since, "limit": limit}, headers=headers).json()
+        pages.append(page["changes"])
+        if not page["has_more"]:
+            return pages, page["revision"]
+        since = page["changes"][-1][key]
+
+
+def write(client, project: dict) -> None:
+    # Revisions of one to five changes
+    url = f"/api/projects/{project['id']}"
+    headers = project["headers"]
+    tasks = client.post(
+        f"{url}/tasks/bulk",
+        json={"tasks": [{"title": f"task {n}", "description": ""} for n in range(5)]},
+        headers=headers,
+    ).json()["tasks"]
+    client.post(f"{url}/tasks", json={"title": "single", "description": ""}, headers=headers)
+    client.patch(
+        f"{url}/tasks/bulk",
+        json={"tasks": [{"id": task["id"], "status": "done"} for task in tasks[:3]]},
+        headers=headers,
+    )
+    client.post(f"{url}/tasks/bulk/delete", json={"ids": [tasks[4]["id"]]}, headers=headers)
+
+
+@pytest.fixture(params=["project", "organization"])
+def feed(request, client, project):
+    # (url, revision key) of the project's feed, or of its organization's
+    # with a second project writing to it too
+    write(client, project)
+    if request.param == "project":
+        return f"/api/projects/{project['id']}/changes", "revision"
+    other = client.post(
+        "/api/projects",
+        json={"name": "other", "description": "", "organization_id": project["organization_id"]},
+        headers=project["headers"],
+    ).json()
+    write(client, {**other, "headers": project["headers"]})
+    return f"/api/organizations/{project['organization_id']}/changes", "organization_revision"
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 7])
+def test_pages_hold_whole_revisions_and_resume_without_gaps(client, project, feed, limit):
+    url, key = feed
+    headers = project["headers"]
+    [everything], revision = follow(client, url, headers, key, 0, 1000)
+    sizes = Counter(change[key] for change in everything)
+    assert max(sizes.values()) == 5
+
+    pages, paged_revision = follow(client, url, headers, key, 0, limit)
+
+    for page in pages:
+        assert page
+        for page_revision, size in Counter(change[key] for change in page).items():
+            assert size == sizes[page_revision]
+        # Only a revision larger than a page makes the page longer
+        assert len(page) <= limit or len(set(change[key] for change in page)) == 1
+    assert [change for page in pages for change in page] == everything
+    assert paged_revision == revision == everything[-1][key]
+
+
+def test_client_resumes_from_the_feed_revision(client, project):
+    url = f"/api/projects/{project['id']}/changes"
+    headers = project["headers"]
+    write(client, project)
+    _, revision = follow(client, url, headers, "revision", 0, 3)
+
+    task = client.post(
+        f"/api/projects/{project['id']}/tasks",
+        json={"title": "later", "description": ""},
+        headers=headers,
+    ).json()
+
+    pages, latest = follow(client, url, headers, "revision", revision, 3)
+    assert [(c["entity"], c["action"], c["entity_id"]) for c in pages[0]] == [
+        ("task", "insert", task["id"])
+    ]
+    assert latest == revision + 1
+    assert follow(client, url, headers, "revision", latest, 3) == ([[]], latest)
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.main import app
+from app.services.chat import SUMMARY_REQUEST, ChatSession, chat_sessions
+from app.services.llm_service import AiService, LlmException, get_llm_service
+
+
+class RecordingService(AiService):
+    # Answers every message, or fails while `failing`, keeping what it was sent
+    def __init__(self):
+        super().__init__()
+        self.calls: list[tuple[str, list[dict]]] = []
+        self.failing = False
+
+    def converse(self, context: str, turns: list[dict]) -> str:
+        self.calls.append((context, turns))
+        if self.failing:
+            raise LlmException("unavailable")
+        if turns[-1]["content"] == SUMMARY_REQUEST:
+            return "We talked about the plan."
+        return f"answer {len(self.calls)}"
+
+    def sent(self) -> str:
+        # The last user message of the last call
+        return self.calls[-1][1][-1]["content"]
+
+
+@pytest.fixture
+def service():
+    service = RecordingService()
+    app.dependency_overrides[get_llm_service] = lambda: service
+    yield service
+    del app.dependency_overrides[get_llm_service]
+
+
+@pytest.fixture
+def chat(client, project, service):
+    headers = project["headers"]
+    session = client.post(f"/api/projects/{project['id']}/chat", headers=headers).json()
+
+    def send(question: str):
+        return client.post(
+            f"/api/chat/{session['id']}/messages",
+            json={"question": question},
+            headers=headers,
+        )
+
+    def add_task(title: str) -> None:
+        client.post(
+            f"/api/projects/{project['id']}/tasks",
+            json={"title": title, "description": ""},
+            headers=headers,
+        )
+
+    return session["id"], send, add_task
+
+
+def test_message_carries_changes_once(chat, service):
+    session_id, send, add_task = chat
+    assert send("What is left?").status_code == 200
+    assert service.sent() == "What is left?"
+
+    add_task("Write the release notes")
+    assert send("And now?").status_code == 200
+    assert "Changes to the project since my last message" in service.sent()
+    assert "Write the release notes" in service.sent()
+    assert service.sent().endswith("Question: And now?")
+
+    assert send("Anything else?").status_code == 200
+    assert service.sent() == "Anything else?"
+
+
+def test_failed_answer_keeps_changes_for_the_next_message(chat, service):
+    session_id, send, add_task = chat
+    send("What is left?")
+    add_task("Write the release notes")
+
+    service.failing = True
+    assert send("And now?").status_code == 500
+    service.failing = False
+    assert send("And now?").status_code == 200
+    assert "Write the release notes" in service.sent()
+    # The failed message is not in the history
+    assert [turn["content"] for turn in chat_sessions.get(session_id).turns][::2] == [
+        "What is left?",
+        service.sent(),
+    ]
+
+
+def test_large_changes_rewrite_the_context(chat, service, monkeypatch):
+    session_id, send, add_task = chat
+    send("What is left?")
+    snapshots = chat_sessions.snapshots
+    monkeypatch.setattr(settings, "CHAT_MAX_DELTA_TOKENS", 1)
+
+    add_task("Write the release notes")
+    assert send("And now?").status_code == 200
+    assert service.sent() == "And now?"
+    assert chat_sessions.snapshots == snapshots + 1
+    assert "Write the release notes" in service.calls[-1][0]
+
+
+def test_long_history_is_summarized(chat, service, monkeypatch):
+    session_id, send, add_task = chat
+    monkeypatch.setattr(settings, "CHAT_HISTORY_TOKEN_BUDGET", 1)
+    monkeypatch.setattr(settings, "CHAT_RECENT_EXCHANGES", 1)
+    send("What is left?")
+    send("Who is on it?")
+    summaries = chat_sessions.summaries
+
+    assert send("When is it due?").status_code == 200
+    assert chat_sessions.summaries == summaries + 1
+    session = chat_sessions.get(session_id)
+    assert session.summary == "We talked about the plan."
+    # The summary replaces all but the latest exchange before this one
+    assert [turn["content"] for turn in session.turns][::2] == [
+        "Who is on it?",
+        "When is it due?",
+    ]
+    assert "We talked about the plan." in service.calls[-1][0]
+
+
+def test_one_message_at_a_time():
+    session = ChatSession("project", "user", "model")
+
+    async def messages() -> list[bool]:
+        release = asyncio.Event()
+
+        async def answer() -> bool:
+            claimed = session.claim()
+            await release.wait()
+            return claimed
+
+        first = asyncio.create_task(answer())
+        await asyncio.sleep(0)
+        concurrent = session.claim()
+        release.set()
+        await first
+        return [first.result(), concurrent, session.claim()]
+
+    assert asyncio.run(messages()) == [True, False, True]
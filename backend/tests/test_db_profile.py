@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from alembic import command
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+from app.core import db
+from app.core.db_profile import apply_profile
+from app.services import migrations
+
+PRAGMAS = ("journal_mode", "busy_timeout", "foreign_keys")
+EXPECTED = ("wal", 5000, 1)
+
+
+def pragmas(connection) -> tuple:
+    return tuple(connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in PRAGMAS)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = apply_profile(create_engine(f"sqlite:///{tmp_path / 'profile.db'}"))
+    yield engine
+    engine.dispose()
+
+
+def test_new_connections_get_the_pragmas(engine):
+    with engine.connect() as first, engine.connect() as second:
+        assert pragmas(first) == pragmas(second) == EXPECTED
+
+
+def test_application_engines_get_the_pragmas():
+    db.engine.pool.dispose()
+    with db.engine.connect() as connection:
+        assert pragmas(connection) == EXPECTED
+    if db.async_engine is None:
+        return
+
+    async def async_pragmas():
+        async with db.async_engine.connect() as connection:
+            return await connection.run_sync(pragmas)
+
+    assert asyncio.run(async_pragmas()) == EXPECTED
+
+
+def test_foreign_keys_are_enforced(engine):
+    migrations.migrate(engine)
+    with pytest.raises(IntegrityError), engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO tasks (id, title, description, status, project_id) "
+                "VALUES ('task', 'task', '', 'todo', 'no such project')"
+            )
+        )
+
+
+def test_migrations_copy_referenced_tables(engine):
+    # Dropping the deleted_at columns copies organizations and projects,
+    # which the rows below refer to
+    migrations.migrate(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO organizations (id, name) VALUES ('o', 'o')"))
+        connection.execute(
+            text(
+                "INSERT INTO projects (id, name, description, organization_id) "
+                "VALUES ('p', 'p', '', 'o')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO tasks (id, title, description, status, project_id) "
+                "VALUES ('t', 't', '', 'todo', 'p')"
+            )
+        )
+
+    with migrations.migration_connection(engine) as connection:
+        command.downgrade(migrations._config(connection), "0002")
+    migrations.migrate(engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT project_id FROM tasks")).scalar() == "p"
+        assert connection.exec_driver_sql("PRAGMA foreign_key_check").all() == []
+        assert pragmas(connection) == EXPECTED
@@ -0,0 +1,172 @@
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.models.comment import Comment as DBComment
+from app.models.job import Job
+from app.models.organization import Organization as DBOrganization
+from app.models.project import Project as DBProject
+from app.models.subtask import Subtask as DBSubtask
+from app.models.task import Task as DBTask
+from app.services import deletion
+from app.services.chat import chat_sessions
+
+
+def add_tasks(project: dict, count: int) -> list[str]:
+    # `count` tasks, each with a subtask and a comment
+    with SessionLocal() as db:
+        tasks = [
+            DBTask(title=f"task {number}", description="", project_id=project["id"])
+            for number in range(count)
+        ]
+        db.add_all(tasks)
+        db.flush()
+        for task in tasks:
+            db.add(DBSubtask(title="subtask", description="", task_id=task.id))
+            db.add(DBComment(content="comment", task_id=task.id, user_id=project["user_id"]))
+        db.commit()
+        return [task.id for task in tasks]
+
+
+def remaining(task_ids: list[str]) -> tuple[int, int, int]:
+    # The tasks, subtasks and comments still stored, deleted project or not
+    with SessionLocal() as db:
+        return tuple(
+            db.execute(
+                select(func.count()).select_from(table).where(column.in_(task_ids))
+            ).scalar()
+            for table, column in (
+                (deletion.tasks_table, deletion.tasks_table.c.id),
+                (deletion.subtasks_table, deletion.subtasks_table.c.task_id),
+                (deletion.comments_table, deletion.comments_table.c.task_id),
+            )
+        )
+
+
+def stored(table, entity_id: str) -> bool:
+    with SessionLocal() as db:
+        return db.execute(select(table.c.id).where(table.c.id == entity_id)).first() is not None
+
+
+def test_small_project_is_purged_inline(client, project):
+    task_ids = add_tasks(project, 3)
+
+    response = client.delete(f"/api/projects/{project['id']}", headers=project["headers"])
+
+    assert response.status_code == 204
+    assert remaining(task_ids) == (0, 0, 0)
+    assert not stored(deletion.projects_table, project["id"])
+
+
+def test_purge_goes_a_chunk_at_a_time(project, monkeypatch):
+    monkeypatch.setattr(settings, "DELETE_CHUNK_SIZE", 2)
+    task_ids = add_tasks(project, 5)
+    with SessionLocal() as db:
+        # Nothing is purged from a project that is not deleted
+        assert deletion.purge_project_chunk(db, project["id"]) == 0
+        deletion._hide_projects(db, deletion.projects_table.c.id == project["id"])
+        db.commit()
+
+        chunks = []
+        while chunk := deletion.purge_project_chunk(db, project["id"]):
+            chunks.append(chunk)
+            assert remaining(task_ids)[0] == 5 - sum(chunks)
+        assert chunks == [2, 2, 1]
+        assert remaining(task_ids) == (0, 0, 0)
+        assert stored(deletion.projects_table, project["id"])
+
+        deletion.finish_project_purge(db, project["id"])
+    assert not stored(deletion.projects_table, project["id"])
+
+
+def test_background_delete_hands_the_purge_to_a_job(client, project):
+    task_ids = add_tasks(project, 2)
+
+    response = client.delete(
+        f"/api/projects/{project['id']}?background=true", headers=project["headers"]
+    )
+
+    assert response.status_code == 202
+    job = response.json()
+    assert job["kind"] == "purge_project"
+    assert job["status"] == "queued"
+    assert response.headers["Location"] == f"/api/jobs/{job['id']}"
+    # Hidden at once, purged by the job
+    assert client.get(f"/api/projects/{project['id']}", headers=project["headers"]).status_code == 404
+    assert remaining(task_ids) == (2, 2, 2)
+    with SessionLocal() as db:
+        assert deletion.purge_project(db, project["id"]) == 2
+        assert db.get(Job, job["id"]).project_id is None
+    assert remaining(task_ids) == (0, 0, 0)
+
+
+def test_full_queue_leaves_the_project_as_it_was(client, project, monkeypatch):
+    task_ids = add_tasks(project, 2)
+    session = client.post(f"/api/projects/{project['id']}/chat", headers=project["headers"]).json()
+    monkeypatch.setattr(settings, "JOB_QUEUE_MAX_DEPTH", 0)
+
+    response = client.delete(
+        f"/api/projects/{project['id']}?background=true", headers=project["headers"]
+    )
+
+    assert response.status_code == 503
+    assert client.get(f"/api/projects/{project['id']}", headers=project["headers"]).status_code == 200
+    assert remaining(task_ids) == (2, 2, 2)
+    # Nor did anything outside the database go with it
+    assert chat_sessions.get(session["id"]) is not None
+
+
+def test_deleted_project_is_hidden_from_lists_and_gets(client, project):
+    url = f"/api/organizations/{project['organization_id']}/projects"
+    headers = project["headers"]
+    assert [p["id"] for p in client.get(url, headers=headers).json()] == [project["id"]]
+
+    client.delete(f"/api/projects/{project['id']}?background=true", headers=headers)
+
+    assert client.get(url, headers=headers).json() == []
+    assert client.get(f"/api/projects/{project['id']}", headers=headers).status_code == 404
+    with SessionLocal() as db:
+        assert db.get(DBProject, project["id"]) is None
+        assert db.scalars(
+            select(DBProject)
+            .where(DBProject.id == project["id"])
+            .execution_options(include_deleted=True)
+        ).one()
+        deletion.purge_project(db, project["id"])
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_organization_delete_takes_its_projects(client, project, background):
+    headers = project["headers"]
+    other = client.post(
+        "/api/projects",
+        json={
+            "name": f"project-{uuid.uuid4()}",
+            "description": "",
+            "organization_id": project["organization_id"],
+        },
+        headers=headers,
+    ).json()
+    other["user_id"] = project["user_id"]
+    task_ids = add_tasks(project, 2) + add_tasks(other, 1)
+
+    response = client.delete(
+        f"/api/organizations/{project['organization_id']}?background={str(background).lower()}",
+        headers=headers,
+    )
+
+    assert response.status_code == (202 if background else 204)
+    for project_id in (project["id"], other["id"]):
+        assert client.get(f"/api/projects/{project_id}", headers=headers).status_code == 404
+    assert project["organization_id"] not in [
+        organization["id"] for organization in client.get("/api/organizations", headers=headers).json()
+    ]
+    if background:
+        with SessionLocal() as db:
+            assert db.get(DBOrganization, project["organization_id"]) is None
+            assert deletion.purge_organization(db, project["organization_id"]) == 3
+    assert remaining(task_ids) == (0, 0, 0)
+    assert not stored(deletion.organizations_table, project["organization_id"])
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from app.main import app
+from app.services.llm_service import AiService, get_llm_service
+
+# What a model might return: usable items around ones without a title
+GENERATED = [
+    {"id": "1", "title": "Set up CI", "description": "Run the tests on push"},
+    {"id": "2", "description": "No title"},
+    "not an object",
+    {"id": "3", "title": "Write docs"},
+]
+
+
+class FakeService(AiService):
+    async def aget_tasks(self, prompt: str) -> list[dict]:
+        return GENERATED
+
+    async def stream_tasks(self, prompt: str):
+        for item in GENERATED:
+            yield item
+
+
+@pytest.fixture
+def generated():
+    app.dependency_overrides[get_llm_service] = FakeService
+    yield
+    del app.dependency_overrides[get_llm_service]
+
+
+def events(response) -> list[tuple[str, dict]]:
+    parsed = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+def test_stream_skips_items_without_a_title(client, project, generated):
+    response = client.post(
+        f"/api/projects/{project['id']}/tasks/generate",
+        params={"objective": "release", "stream": True},
+        headers=project["headers"],
+    )
+
+    assert response.status_code == 200
+    assert [event for event, _ in events(response)] == [
+        "task", "error", "error", "task", "done"
+    ]
+    assert events(response)[-1][1] == {"count": 2}
+    tasks = client.get(
+        f"/api/projects/{project['id']}/tasks", headers=project["headers"]
+    ).json()
+    assert sorted(task["title"] for task in tasks) == ["Set up CI", "Write docs"]
+
+
+def test_buffered_generation_skips_items_without_a_title(client, project, generated):
+    response = client.post(
+        f"/api/projects/{project['id']}/tasks/generate",
+        params={"objective": "release"},
+        headers=project["headers"],
+    )
+
+    assert response.status_code == 200
+    assert sorted(task["title"] for task in response.json()) == ["Set up CI", "Write docs"]
+    task_id = response.json()[0]["id"]
+
+    response = client.post(
+        f"/api/projects/{project['id']}/tasks/{task_id}/subtasks/generate",
+        params={"objective": "release", "stream": True},
+        headers=project["headers"],
+    )
+
+    assert [event for event, _ in events(response)] == [
+        "subtask", "error", "error", "subtask", "done"
+    ]
@@ -0,0 +1,38 @@
+import asyncio
+
+from app.core.db import SessionLocal
+from app.models.job import Job
+from app.services.jobs import JobContext, JobWorkerPool, job_handler
+from app.services.llm_service import AiService
+
+
+@job_handler("test_wait")
+async def wait_job(job: JobContext) -> None:
+    await asyncio.Event().wait()
+
+
+def job_state(job_id: str) -> tuple[str, int]:
+    with SessionLocal() as db:
+        job = db.get(Job, job_id)
+        return job.status, job.attempts
+
+
+def test_shutdown_requeue_is_not_an_attempt(client):
+    with SessionLocal() as db:
+        job = Job(kind="test_wait", params={}, timeout_seconds=60)
+        db.add(job)
+        db.commit()
+        job_id = job.id
+
+    async def run_until_shutdown() -> tuple[str, int]:
+        workers = JobWorkerPool(1, service_factory=AiService)
+        workers.start()
+        while job_state(job_id)[0] != "running":
+            await asyncio.sleep(0.01)
+        running = job_state(job_id)
+        await workers.stop()
+        return running
+
+    for _ in range(2):
+        assert asyncio.run(run_until_shutdown()) == ("running", 1)
+        assert job_state(job_id) == ("queued", 0)
@@ -0,0 +1,74 @@
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.core.security import get_current_user, principal_cache
+from app.models.user import User as DBUser
+
+
+def counts() -> tuple[int, int]:
+    return principal_cache.hits, principal_cache.misses
+
+
+def test_repeat_requests_hit_the_cache(client, login):
+    headers = login()
+    hits, misses = counts()
+
+    assert client.get("/api/organizations", headers=headers).status_code == 200
+    assert counts() == (hits, misses + 1)
+    assert client.get("/api/organizations", headers=headers).status_code == 200
+    assert counts() == (hits + 1, misses + 1)
+
+
+def test_hit_is_answered_without_the_session(client, login):
+    # Nothing on a cached principal can lazy load, so no session is involved
+    headers = login()
+    token = headers["Authorization"].removeprefix("Bearer ")
+    client.get("/api/organizations", headers=headers)
+
+    principal = asyncio.run(get_current_user(token, db=None))
+
+    assert principal.model_dump().keys() == {"id", "username"}
+    assert principal == principal_cache.get(token)
+
+
+def test_cached_principal_serves_writes(client, login):
+    headers = login()
+    client.get("/api/organizations", headers=headers)
+    hits = principal_cache.hits
+
+    response = client.post(
+        "/api/organizations", json={"name": f"organization-{uuid.uuid4()}"}, headers=headers
+    )
+
+    assert principal_cache.hits == hits + 1
+    assert response.status_code == 201
+    assert len(response.json()["members"]) == 1
+
+
+def test_entries_expire(client, login, monkeypatch):
+    monkeypatch.setattr(settings, "PRINCIPAL_CACHE_TTL_SECONDS", 0.05)
+    headers = login()
+    client.get("/api/organizations", headers=headers)
+    hits, misses = counts()
+
+    time.sleep(0.1)
+    client.get("/api/organizations", headers=headers)
+
+    assert counts() == (hits, misses + 1)
+
+
+def test_deleting_a_user_forgets_their_tokens(client, login):
+    username = f"user-{uuid.uuid4()}"
+    headers = login(username)
+    assert client.get("/api/organizations", headers=headers).status_code == 200
+
+    with SessionLocal() as db:
+        db.delete(db.scalars(select(DBUser).where(DBUser.username == username)).one())
+        db.commit()
+
+    assert client.get("/api/organizations", headers=headers).status_code == 401
@@ -0,0 +1,40 @@
+from app.core.config import settings
+from app.services.llm_service import OllamaService, OpenAIService, current_project_id
+
+
+def cache_options(service: OpenAIService, project_id: str | None) -> dict | None:
+    token = current_project_id.set(project_id)
+    try:
+        return service._completion_args([], False).get("extra_body")
+    finally:
+        current_project_id.reset(token)
+
+
+def keep_alive(service: OllamaService, project_id: str | None) -> str:
+    token = current_project_id.set(project_id)
+    try:
+        return service._chat_args([], False)["keep_alive"]
+    finally:
+        current_project_id.reset(token)
+
+
+def test_projects_override_the_prompt_cache_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LLAMACPP_SLOTS", 2)
+    monkeypatch.setattr(settings, "LLAMACPP_CACHE_PROMPT", True)
+    monkeypatch.setattr(settings, "OLLAMA_KEEP_ALIVE", "30m")
+    monkeypatch.setattr(
+        settings,
+        "PROMPT_CACHE_PROJECTS",
+        {
+            "unpinned": {"pin_slot": False},
+            "uncached": {"cache_prompt": False, "keep_alive": "0"},
+        },
+    )
+    llamacpp, ollama = OpenAIService(), OllamaService()
+
+    assert cache_options(llamacpp, "pinned") == {"cache_prompt": True, "id_slot": 0}
+    assert cache_options(llamacpp, "unpinned") == {"cache_prompt": True}
+    assert cache_options(llamacpp, "uncached") is None
+    assert cache_options(llamacpp, None) == {"cache_prompt": True}
+    assert keep_alive(ollama, "pinned") == "30m"
+    assert keep_alive(ollama, "uncached") == "0"
@@ -0,0 +1,132 @@
+import pytest
+from alembic import command
+from sqlalchemy import Select, create_engine, func, inspect, select, text
+
+from app.models.comment import Comment as DBComment
+from app.models.project import Project as DBProject
+from app.models.subtask import Subtask as DBSubtask
+from app.models.task import Task as DBTask
+from app.models.user import User as DBUser, user_organization_association
+from app.services import migrations
+
+# The per-project and per-task reads behind the listings, with placeholder ids
+HOT_QUERIES: dict[str, Select] = {
+    "tasks of a project by status": select(DBTask)
+    .where(DBTask.project_id == "project")
+    .order_by(DBTask.status, DBTask.id)
+    .limit(50),
+    "tasks of a project by due date": select(DBTask)
+    .where(DBTask.project_id == "project", DBTask.due_date.is_not(None))
+    .order_by(DBTask.due_date, DBTask.id)
+    .limit(50),
+    "tasks of a project by assignee": select(DBTask)
+    .where(DBTask.project_id == "project", DBTask.assigned_user_id == "user")
+    .order_by(DBTask.id)
+    .limit(50),
+    "task status counts": select(DBTask.status, func.count())
+    .where(DBTask.project_id == "project")
+    .group_by(DBTask.status),
+    "tasks assigned to a user": select(DBTask.id).where(DBTask.assigned_user_id == "user"),
+    "tasks due before a date": select(DBTask.id).where(DBTask.due_date < "2000-01-01"),
+    "comments of a task": select(DBComment)
+    .where(DBComment.task_id == "task")
+    .order_by(DBComment.created_at),
+    "subtasks of a task": select(DBSubtask).where(DBSubtask.task_id == "task"),
+    "projects of an organization": select(DBProject).where(
+        DBProject.organization_id == "organization"
+    ),
+    "members of an organization": select(DBUser)
+    .join(
+        user_organization_association,
+        user_organization_association.c.user_id == DBUser.id,
+    )
+    .where(user_organization_association.c.organization_id == "organization"),
+}
+
+# The index each listing query should be served by, all from revision 0002
+INDEXES = {
+    "tasks of a project by status": "ix_tasks_project_status_id",
+    "tasks of a project by due date": "ix_tasks_project_due_date_id",
+    "tasks of a project by assignee": "ix_tasks_project_assignee_id",
+    "task status counts": "ix_tasks_project_status_id",
+    "tasks assigned to a user": "ix_tasks_assigned_user_id",
+    "tasks due before a date": "ix_tasks_due_date",
+    "comments of a task": "ix_comments_task_created_at",
+    "subtasks of a task": "ix_subtasks_task_id",
+    "projects of an organization": "ix_projects_organization_id",
+    "members of an organization": "ix_user_organization_association_organization_id",
+}
+
+
+def _plans(engine) -> dict[str, list[str]]:
+    # The steps of each query's SQLite plan
+    plans = {}
+    with engine.connect() as connection:
+        for name, query in HOT_QUERIES.items():
+            sql = str(query.compile(connection, compile_kwargs={"literal_binds": True}))
+            plans[name] = [
+                row[3] for row in connection.execute(text("EXPLAIN QUERY PLAN " + sql))
+            ]
+    return plans
+
+
+def _unindexed_steps(plan: list[str]) -> list[str]:
+    # Full table scans, and sorts an index should have made unnecessary
+    return [
+        step
+        for step in plan
+        if (step.startswith("SCAN ") and "INDEX" not in step)
+        or step.startswith("USE TEMP B-TREE")
+    ]
+
+
+def _uses_index(name: str, plan: list[str]) -> bool:
+    return any(f"INDEX {INDEXES[name]} (" in step for step in plan)
+
+
+@pytest.fixture
+def new_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    migrations.migrate(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def baseline_database(tmp_path):
+    # A database at the 0001 baseline, as create_all left it before the
+    # schema had versions: without the indexes revision 0002 adds, including
+    # the composite ones it only creates where missing
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    migrations.migrate(engine)
+    with engine.begin() as connection:
+        command.downgrade(migrations._config(connection), migrations.BASELINE_REVISION)
+        for index in set(INDEXES.values()):
+            connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    yield engine
+    engine.dispose()
+
+
+def test_every_listing_query_is_checked():
+    assert set(INDEXES) == set(HOT_QUERIES)
+
+
+@pytest.mark.parametrize("name", INDEXES)
+def test_new_database_serves_listings_from_indexes(new_database, name):
+    plan = _plans(new_database)[name]
+    assert _unindexed_steps(plan) == []
+    assert _uses_index(name, plan), plan
+
+
+def test_upgrade_adds_the_listing_indexes(baseline_database):
+    # The baseline has no deleted_at for select(DBProject) to explain against
+    indexes = {
+        index["name"]
+        for table in inspect(baseline_database).get_table_names()
+        for index in inspect(baseline_database).get_indexes(table)
+    }
+    assert not indexes & set(INDEXES.values())
+    migrations.migrate(baseline_database)
+    for name, plan in _plans(baseline_database).items():
+        assert _unindexed_steps(plan) == [], (name, plan)
+        assert _uses_index(name, plan), (name, plan)
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import numpy as np
+
+from app.core.db import get_db
+from app.services import retrieval
+from app.services.embeddings import HashingEmbedder
+
+
+class BlockingEmbedder(HashingEmbedder):
+    # Like the provider clients: each request blocks its thread
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        time.sleep(0.2)
+        return super()._embed(texts)
+
+
+def test_embedding_does_not_block_the_event_loop(client, project, monkeypatch):
+    task = client.post(
+        f"/api/projects/{project['id']}/tasks",
+        json={"title": "Migrate billing", "description": "Move invoices to the new provider"},
+        headers=project["headers"],
+    ).json()
+    monkeypatch.setattr(retrieval, "get_embedder", lambda: BlockingEmbedder())
+
+    async def relevant_while_ticking() -> tuple[list[str], int]:
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        async for db in get_db():
+            # Builds the index, then embeds the query: two blocking requests
+            relevant = await retrieval.arelevant_task_ids(db, project["id"], "billing")
+        ticker.cancel()
+        return relevant, ticks
+
+    try:
+        relevant, ticks = asyncio.run(relevant_while_ticking())
+    finally:
+        retrieval.vector_indexes.forget(project["id"])
+    assert relevant == [task["id"]]
+    assert ticks > 20
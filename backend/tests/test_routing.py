@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.llm_resilience import BackendHealth
+from app.services.llm_service import AiService, LlmException, RoutedAiService
+
+
+class FakeBackend(AiService):
+    def __init__(self, name: str, delay: float = 0.0, error: BaseException | None = None):
+        super().__init__()
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def aask_question(self, context: str, question: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.name
+
+
+def routed(*backends: FakeBackend, samples: int = 0, latency: float = 0.05):
+    healths = []
+    for backend in backends:
+        health = BackendHealth(backend.name)
+        for _ in range(samples):
+            health.latency.add(latency)
+        healths.append(health)
+    return RoutedAiService(list(zip(backends, healths))), healths
+
+
+def ask(service: RoutedAiService) -> str:
+    return asyncio.run(service.aask_question("context", "question"))
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_PERCENTILE", 95.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 5)
+
+
+def test_falls_back_to_the_second_backend_before_latency_is_known(hedging):
+    service, healths = routed(
+        FakeBackend("first", error=LlmException("down")), FakeBackend("second")
+    )
+
+    assert ask(service) == "second"
+    assert healths[1].hedged == 0
+
+
+def test_falls_back_when_the_first_backend_fails_before_the_hedge(hedging):
+    second = FakeBackend("second")
+    service, healths = routed(
+        FakeBackend("first", error=LlmException("down")), second, samples=5
+    )
+
+    assert ask(service) == "second"
+    assert second.calls == 1
+    assert (healths[1].hedged, healths[1].hedges_won) == (0, 0)
+
+
+def test_races_a_slow_first_backend(hedging):
+    first = FakeBackend("first", delay=1.0)
+    service, healths = routed(first, FakeBackend("second"), samples=5, latency=0.01)
+
+    assert ask(service) == "second"
+    assert first.calls == 1
+    assert (healths[1].hedged, healths[1].hedges_won) == (1, 1)
+
+
+def test_moves_past_both_hedged_backends_when_they_fail(hedging):
+    first = FakeBackend("first", error=LlmException("down"))
+    second = FakeBackend("second", error=LlmException("down"))
+    service, _ = routed(first, second, FakeBackend("third"), samples=5)
+
+    assert ask(service) == "third"
+    assert (first.calls, second.calls) == (1, 1)
+
+
+def test_a_cancelled_call_counts_as_a_failure(hedging):
+    service, _ = routed(
+        FakeBackend("first", error=asyncio.CancelledError()), FakeBackend("second"), samples=5
+    )
+
+    assert ask(service) == "second"
+
+
+def test_without_hedging_backends_are_tried_in_turn():
+    service, healths = routed(
+        FakeBackend("first", error=LlmException("down")), FakeBackend("second")
+    )
+
+    assert ask(service) == "second"
+    assert healths[1].hedged == 0
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.llm_service import AiService, CoalescingAiService
+from app.services.single_flight import SingleFlight
+
+
+class GatedService(AiService):
+    # Answers once `release` is set, counting the calls that reach it
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def aask_question(self, context: str, question: str) -> str:
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if question == "fail":
+            raise RuntimeError("backend failed")
+        return f"answer {self.calls}"
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_calls_share_one_backend_call():
+    async def scenario():
+        backend = GatedService()
+        flights = SingleFlight()
+        service = CoalescingAiService(backend, flights)
+        asks = [
+            asyncio.create_task(service.aask_question("context", "question"))
+            for _ in range(10)
+        ]
+        await settle()
+        assert flights.stats() == {"in_flight": 1, "runs": 1, "shared": 9}
+        backend.release.set()
+        assert await asyncio.gather(*asks) == ["answer 1"] * 10
+        assert backend.calls == 1
+        assert flights.stats()["in_flight"] == 0
+
+        # Once landed, the next call is a new run
+        assert await service.aask_question("context", "question") == "answer 2"
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_do_not_share():
+    async def scenario():
+        backend = GatedService()
+        backend.release.set()
+        service = CoalescingAiService(backend, SingleFlight())
+        await asyncio.gather(
+            service.aask_question("context", "one"),
+            service.aask_question("context", "two"),
+        )
+        assert backend.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_run_to_the_others():
+    async def scenario():
+        backend = GatedService()
+        flights = SingleFlight()
+        service = CoalescingAiService(backend, flights)
+        first = asyncio.create_task(service.aask_question("context", "question"))
+        second = asyncio.create_task(service.aask_question("context", "question"))
+        await settle()
+
+        first.cancel()
+        await settle()
+        assert first.cancelled()
+        assert backend.cancelled == 0
+        assert flights.stats()["in_flight"] == 1
+
+        backend.release.set()
+        assert await second == "answer 1"
+        assert backend.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_run_is_cancelled_when_every_waiter_is():
+    async def scenario():
+        backend = GatedService()
+        flights = SingleFlight()
+        service = CoalescingAiService(backend, flights)
+        asks = [
+            asyncio.create_task(service.aask_question("context", "question"))
+            for _ in range(3)
+        ]
+        await settle()
+        for ask in asks:
+            ask.cancel()
+        await settle()
+
+        assert backend.cancelled == 1
+        assert flights.stats()["in_flight"] == 0
+
+        # A later caller starts afresh instead of joining the cancelled run
+        backend.release.set()
+        assert await service.aask_question("context", "question") == "answer 2"
+
+    asyncio.run(scenario())
+
+
+def test_failure_reaches_every_waiter():
+    async def scenario():
+        backend = GatedService()
+        flights = SingleFlight()
+        service = CoalescingAiService(backend, flights)
+        asks = [
+            asyncio.create_task(service.aask_question("context", "fail"))
+            for _ in range(3)
+        ]
+        await settle()
+        backend.release.set()
+        results = await asyncio.gather(*asks, return_exceptions=True)
+
+        assert [type(result) for result in results] == [RuntimeError] * 3
+        assert backend.calls == 1
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_sync_calls_share_one_backend_call():
+    flights = SingleFlight()
+    calls = 0
+    release = threading.Event()
+
+    def answer() -> str:
+        nonlocal calls
+        calls += 1
+        release.wait(5)
+        return "answer"
+
+    with ThreadPoolExecutor(5) as executor:
+        results = [executor.submit(flights.run_sync, "key", answer) for _ in range(5)]
+        while flights.stats()["shared"] < 4:
+            time.sleep(0.001)
+        release.set()
+        assert [result.result() for result in results] == ["answer"] * 5
+    assert calls == 1
+    assert flights.stats() == {"in_flight": 0, "runs": 1, "shared": 4}
+
+
+def test_sync_failure_reaches_every_caller():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fail() -> str:
+        release.wait(5)
+        raise RuntimeError("backend failed")
+
+    with ThreadPoolExecutor(3) as executor:
+        results = [executor.submit(flights.run_sync, "key", fail) for _ in range(3)]
+        while flights.stats()["shared"] < 2:
+            time.sleep(0.001)
+        release.set()
+        for result in results:
+            with pytest.raises(RuntimeError):
+                result.result()
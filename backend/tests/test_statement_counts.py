@@ -0,0 +1,79 @@
+import uuid
+
+import pytest
+from sqlalchemy import insert
+
+from app.core.db import SessionLocal
+from app.core.permissions import membership_cache, project_organization_cache
+from app.models.comment import Comment as DBComment
+from app.models.subtask import Subtask as DBSubtask
+from app.models.task import Task as DBTask
+from app.models.user import User as DBUser, user_organization_association
+
+# The most statements each list or detail endpoint may issue, whatever the
+# number of rows it returns, with the membership caches cold. The AI summary
+# is generated and stored on this first request.
+MAX_STATEMENTS = {
+    "/api/projects/{project}": 2,
+    "/api/projects/{project}/tasks": 3,
+    "/api/projects/{project}/tasks/{task}": 3,
+    "/api/projects/{project}/tasks/{task}/comments": 4,
+    "/api/projects/{project}/tasks/{task}/subtasks": 4,
+    "/api/organizations": 2,
+    "/api/organizations/{organization}": 3,
+    "/api/projects/{project}/ai_summary": 16,
+}
+
+
+def add_rows(project: dict, count: int) -> str:
+    # `count` more members in the organization and `count` tasks, one
+    # assigned to each, with a subtask and a comment. Returns the first task.
+    with SessionLocal() as db:
+        users = [
+            DBUser(username=f"member-{uuid.uuid4()}", hashed_password="")
+            for _ in range(count)
+        ]
+        db.add_all(users)
+        db.flush()
+        db.execute(
+            insert(user_organization_association),
+            [
+                {"user_id": user.id, "organization_id": project["organization_id"]}
+                for user in users
+            ],
+        )
+        tasks = [
+            DBTask(
+                title=f"task {number}",
+                description="",
+                project_id=project["id"],
+                assigned_user_id=user.id,
+            )
+            for number, user in enumerate(users)
+        ]
+        db.add_all(tasks)
+        db.flush()
+        for task in tasks:
+            db.add(DBSubtask(title="subtask", description="", task_id=task.id))
+            db.add(DBComment(content="comment", task_id=task.id, user_id=task.assigned_user_id))
+        db.commit()
+        return tasks[0].id
+
+
+@pytest.mark.parametrize("rows", [3, 30])
+@pytest.mark.parametrize("endpoint", MAX_STATEMENTS)
+def test_statements_do_not_grow_with_rows(client, project, statements, endpoint, rows):
+    task_id = add_rows(project, rows)
+    url = endpoint.format(
+        project=project["id"],
+        task=task_id,
+        organization=project["organization_id"],
+    )
+    membership_cache.clear()
+    project_organization_cache.clear()
+    statements.count = 0
+
+    response = client.get(url, headers=project["headers"])
+
+    assert response.status_code == 200
+    assert statements.count <= MAX_STATEMENTS[endpoint]
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.db import SessionLocal, get_db
+from app.main import app
+from app.models.project import Project as DBProject
+from app.models.task import Task as DBTask
+from app.services.llm_service import AiService, get_llm_service
+from app.services.summaries import refresh_summary, summary_refresher, summary_stats
+
+
+class SummaryService(AiService):
+    # Writes numbered summaries, keeping the contexts it was given
+    def __init__(self):
+        super().__init__()
+        self.contexts: list[str] = []
+
+    def get_summary(self, context: str) -> str:
+        self.contexts.append(context)
+        return f"summary {len(self.contexts)}"
+
+
+@pytest.fixture
+def service():
+    service = SummaryService()
+    app.dependency_overrides[get_llm_service] = lambda: service
+    yield service
+    del app.dependency_overrides[get_llm_service]
+
+
+@pytest.fixture
+def summarize(client, project, service):
+    # Stores a first, full summary and returns a refresh of it, as the
+    # summary job runs one: (summary, incremental updates, was incremental)
+    client.get(f"/api/projects/{project['id']}/ai_summary", headers=project["headers"])
+
+    async def refresh(full: bool):
+        sessions = get_db()
+        db = await anext(sessions)
+        try:
+            project_row = await db.get(DBProject, project["id"])
+            summary = await refresh_summary(db, project_row, service, full)
+            return summary.summary, summary.incremental_updates
+        finally:
+            await sessions.aclose()
+
+    def summarize(full: bool = False) -> tuple[str, int, bool]:
+        incremental = summary_stats.incremental
+        text, updates = asyncio.run(refresh(full))
+        return text, updates, summary_stats.incremental > incremental
+
+    return summarize
+
+
+def add_task(project: dict, title: str) -> None:
+    with SessionLocal() as db:
+        db.add(DBTask(title=title, description="", project_id=project["id"]))
+        db.commit()
+
+
+def test_headers_tell_a_stale_summary_from_a_fresh_one(client, project, service):
+    url = f"/api/projects/{project['id']}/ai_summary"
+    headers = project["headers"]
+
+    fresh = client.get(url, headers=headers)
+    assert fresh.json() == "summary 1"
+    assert fresh.headers["X-Summary-Stale"] == "false"
+    assert fresh.headers["X-Summary-Revision"] == fresh.headers["X-Project-Revision"]
+
+    add_task(project, "write the report")
+    served_stale = summary_stats.served_stale
+    stale = client.get(url, headers=headers)
+
+    # Served as stored, without asking the model again
+    assert stale.json() == "summary 1"
+    assert len(service.contexts) == 1
+    assert stale.headers["X-Summary-Stale"] == "true"
+    assert int(stale.headers["X-Summary-Revision"]) < int(stale.headers["X-Project-Revision"])
+    assert summary_stats.served_stale == served_stale + 1
+
+    refreshed = client.get(url, params={"refresh": True}, headers=headers)
+    assert refreshed.json() == "summary 2"
+    assert refreshed.headers["X-Summary-Stale"] == "false"
+    summary_refresher.forget([project["id"]])
+
+
+def test_refresh_is_incremental_until_a_full_one_is_due(
+    project, service, summarize, monkeypatch
+):
+    monkeypatch.setattr(settings, "SUMMARY_MAX_INCREMENTAL_UPDATES", 2)
+
+    # Nothing changed, so nothing is asked of the model
+    assert summarize() == ("summary 1", 0, False)
+
+    add_task(project, "order the paint")
+    assert summarize() == ("summary 2", 1, True)
+    assert "## Status summary at revision" in service.contexts[-1]
+    assert "summary 1" in service.contexts[-1]
+    assert "order the paint" in service.contexts[-1]
+
+    add_task(project, "paint the fence")
+    assert summarize() == ("summary 3", 2, True)
+
+    # Written from the whole project every SUMMARY_MAX_INCREMENTAL_UPDATES
+    add_task(project, "clean the brushes")
+    assert summarize() == ("summary 4", 0, False)
+    assert "## Changes since that summary" not in service.contexts[-1]
+    assert "order the paint" in service.contexts[-1]
+    summary_refresher.forget([project["id"]])
+
+
+def test_large_changes_and_full_requests_rewrite_the_summary(
+    project, service, summarize, monkeypatch
+):
+    add_task(project, "order the paint")
+    assert summarize(full=True) == ("summary 2", 0, False)
+
+    monkeypatch.setattr(settings, "SUMMARY_MAX_DELTA_TOKENS", 1)
+    add_task(project, "paint the fence")
+    assert summarize() == ("summary 3", 0, False)
+    assert "## Changes since that summary" not in service.contexts[-1]
+    summary_refresher.forget([project["id"]])
+
+
+def test_projects_are_marked_for_a_refresh_only_on_commit(project):
+    summary_refresher.forget([project["id"]])
+
+    with SessionLocal() as db:
+        db.add(DBTask(title="draft", description="", project_id=project["id"]))
+        db.flush()
+        db.rollback()
+    assert project["id"] not in summary_refresher._due
+
+    add_task(project, "kept")
+    assert project["id"] in summary_refresher._due
+    summary_refresher.forget([project["id"]])
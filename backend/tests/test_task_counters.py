@@ -0,0 +1,23 @@
+from collections import Counter
+
+from app.core.db import SessionLocal
+from app.services.task_counters import apply_status_deltas, counts_table
+
+
+def stored_counts(db, project_id: str) -> dict[str, int]:
+    rows = db.execute(
+        counts_table.select().where(counts_table.c.project_id == project_id)
+    ).all()
+    return {row.status: row.count for row in rows}
+
+
+def test_deltas_insert_then_add_to_a_status_count(project):
+    with SessionLocal() as db:
+        apply_status_deltas(db, Counter({(project["id"], "todo"): 2}))
+        assert stored_counts(db, project["id"]) == {"todo": 2}
+
+        apply_status_deltas(
+            db, Counter({(project["id"], "todo"): -1, (project["id"], "done"): 1})
+        )
+        assert stored_counts(db, project["id"]) == {"todo": 1, "done": 1}
+        db.rollback()